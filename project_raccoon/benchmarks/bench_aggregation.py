@@ -0,0 +1,70 @@
+import argparse
+import time
+import numpy as np
+from server.aggregation import AGGREGATORS
+from server.groups import TrainingGroup
+from server.state import InMemoryState
+from utils.parameters import ParameterVector
+
+MAX_STACK_BYTES = 1 << 30
+
+
+def sort_median(stack):
+    """Full-sort baseline for the median strategy."""
+    n = len(stack)
+    ordered = np.sort(stack, axis=0)
+    return (ordered[(n - 1) // 2].astype(np.float64) + ordered[n // 2]) / 2
+
+
+def sort_trimmed_mean(stack, beta=0.1):
+    """Full-sort baseline for the trimmed_mean strategy."""
+    n = len(stack)
+    k = int(beta * n)
+    return np.sort(stack, axis=0)[k:n - k].mean(axis=0, dtype=np.float64)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1e3, result
+
+
+def aggregate_ms(strategy, stack, sizes, repeats):
+    """Mean time of TrainingGroup.aggregate() over a round of `stack` deltas."""
+    shapes = [(stack.shape[1],)]
+    group = TrainingGroup('bench', InMemoryState('bench'))
+    group.initialize_global_weights(ParameterVector.zeros(shapes))
+    group.set_aggregation(strategy)
+    total = 0.0
+    for _ in range(repeats):
+        for row, n in zip(stack, sizes):
+            group.add_delta(ParameterVector(row, shapes), num_samples=n)
+        elapsed, _ = timed(group.aggregate)
+        total += elapsed
+    return total / repeats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregation latency by strategy, client count and model size.")
+    parser.add_argument('--clients', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--params', type=int, nargs='+', default=[3234, 100_000, 1_000_000])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    strategies = list(AGGREGATORS)
+    print("aggregate() latency in ms (deltas already received); robust strategies vs full-sort baselines")
+    print(f"{'params':>9}{'clients':>9}" + ''.join(f"{s:>14}" for s in strategies)
+          + f"{'np.median':>11}{'sort median':>13}{'sort trim':>11}")
+    rng = np.random.default_rng(0)
+    for params in args.params:
+        for clients in args.clients:
+            if clients * params * 4 > MAX_STACK_BYTES:
+                print(f"{params:>9}{clients:>9}  skipped: stack over {MAX_STACK_BYTES >> 20} MiB")
+                continue
+            stack = rng.normal(0, 0.01, (clients, params)).astype(np.float32)
+            sizes = rng.integers(10, 10_000, clients)
+            row = [aggregate_ms(s, stack, sizes, args.repeats) for s in strategies]
+            baselines = [timed(lambda: np.median(stack, axis=0))[0], timed(lambda: sort_median(stack))[0],
+                         timed(lambda: sort_trimmed_mean(stack))[0]]
+            print(f"{params:>9}{clients:>9}" + ''.join(f"{t:>14.2f}" for t in row)
+                  + f"{baselines[0]:>11.2f}{baselines[1]:>13.2f}{baselines[2]:>11.2f}", flush=True)
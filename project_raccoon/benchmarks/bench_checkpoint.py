@@ -0,0 +1,74 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from models.initializers import layer_shapes
+from server.checkpoint import Checkpointer, load_snapshot, version_dir, WEIGHTS_FILE
+from server.groups import GroupRegistry, TrainingGroup, initial_weights
+from server.state import InMemoryState
+from utils.parameters import ParameterVector
+
+
+def make_group(input_dim, checkpointer=None):
+    group = TrainingGroup('bench', InMemoryState('bench'))
+    group.initialize_global_weights(initial_weights('bench', input_dim, 2))
+    if checkpointer is not None:
+        checkpointer.watch(group)
+    return group
+
+
+def aggregate_ms(group, rounds, clients, sync_checkpointer=None):
+    """Mean latency of aggregate() over `rounds` rounds of `clients` dense deltas."""
+    delta = ParameterVector(np.full(group.get_global_weights().size, 1e-4, dtype=np.float32),
+                            group.get_global_weights().shapes)
+    total = 0.0
+    for _ in range(rounds):
+        for _ in range(clients):
+            group.add_delta(delta, num_samples=10)
+        start = time.perf_counter()
+        group.aggregate()
+        if sync_checkpointer is not None:
+            sync_checkpointer.checkpoint_now(group)
+        total += time.perf_counter() - start
+    return total / rounds * 1e3
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cost of checkpointing on /aggregate, and restore time.")
+    parser.add_argument('--input-dims', type=int, nargs='+', default=[16, 16_000, 160_000])
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--clients', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"aggregate() latency in ms over {args.rounds} rounds of {args.clients} deltas, then restore time")
+    print(f"{'params':>10}{'off':>8}{'background':>12}{'inline':>9}{'write ms':>10}"
+          f"{'mmap restore':>14}{'read restore':>14}{'glorot init':>13}")
+    for input_dim in args.input_dims:
+        with tempfile.TemporaryDirectory() as directory:
+            off = aggregate_ms(make_group(input_dim), args.rounds, args.clients)
+            background = Checkpointer(directory, keep=3, interval=3600)
+            group = make_group(input_dim, background)
+            bg = aggregate_ms(group, args.rounds, args.clients)
+            background.flush()
+            inline = Checkpointer(os.path.join(directory, 'inline'), keep=3, interval=3600)
+            sync = aggregate_ms(make_group(input_dim), args.rounds, args.clients, inline)
+            write_ms = inline.stats['seconds'] / inline.stats['snapshots'] * 1e3
+
+            # Restore into a fresh registry, as a restarted server would on the first request.
+            registry = GroupRegistry({'bench': (input_dim, 2)}, Checkpointer(directory, keep=3, interval=3600))
+            start = time.perf_counter()
+            restored = registry['bench']
+            mmap_ms = (time.perf_counter() - start) * 1e3
+            assert restored.get_version() == group.get_version()
+            assert np.array_equal(restored.get_global_weights().data, group.get_global_weights().data)
+            version = load_snapshot(directory, 'bench')[0]
+            start = time.perf_counter()
+            np.fromfile(os.path.join(version_dir(directory, 'bench', version), WEIGHTS_FILE), dtype='<f4')
+            read_ms = (time.perf_counter() - start) * 1e3
+            start = time.perf_counter()
+            initial_weights('bench', input_dim, 2)
+            init_ms = (time.perf_counter() - start) * 1e3
+            params = sum(int(np.prod(s)) for s in layer_shapes(input_dim, 2))
+            print(f"{params:>10}{off:>8.2f}{bg:>12.2f}{sync:>9.2f}{write_ms:>10.2f}"
+                  f"{mmap_ms:>14.2f}{read_ms:>14.2f}{init_ms:>13.2f}", flush=True)
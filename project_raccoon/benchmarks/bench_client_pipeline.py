@@ -0,0 +1,56 @@
+import argparse
+import time
+from clients.model_pool import model_pool
+from server.groups import training_groups
+from server.simulate import Client
+
+EPOCHS = 5
+
+
+def legacy_round(sim):
+    """One round as clients ran before the tf.data pipeline: numpy input, three validation passes each."""
+    for client_id in sim.client_ids:
+        X_train, y_train = sim.client_data[client_id]
+        global_weights = sim.transport.get_weights()
+        with model_pool.lease(sim.input_dim, sim.output_dim, global_weights) as model:
+            model.evaluate(sim.X_val, sim.y_val, verbose=0)
+            model.fit(X_train, y_train, validation_data=(sim.X_val, sim.y_val), epochs=EPOCHS, batch_size=32,
+                      verbose=0)
+            model.evaluate(sim.X_val, sim.y_val, verbose=0)
+            delta = model.get_parameters()
+            delta.data -= global_weights.data
+        sim.transport.submit_update(delta, num_samples=len(y_train))
+    sim.transport.aggregate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-client time of the Keras engine: numpy input vs tf.data.")
+    parser.add_argument('--group', default='lsd')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    sim = Client(args.group, args.clients, transport='inprocess')
+    print(f"{args.clients} clients, {len(sim.y_val)} validation rows, {EPOCHS} epochs; mean of {args.rounds} rounds")
+    # (name, validation passes per client, eval_every); None runs the legacy loop.
+    modes = [
+        ('numpy, validate each epoch', f"{EPOCHS + 2}", None),
+        ('tf.data, eval_every=1', f"{EPOCHS}+1/N", 1),
+        ('tf.data, last epoch only', "1+1/N", 'last'),
+        ('tf.data, eval_every=0', "1+1/N", 0),
+    ]
+    # The tf.data modes share one global evaluation between the N clients of a round.
+    print(f"{'mode':<28}{'val passes':>11}{'per client ms':>15}")
+    for name, passes, eval_every in modes:
+        if eval_every is None:
+            run_round = lambda: legacy_round(sim)
+        else:
+            sim.eval_every = None if eval_every == 'last' else eval_every
+            run_round = sim.simulate
+        run_round()  # warm-up: traces the model's functions for this input and validation setting
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            run_round()
+        per_client = (time.perf_counter() - start) / (args.rounds * len(sim.client_ids)) * 1e3
+        print(f"{name:<28}{passes:>11}{per_client:>15.1f}", flush=True)
+    training_groups[args.group].clear_deltas()
@@ -0,0 +1,82 @@
+import argparse
+import contextlib
+import io
+import time
+import numpy as np
+from server.groups import TrainingGroup
+from server.state import InMemoryState
+from server.transport import InProcessTransport
+from utils.compression import SCHEMES, Compressor
+from utils.serialization import encode_weights, decode_weights
+
+# A wide MLP so payload sizes, not per-request overhead, dominate.
+LARGE_SHAPES = [(512, 1024), (1024,), (1024, 1024), (1024,), (1024, 10), (10,)]
+CONFIGS = [('none', None), ('fp16', None), ('q8', None), ('q4', None), ('topk', 0.01)]
+
+
+def upload_costs(updates):
+    rng = np.random.default_rng(0)
+    delta = [rng.normal(0, 0.01, s).astype(np.float32) for s in LARGE_SHAPES]
+    params = sum(d.size for d in delta)
+    print(f"Upload cost, {params / 1e6:.1f}M parameters, {updates} updates")
+    print(f"{'scheme':<8}{'KiB':>10}{'ratio':>8}{'encode ms':>11}{'server ms':>11}")
+    base = None
+    for scheme, ratio in CONFIGS:
+        compressor = Compressor(scheme, ratio, seed=0)
+        start = time.perf_counter()
+        bodies = [encode_weights(compressor.compress(delta, k), dtype=None) for k in range(updates)]
+        encode_ms = (time.perf_counter() - start) / updates * 1e3
+
+        group = TrainingGroup('bench', InMemoryState('bench', LARGE_SHAPES))
+        group.set_compression(scheme, ratio)
+        start = time.perf_counter()
+        for body in bodies:
+            group.add_delta(decode_weights(body), scheme)
+        server_ms = (time.perf_counter() - start) / updates * 1e3
+        base = base or len(bodies[0])
+        print(f"{scheme:<8}{len(bodies[0]) / 1024:>10.0f}{base / len(bodies[0]):>8.1f}{encode_ms:>11.2f}{server_ms:>11.2f}")
+
+
+def accuracy_impact(group_name, clients, rounds):
+    # Imported here so the upload benchmark runs without TensorFlow start-up.
+    import tensorflow as tf
+    from models.base_model import BaseClassifier
+    from server.groups import group_dims
+    from server.simulate import Client
+
+    input_dim, output_dim = group_dims[group_name]
+    model = BaseClassifier(input_dim=input_dim, output_dim=output_dim)
+    model.build(input_shape=(None, input_dim))
+    model.compile(loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True), metrics=['accuracy'])
+    initial = model.get_weights()
+
+    print(f"\nAccuracy impact, {group_name}, {clients} clients, {rounds} rounds (test set)")
+    print(f"{'scheme':<8}{'accuracy':>10}{'loss':>10}{'ratio':>8}")
+    for scheme, ratio in CONFIGS:
+        group = TrainingGroup(group_name, InMemoryState(group_name))
+        group.initialize_global_weights(initial)
+        group.set_compression(scheme, ratio)
+        np.random.seed(0)
+        tf.random.set_seed(0)
+        sim = Client(group_name, clients, engine='batched', transport='inprocess')
+        sim.transport = InProcessTransport(group_name, group)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(rounds):
+                sim.simulate()
+        model.set_weights(group.get_global_weights())
+        loss, acc = model.evaluate(sim.X_test, sim.y_test, verbose=0)
+        stats = group.get_compression()['stats']
+        print(f"{scheme:<8}{acc:>10.4f}{loss:>10.4f}{stats['compression_ratio']:>8.1f}", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delta compression: bytes, decode time and accuracy.")
+    parser.add_argument('--updates', type=int, default=20)
+    parser.add_argument('--group', default='lsd')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+    assert {s for s, _ in CONFIGS} == set(SCHEMES)
+    upload_costs(args.updates)
+    if args.rounds:
+        accuracy_impact(args.group, args.clients, args.rounds)
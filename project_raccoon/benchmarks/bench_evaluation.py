@@ -0,0 +1,79 @@
+import argparse
+import time
+import numpy as np
+from server.evaluation import Evaluator, evaluate, load_eval_sets
+from server.groups import TrainingGroup, initial_weights
+from server.state import InMemoryState
+from utils.parameters import ParameterVector
+
+
+def timed(fn, repeats=3):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats * 1e3, result
+
+
+def aggregate_ms(group, rounds=20):
+    delta = ParameterVector.zeros(group.get_global_weights().shapes)
+    total = 0.0
+    for _ in range(rounds):
+        group.add_delta(delta)
+        start = time.perf_counter()
+        group.aggregate()
+        total += time.perf_counter() - start
+    return total / rounds * 1e3
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Global-model evaluation: Keras per client vs once on the server.")
+    parser.add_argument('--group', default='lsd')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    from models.base_model import BaseClassifier
+
+    (X_val, y_val), (X_test, y_test) = load_eval_sets(args.group)
+    input_dim, output_dim = X_val.shape[1], int(y_val.max()) + 1
+    weights = initial_weights(args.group, input_dim, output_dim)
+    model = BaseClassifier(input_dim, output_dim)
+    model.build(input_shape=(None, input_dim))
+    model.set_weights(list(weights))
+    model.compile(loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True),
+                  metrics=[tf.keras.metrics.SparseCategoricalAccuracy()])
+
+    keras_ms, (keras_loss, keras_acc) = timed(lambda: model.evaluate(X_val, y_val, verbose=0))
+    keras_big_ms, _ = timed(lambda: model.evaluate(X_val, y_val, batch_size=8192, verbose=0))
+    numpy_ms, ours = timed(lambda: evaluate(weights, X_val, y_val))
+    assert abs(ours['accuracy'] - keras_acc) < 1e-6 and abs(ours['loss'] - keras_loss) < 1e-4 * max(1, keras_loss)
+    both_ms, _ = timed(lambda: (evaluate(weights, X_val, y_val), evaluate(weights, X_test, y_test)))
+
+    print(f"{args.group}: {len(y_val)} validation and {len(y_test)} test rows; ms per round")
+    print(f"{'Keras evaluate, batch 32, once per client':<48}{keras_ms * args.clients:>10.1f}  ({args.clients} clients)")
+    print(f"{'Keras evaluate, batch 32, once':<48}{keras_ms:>10.1f}")
+    print(f"{'Keras evaluate, batch 8192, once':<48}{keras_big_ms:>10.1f}")
+    print(f"{'numpy forward, batch 8192, once':<48}{numpy_ms:>10.1f}")
+    print(f"{'numpy forward, validation + test':<48}{both_ms:>10.1f}")
+    print(f"numpy matches Keras: loss {ours['loss']:.6f} vs {keras_loss:.6f}, accuracy {ours['accuracy']:.6f}")
+
+    rng = np.random.default_rng(0)
+    print(f"\n{'rows':>10}{'Keras b=8192 ms':>17}{'numpy ms':>10}")
+    for rows in args.rows:
+        X = rng.normal(size=(rows, input_dim)).astype(np.float32)
+        y = rng.integers(0, output_dim, rows)
+        k_ms, _ = timed(lambda: model.evaluate(X, y, batch_size=8192, verbose=0), repeats=2)
+        n_ms, _ = timed(lambda: evaluate(weights, X, y), repeats=2)
+        print(f"{rows:>10}{k_ms:>17.1f}{n_ms:>10.1f}", flush=True)
+
+    off = TrainingGroup(args.group, InMemoryState(args.group))
+    off.initialize_global_weights(weights)
+    on = TrainingGroup(args.group, InMemoryState(args.group))
+    on.initialize_global_weights(weights)
+    on.evaluator = Evaluator()
+    off_ms, on_ms = aggregate_ms(off), aggregate_ms(on)
+    on.evaluator.flush()
+    print(f"\naggregate() latency: {off_ms:.3f} ms without the evaluator, {on_ms:.3f} ms with it "
+          f"({on.evaluator.stats['evaluations']} background evaluations for 20 aggregations)")
@@ -0,0 +1,67 @@
+import argparse
+import time
+import numpy as np
+from server.app import app, serialize_weights
+from server.groups import TrainingGroup, training_groups
+from server.state import InMemoryState
+from utils.serialization import CONTENT_TYPE, encode_weights
+
+# Wide enough that encoding, not Flask overhead, shows up per request.
+SHAPES = [(512, 1024), (1024,), (1024, 1024), (1024,), (1024, 10), (10,)]
+BINARY = {'Accept': CONTENT_TYPE}
+
+
+def fetch(client, headers=None, **body):
+    res = client.post('/get_weights', json={'group_name': 'bench', **body}, headers={**BINARY, **(headers or {})})
+    assert res.status_code in (200, 304), res.status_code
+    return res
+
+
+def per_request_ms(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e3
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cost of N clients pulling the same weights version.")
+    parser.add_argument('--clients', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    group = TrainingGroup('bench', InMemoryState('bench', SHAPES))
+    group.initialize_global_weights([rng.normal(0, 0.05, s).astype(np.float32) for s in SHAPES])
+    training_groups['bench'] = group
+    client = app.test_client()
+
+    first = fetch(client)
+    etag, version = first.headers['ETag'], int(first.headers['X-Weights-Version'])
+    print(f"{sum(np.prod(s) for s in SHAPES) / 1e6:.1f}M parameters, {args.clients} fetches of one version")
+    print(f"{'mode':<26}{'ms/request':>11}{'KiB':>9}")
+    uncached = per_request_ms(lambda: encode_weights(group.get_global_weights()), args.clients)
+    print(f"{'binary, encode every req':<26}{uncached:>11.2f}{len(first.data) / 1024:>9.0f}")
+    print(f"{'binary, cached payload':<26}{per_request_ms(lambda: fetch(client), args.clients):>11.2f}{len(first.data) / 1024:>9.0f}")
+    json_fetch = lambda: client.post('/get_weights', json={'group_name': 'bench'})
+    json_size = len(json_fetch().data) / 1024
+    json_uncached = per_request_ms(lambda: serialize_weights(group.get_global_weights()), args.clients)
+    print(f"{'JSON, encode every req':<26}{json_uncached:>11.2f}{json_size:>9.0f}")
+    print(f"{'JSON, cached payload':<26}{per_request_ms(json_fetch, args.clients):>11.2f}{json_size:>9.0f}")
+    not_modified = fetch(client, {'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    print(f"{'If-None-Match (304)':<26}{per_request_ms(lambda: fetch(client, {'If-None-Match': etag}), args.clients):>11.2f}"
+          f"{len(not_modified.data) / 1024:>9.0f}")
+
+    group.add_delta([rng.normal(0, 0.001, s).astype(np.float32) for s in SHAPES])
+    group.aggregate()
+    # An uncompressed diff would be as large as the weights and not bit-exact, so the server sends the weights.
+    res = fetch(client, {'If-None-Match': etag}, since_version=version, diff='none')
+    assert 'X-Weights-Diff-From' not in res.headers and len(res.data) == len(first.data)
+    for scheme in ('fp16', 'q8'):
+        res = fetch(client, {'If-None-Match': etag}, since_version=version, diff=scheme)
+        assert res.headers['X-Weights-Diff-From'] == str(version)
+        # Rebuilt weights only approximate the version; the 304 check still recognises their tag.
+        assert res.headers['ETag'].endswith(f'~{scheme}"')
+        assert fetch(client, {'If-None-Match': res.headers['ETag']}).status_code == 304
+        ms = per_request_ms(lambda: fetch(client, {'If-None-Match': etag}, since_version=version, diff=scheme), args.clients)
+        print(f"{'diff ' + scheme:<26}{ms:>11.2f}{len(res.data) / 1024:>9.0f}")
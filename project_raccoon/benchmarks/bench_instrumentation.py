@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from server.app import app
+from server.groups import training_groups
+from utils import instrumentation
+from utils.instrumentation import span
+from utils.parameters import ParameterVector
+from utils.serialization import CONTENT_TYPE, encode_weights
+
+
+def span_ns(calls):
+    start = time.perf_counter_ns()
+    for _ in range(calls):
+        with span('bench'):
+            pass
+    return (time.perf_counter_ns() - start) / calls
+
+
+def loop_ns(calls):
+    start = time.perf_counter_ns()
+    for _ in range(calls):
+        pass
+    return (time.perf_counter_ns() - start) / calls
+
+
+def request_ms(client, group_name, body, rounds):
+    """Mean ms of one upload, plus a weights fetch and an aggregation every 10 uploads."""
+    start = time.perf_counter()
+    for i in range(rounds):
+        client.post(f'/submit_update?group_name={group_name}', data=body, headers={'Content-Type': CONTENT_TYPE})
+        if i % 10 == 9:
+            client.post('/aggregate', json={'group_name': group_name})
+            client.post('/get_weights', json={'group_name': group_name}, headers={'Accept': CONTENT_TYPE})
+    return (time.perf_counter() - start) / rounds * 1e3
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cost of instrumentation off and on, and a profiled round.")
+    parser.add_argument('--group', default='lsd')
+    parser.add_argument('--calls', type=int, default=1_000_000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--trace', default=os.path.join(tempfile.gettempdir(), 'raccoon-trace.json'))
+    args = parser.parse_args()
+
+    base = loop_ns(args.calls)
+    instrumentation.enable(False)
+    off = span_ns(args.calls)
+    instrumentation.enable(True)
+    on = span_ns(args.calls)
+    instrumentation.reset()
+    print(f"span() per call: {off - base:.0f} ns disabled, {on - base:.0f} ns enabled")
+
+    client = app.test_client()
+    group = training_groups[args.group]
+    body = encode_weights(ParameterVector.zeros(group.get_global_weights().shapes))
+    results = {}
+    # Alternate so drift on a shared machine hits both modes alike.
+    for profile in (False, True, False, True):
+        instrumentation.enable(profile)
+        results.setdefault(profile, []).append(request_ms(client, args.group, body, args.requests))
+    off_ms, on_ms = min(results[False]), min(results[True])
+    print(f"/submit_update path: {off_ms:.3f} ms disabled, {on_ms:.3f} ms enabled "
+          f"({(on_ms / off_ms - 1) * 100:+.1f}%)")
+
+    from server.simulate import Client
+    instrumentation.reset()
+    instrumentation.enable(True)
+    sim = Client(args.group, args.clients, transport='inprocess')
+    sim.simulate()
+    if group.evaluator is not None:
+        group.evaluator.flush()
+    stats = instrumentation.stats(args.group)
+    instrumentation.write_trace(args.trace)
+
+    spans = stats['spans'][args.group]
+    round_ms = spans['simulate.round']['total_ms']
+    print(f"\n{args.group}: one round of {args.clients} clients, {round_ms:.0f} ms")
+    print(f"{'stage':<28}{'count':>6}{'total ms':>11}{'mean ms':>10}{'p90 ms':>9}{'% round':>9}")
+    for name, s in spans.items():
+        print(f"{name:<28}{s['count']:>6}{s['total_ms']:>11.1f}{s['mean_ms']:>10.2f}{s['p90_ms']:>9.2f}"
+              f"{s['total_ms'] / round_ms * 100:>9.1f}")
+    print(f"trace: {args.trace} ({len(json.load(open(args.trace))['traceEvents'])} events)")
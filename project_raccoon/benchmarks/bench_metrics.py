@@ -0,0 +1,66 @@
+import argparse
+import sys
+import time
+from datetime import datetime
+from server.app import app
+from server.groups import TrainingGroup, training_groups
+from server.metrics import MetricsStore
+from server.state import InMemoryState
+
+
+def record(i):
+    return {'client_id': i % 100 + 1, 'timestamp': datetime.now().isoformat(), 'accuracy': 0.5 + i * 1e-6,
+            'loss': 0.7 - i * 1e-6, 'global_accuracy': 0.5, 'global_loss': 0.7}
+
+
+def deep_size(records):
+    return sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r.values()) for r in records)
+
+
+def store_size(store):
+    return sum(values.nbytes + present.nbytes + (sum(sys.getsizeof(v) for v in values) if kind == 'O' else 0)
+               for kind, values, present in store._columns.values())
+
+
+def timed_get(client, url, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        res = client.get(url)
+    return (time.perf_counter() - start) / repeats * 1e3, len(res.data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/metrics cost after a long run: full history vs cursors.")
+    parser.add_argument('--records', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--retention', type=int, default=10_000)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    print(f"retention {args.retention}; ms and bytes per GET /metrics, and memory held")
+    print(f"{'logged':>8}  {'request':<34}{'ms':>9}{'bytes':>12}")
+    for n in args.records:
+        # An unbounded group, as every group was before the ring buffer.
+        unbounded = TrainingGroup('bench_all', InMemoryState('bench_all'))
+        unbounded.metrics = MetricsStore(n)
+        group = TrainingGroup('bench', InMemoryState('bench'))
+        group.metrics = MetricsStore(args.retention)
+        records = [record(i) for i in range(n)]
+        for r in records:
+            unbounded.add_metric(r)
+            group.add_metric(r)
+        training_groups['bench_all'] = unbounded
+        training_groups['bench'] = group
+        cursor = group.metrics.next_seq - 33
+        for label, url in (
+            ('full history, unbounded', '/metrics?group_name=bench_all'),
+            ('all retained', '/metrics?group_name=bench'),
+            ('newest 500 (dashboard load)', '/metrics?group_name=bench&limit=500'),
+            ('since cursor, 32 new', f'/metrics?group_name=bench&since={cursor}'),
+            ('max_points=200', '/metrics?group_name=bench&max_points=200'),
+            ('max_points=200, columns', '/metrics?group_name=bench&max_points=200&format=columns'),
+        ):
+            ms, size = timed_get(client, url, args.repeats)
+            print(f"{n:>8}  {label:<34}{ms:>9.2f}{size:>12,}", flush=True)
+        print(f"{n:>8}  memory: list of dicts {deep_size(records) / 2**20:.1f} MiB, "
+              f"ring buffer {store_size(group.metrics) / 2**20:.1f} MiB")
@@ -0,0 +1,70 @@
+import argparse
+import multiprocessing
+import os
+import time
+import numpy as np
+
+INPUT_DIM, OUTPUT_DIM = 16, 2
+
+
+def rss_mib():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+
+def run(mode, clients, samples, epochs):
+    """Train `clients` simulated clients in this process; returns per-client times and RSS samples."""
+    import tensorflow as tf
+    from clients.model_pool import model_pool
+    from clients.trainer import ClientTrainer
+    from models.base_model import BaseClassifier
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(samples, INPUT_DIM)).astype(np.float32)
+    y = rng.integers(0, OUTPUT_DIM, samples)
+    weights = model_pool._build(INPUT_DIM, OUTPUT_DIM).get_weights()
+
+    setup, total, rss = [], [], [rss_mib()]
+    for k in range(clients):
+        start = time.perf_counter()
+        if mode == 'fresh':
+            # What train_and_submit did before the pool.
+            model = BaseClassifier(input_dim=INPUT_DIM, output_dim=OUTPUT_DIM)
+            model.build(input_shape=(None, INPUT_DIM))
+            model.set_weights(weights)
+            model.compile(optimizer='adam', loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True),
+                          metrics=[tf.keras.metrics.SparseCategoricalAccuracy()])
+            # The old ClientTrainer also built an unused Adam, loss and two metrics.
+            unused = (tf.keras.optimizers.Adam(0.01), tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True),
+                      tf.keras.metrics.SparseCategoricalAccuracy(), tf.keras.metrics.SparseCategoricalAccuracy())
+        else:
+            model = model_pool.acquire(INPUT_DIM, OUTPUT_DIM, weights)
+        model.evaluate(X, y, verbose=0)
+        setup.append(time.perf_counter() - start)
+        trainer = ClientTrainer(k, model, (X, y), (X, y), epochs=epochs, batch_size=32)
+        trainer.train()
+        trainer.evaluate()
+        trainer.get_weight_deltas(weights)
+        if mode == 'pool':
+            model_pool.release(INPUT_DIM, OUTPUT_DIM, model)
+        total.append(time.perf_counter() - start)
+        rss.append(rss_mib())
+    return setup, total, rss
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-client setup time and memory: fresh Keras models vs the model pool.")
+    parser.add_argument('--clients', type=int, default=60)
+    parser.add_argument('--samples', type=int, default=256)
+    parser.add_argument('--epochs', type=int, default=1)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    print(f"{args.clients} clients, {args.samples} samples, {args.epochs} epoch(s); each mode in a fresh process")
+    print(f"{'mode':<7}{'setup ms':>10}{'client ms':>11}{'first ms':>10}{'RSS start':>11}{'RSS end':>9}{'growth':>8}")
+    for mode in ('fresh', 'pool'):
+        with ctx.Pool(1) as pool:
+            setup, total, rss = pool.apply(run, (mode, args.clients, args.samples, args.epochs))
+        # Steady state: skip the first client, which pays TensorFlow start-up in both modes.
+        print(f"{mode:<7}{np.mean(setup[1:]) * 1e3:>10.1f}{np.mean(total[1:]) * 1e3:>11.1f}{total[0] * 1e3:>10.0f}"
+              f"{rss[1]:>11.0f}{rss[-1]:>9.0f}{rss[-1] - rss[1]:>8.0f}")
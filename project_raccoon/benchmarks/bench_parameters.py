@@ -0,0 +1,74 @@
+import argparse
+import time
+import numpy as np
+from server.groups import TrainingGroup
+from server.state import InMemoryState
+from utils.parameters import ParameterVector
+from utils.serialization import encode_weights, decode_weights
+
+# Input and output sizes of each group's model, as in server/groups.py.
+GROUP_DIMS = {"income": (14, 2), "credit": (23, 3), "lsd": (16, 2), "smoking": (25, 2)}
+
+
+def model_shapes(input_dim, output_dim, hidden=(64, 32)):
+    """Layer shapes of BaseClassifier (Dense 64 -> Dense 32 -> Dense output)."""
+    dims = [input_dim, *hidden, output_dim]
+    shapes = []
+    for fan_in, fan_out in zip(dims, dims[1:]):
+        shapes += [(fan_in, fan_out), (fan_out,)]
+    return shapes
+
+
+def legacy_round(weights, deltas):
+    """The original list-of-layers add_delta loop and aggregate."""
+    sums = [np.zeros(w.shape, dtype=np.float64) for w in weights]
+    for delta in deltas:
+        for acc, d in zip(sums, delta):
+            np.add(acc, d, out=acc)
+    return [(w + acc / len(deltas)).astype(w.dtype) for w, acc in zip(weights, sums)]
+
+
+def vector_round(group, deltas):
+    for delta in deltas:
+        group.add_delta(delta)
+    group.aggregate()
+
+
+def per_call_us(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-layer lists vs ParameterVector for whole-model operations.")
+    parser.add_argument('--updates', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    configs = [(name, model_shapes(*dims)) for name, dims in GROUP_DIMS.items()]
+    configs.append(('wide', model_shapes(256, 10, hidden=(2048, 512, 256))))
+    print(f"{args.updates} deltas + aggregate, then encode/decode, microseconds")
+    print(f"{'model':<10}{'params':>9}{'agg list':>11}{'agg flat':>11}{'speedup':>9}"
+          f"{'codec list':>12}{'codec flat':>12}{'speedup':>9}")
+    for name, shapes in configs:
+        rng = np.random.default_rng(0)
+        weights = [rng.normal(0, 0.1, s).astype(np.float32) for s in shapes]
+        deltas = [[rng.normal(0, 0.01, s).astype(np.float32) for s in shapes] for _ in range(args.updates)]
+        vectors = [ParameterVector.from_layers(d) for d in deltas]
+
+        group = TrainingGroup(name, InMemoryState(name))
+        group.initialize_global_weights(weights)
+        expected = legacy_round(weights, deltas)
+        vector_round(group, vectors)
+        assert all(np.allclose(a, b, atol=1e-6) for a, b in zip(expected, group.get_global_weights()))
+
+        a_old = per_call_us(lambda: legacy_round(weights, deltas), args.repeats)
+        a_new = per_call_us(lambda: vector_round(group, vectors), args.repeats)
+        vector = group.get_global_weights()
+        c_old = per_call_us(lambda: decode_weights(encode_weights(weights)), args.repeats * 10)
+        c_new = per_call_us(lambda: decode_weights(encode_weights(vector)), args.repeats * 10)
+        params = sum(int(np.prod(s)) for s in shapes)
+        print(f"{name:<10}{params:>9}{a_old:>11.0f}{a_new:>11.0f}{a_old / a_new:>8.1f}x"
+              f"{c_old:>12.1f}{c_new:>12.1f}{c_old / c_new:>8.1f}x")
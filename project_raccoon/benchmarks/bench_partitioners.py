@@ -0,0 +1,40 @@
+import argparse
+import time
+import numpy as np
+from utils.partitioners import partition
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time every partitioner on synthetic labels.")
+    parser.add_argument('--samples', type=int, default=1_000_000)
+    parser.add_argument('--clients', type=int, default=10_000)
+    parser.add_argument('--classes', type=int, default=10)
+    parser.add_argument('--groups', type=int, default=40)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, args.classes, args.samples)
+    regions = rng.zipf(1.5, args.samples) % args.groups
+    cases = {
+        'iid': {},
+        'dirichlet': {'alpha': 0.1},
+        'quantity': {'alpha': 0.5},
+        'feature': {'groups': regions},
+    }
+
+    print(f"{args.samples} samples, {args.clients} clients")
+    print(f"{'partitioner':<12}{'ms':>9}{'empty':>8}{'max shard':>11}{'classes/client':>16}")
+    for name, kwargs in cases.items():
+        elapsed, shards = timed(lambda: partition(name, y, args.clients, **kwargs))
+        sizes = np.array([len(s) for s in shards])
+        assert sizes.sum() == args.samples
+        assert np.array_equal(np.sort(np.concatenate(shards)), np.arange(args.samples))
+        classes = np.mean([len(np.unique(y[s])) for s in shards[:200] if len(s)])
+        print(f"{name:<12}{elapsed * 1000:>9.1f}{(sizes == 0).sum():>8}{sizes.max():>11}{classes:>16.1f}")
+        assert elapsed < 1.0, f"{name} took {elapsed:.2f}s for {args.clients} clients"
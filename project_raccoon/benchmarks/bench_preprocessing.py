@@ -0,0 +1,156 @@
+import os
+import re
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+from utils.preprocessing import preprocess_dataset
+
+warnings.filterwarnings("ignore")
+ROWS = 100_000
+
+
+# Reference row-wise implementations the vectorized pipeline must reproduce.
+def legacy_income(df):
+    df = df.copy()
+    categorical_cols = df.select_dtypes(include='object').columns
+    for col in categorical_cols:
+        df[col].fillna(df[col].mode()[0], inplace=True)
+    for col in categorical_cols:
+        df[col] = LabelEncoder().fit_transform(df[col])
+    return df.drop(columns=['income_>50K']), df['income_>50K']
+
+
+def legacy_score(df):
+    df = df.copy()
+    df.drop(['ID', 'Customer_ID', 'SSN', 'Name'], axis=1, inplace=True)
+    for col in ['Age', 'Num_of_Loan', 'Num_of_Delayed_Payment']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+        df[col] = df[col].mask(df[col] < 0, np.nan)
+    for col in ['Annual_Income', 'Outstanding_Debt', 'Changed_Credit_Limit',
+                'Amount_invested_monthly', 'Monthly_Balance']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    def convert_history_age(s):
+        if pd.isna(s):
+            return np.nan
+        match = re.match(r'(\d+)\s+Years?\s+and\s+(\d+)\s+Months?', s)
+        if match:
+            return int(match.group(1)) * 12 + int(match.group(2))
+        return np.nan
+    df['Credit_History_Age'] = df['Credit_History_Age'].apply(convert_history_age)
+    for col in df.select_dtypes(include=[np.number]).columns:
+        df[col].fillna(df[col].mean(), inplace=True)
+    for col in df.select_dtypes(include='object').columns:
+        df[col] = df[col].fillna('Unknown')
+        df[col] = LabelEncoder().fit_transform(df[col])
+    return df.drop(columns=['Credit_Score']), df['Credit_Score']
+
+
+def legacy_lumpy(df):
+    df = df.drop(columns=['reportingDate'])
+    df = df.drop(columns=['x', 'y'])
+    for col in ['region', 'country', 'dominant_land_cover']:
+        if df[col].isnull().any():
+            df[col].fillna(df[col].mode()[0], inplace=True)
+    for col in df.select_dtypes(include=['float64', 'int64']).columns.tolist():
+        if df[col].isnull().any():
+            df[col].fillna(df[col].median(), inplace=True)
+    df['region'] = LabelEncoder().fit_transform(df['region'])
+    df['country'] = LabelEncoder().fit_transform(df['country'])
+    return df.drop(columns=['lumpy']), df['lumpy']
+
+
+def legacy_smoking(df):
+    df = df.drop(columns=['ID'])
+    for col in ['gender', 'oral', 'tartar']:
+        if df[col].isnull().any():
+            df[col].fillna(df[col].mode()[0], inplace=True)
+    for col in df.select_dtypes(include=['float64', 'int64']).columns.tolist():
+        if df[col].isnull().any():
+            df[col].fillna(df[col].median(), inplace=True)
+    df['gender'] = df['gender'].map({'F': 0, 'M': 1})
+    df['oral'] = df['oral'].map({'Y': 1, 'N': 0})
+    df['tartar'] = df['tartar'].map({'Y': 1, 'N': 0})
+    if df['smoking'].dtype == 'object':
+        df['smoking'] = LabelEncoder().fit_transform(df['smoking'])
+    return df.drop(columns=['smoking']), df['smoking']
+
+
+def with_gaps(rng, values, frac=0.05):
+    s = pd.Series(values, dtype=object if not np.issubdtype(np.asarray(values).dtype, np.number) else None)
+    return s.mask(rng.random(len(s)) < frac)
+
+
+def synthetic(name, rng):
+    """Data shaped like the real CSVs (dirty values included) for datasets not on disk."""
+    n = ROWS
+    if name == 'income':
+        cats = {c: rng.choice([f'{c}_{i}' for i in range(8)], n) for c in
+                ['workclass', 'education', 'marital-status', 'occupation', 'relationship', 'race', 'gender', 'native-country']}
+        df = pd.DataFrame({'age': rng.integers(17, 90, n), 'fnlwgt': rng.integers(1e4, 1e6, n),
+                           'educational-num': rng.integers(1, 16, n), 'capital-gain': rng.integers(0, 1e4, n),
+                           'capital-loss': rng.integers(0, 4e3, n), 'hours-per-week': rng.integers(1, 99, n)})
+        for c, v in cats.items():
+            df[c] = with_gaps(rng, v)
+        df['income_>50K'] = rng.integers(0, 2, n)
+        return df
+    if name == 'credit':
+        # The real file has eight monthly rows per customer, so most columns repeat per customer.
+        per_customer = lambda v: np.repeat(v[:n // 8], 8)
+        uniform = lambda lo, hi: per_customer(rng.uniform(lo, hi, n))
+        dirty = lambda v: np.where(rng.random(n) < 0.05, np.char.add(v.astype(str), '_'), v.astype(str))
+        hist = np.char.add(np.char.add(rng.integers(0, 33, n).astype(str), ' Years and '),
+                           np.char.add(rng.integers(0, 12, n).astype(str), ' Months'))
+        df = pd.DataFrame({
+            'ID': np.arange(n), 'Customer_ID': rng.integers(0, n // 8, n).astype(str), 'Month': rng.choice(['January', 'February', 'March'], n),
+            'Name': rng.choice(['a', 'b', 'c'], n), 'Age': dirty(rng.integers(-500, 80, n)), 'SSN': rng.integers(0, n, n).astype(str),
+            'Occupation': with_gaps(rng, rng.choice(['Scientist', 'Teacher', '_______'], n)),
+            'Annual_Income': dirty(uniform(7e3, 2e5).round(2)), 'Monthly_Inhand_Salary': with_gaps(rng, uniform(300, 15e3)),
+            'Num_Bank_Accounts': rng.integers(0, 11, n), 'Num_Credit_Card': rng.integers(0, 11, n), 'Interest_Rate': rng.integers(1, 34, n),
+            'Num_of_Loan': dirty(rng.integers(-100, 9, n)), 'Type_of_Loan': with_gaps(rng, rng.choice(['Auto Loan', 'Home Loan'], n)),
+            'Delay_from_due_date': rng.integers(-5, 67, n), 'Num_of_Delayed_Payment': dirty(rng.integers(-3, 28, n)),
+            'Changed_Credit_Limit': np.where(rng.random(n) < 0.02, '_', uniform(-6, 36).round(2).astype(str)),
+            'Num_Credit_Inquiries': with_gaps(rng, rng.integers(0, 17, n).astype(float)), 'Credit_Mix': rng.choice(['Good', 'Standard', '_'], n),
+            'Outstanding_Debt': dirty(uniform(0, 5e3).round(2)), 'Credit_Utilization_Ratio': uniform(20, 50),
+            'Credit_History_Age': with_gaps(rng, hist), 'Payment_of_Min_Amount': rng.choice(['Yes', 'No', 'NM'], n),
+            'Total_EMI_per_month': uniform(0, 400), 'Amount_invested_monthly': dirty(uniform(0, 2e3).round(2)),
+            'Payment_Behaviour': rng.choice(['Low_spent_Small_value_payments', '!@9#%8'], n),
+            'Monthly_Balance': with_gaps(rng, uniform(0, 1.5e3).round(2).astype(str)),
+            'Credit_Score': rng.choice(['Good', 'Poor', 'Standard'], n),
+        })
+        return df
+    if name == 'smoking':
+        cols = ['age', 'height(cm)', 'weight(kg)', 'waist(cm)', 'eyesight(left)', 'eyesight(right)', 'hearing(left)',
+                'hearing(right)', 'systolic', 'relaxation', 'fasting blood sugar', 'Cholesterol', 'triglyceride', 'HDL',
+                'LDL', 'hemoglobin', 'Urine protein', 'serum creatinine', 'AST', 'ALT', 'Gtp', 'dental caries']
+        df = pd.DataFrame({'ID': np.arange(n), 'gender': with_gaps(rng, rng.choice(['F', 'M'], n))})
+        for c in cols:
+            df[c] = with_gaps(rng, rng.normal(100, 20, n), 0.01)
+        df['oral'] = with_gaps(rng, rng.choice(['Y', 'N'], n))
+        df['tartar'] = with_gaps(rng, rng.choice(['Y', 'N'], n))
+        df['smoking'] = rng.integers(0, 2, n)
+        return df
+    raise ValueError(name)
+
+
+def timed(fn, df):
+    start = time.perf_counter()
+    result = fn(df)
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    legacy = {'income': legacy_income, 'credit': legacy_score, 'lsd': legacy_lumpy, 'smoking': legacy_smoking}
+    print(f"{'dataset':<10}{'rows':>9}{'legacy s':>10}{'vector s':>10}{'speedup':>9}")
+    for name, legacy_fn in legacy.items():
+        path = f'data/{name}.csv'
+        df = pd.read_csv(path) if os.path.exists(path) else synthetic(name, rng)
+        t_old, (x_old, y_old) = timed(legacy_fn, df)
+        t_new, (x_new, y_new) = timed(lambda d: preprocess_dataset(d, name), df)
+        pd.testing.assert_frame_equal(x_new, x_old, check_dtype=False)
+        pd.testing.assert_series_equal(y_new, y_old, check_dtype=False)
+        assert np.array_equal(x_new.values.astype(np.float32), x_old.values.astype(np.float32), equal_nan=True)
+        print(f"{name:<10}{len(df):>9}{t_old:>10.3f}{t_new:>10.3f}{t_old / t_new:>8.1f}x")
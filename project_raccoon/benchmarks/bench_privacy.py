@@ -0,0 +1,103 @@
+import time
+import numpy as np
+from utils.parameters import ParameterVector, as_parameter_vector
+from utils.privacy import GaussianMechanism, PrivacyAccountant, add_gaussian_noise_, gaussian_sigma
+
+# Input and output sizes of each group's model, as in server/groups.py.
+GROUP_DIMS = {"income": (14, 2), "credit": (23, 3), "lsd": (16, 2), "smoking": (25, 2)}
+REPEATS = 2000
+BATCH = 64
+
+
+def model_shapes(input_dim, output_dim):
+    """Layer shapes of BaseClassifier (Dense 64 -> Dense 32 -> Dense output)."""
+    dims = [input_dim, 64, 32, output_dim]
+    shapes = []
+    for fan_in, fan_out in zip(dims, dims[1:]):
+        shapes += [(fan_in, fan_out), (fan_out,)]
+    return shapes
+
+
+def legacy_deltas(global_weights, local_weights, noise_std=0.01):
+    """The original ClientTrainer.get_weight_deltas loop."""
+    deltas = []
+    for gw, lw in zip(global_weights, local_weights):
+        delta = lw - gw
+        noise = np.random.normal(0, noise_std, size=delta.shape)
+        delta_noised = delta + noise
+        deltas.append(delta_noised.astype(np.float32))
+    return deltas
+
+
+def flat_deltas(global_weights, local_weights, rng, scratch, noise_std=0.01, mechanism=None):
+    """What ClientTrainer.get_weight_deltas does once the model weights are in hand."""
+    delta = ParameterVector.from_layers(local_weights)
+    np.subtract(delta.data, global_weights.data, out=delta.data)
+    if mechanism is not None:
+        return delta, mechanism.apply_(delta.data, rng, scratch)
+    return delta, add_gaussian_noise_(delta.data, noise_std, rng, scratch)
+
+
+def legacy_batched(stacked, global_weights, noise_std=0.01):
+    """The original BatchedClientTrainer.get_weight_deltas loop."""
+    stacked = [v - gw for v, gw in zip(stacked, global_weights)]
+    deltas = []
+    for k in range(BATCH):
+        deltas.append([(d[k] + np.random.normal(0, noise_std, size=d[k].shape)).astype(np.float32)
+                       for d in stacked])
+    return deltas
+
+
+def flat_batched(stacked, global_weights, rngs, noise_std=0.01):
+    """What BatchedClientTrainer.get_weight_deltas does once the variables are in hand."""
+    flat = np.concatenate([v.reshape(BATCH, -1) for v in stacked], axis=1)
+    flat -= global_weights.data
+    scratch = None
+    for row, rng in zip(flat, rngs):
+        scratch = add_gaussian_noise_(row, noise_std, rng, scratch)
+    return [ParameterVector(row, global_weights.shapes) for row in flat]
+
+
+def per_call_us(fn, repeats=REPEATS):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+if __name__ == "__main__":
+    print("Per-client delta + noise, microseconds (batched: per client in a batch of 64)")
+    print(f"{'group':<10}{'params':>8}{'legacy':>8}{'flat':>7}{'speedup':>9}{'dp':>7}"
+          f"{'batched legacy':>16}{'batched flat':>14}{'speedup':>9}")
+    for group_name, (input_dim, output_dim) in GROUP_DIMS.items():
+        rng = np.random.default_rng(0)
+        shapes = model_shapes(input_dim, output_dim)
+        global_weights = [rng.normal(0, 0.1, s).astype(np.float32) for s in shapes]
+        local_weights = [w + rng.normal(0, 0.01, w.shape).astype(np.float32) for w in global_weights]
+        global_vector = as_parameter_vector(global_weights)
+        scratch = [None]
+
+        def flat_call(mechanism=None):
+            _, scratch[0] = flat_deltas(global_vector, local_weights, rng, scratch[0], mechanism=mechanism)
+
+        mechanism = GaussianMechanism(clip_norm=1.0, epsilon=1.0, delta=1e-5)
+        t_old = per_call_us(lambda: legacy_deltas(global_weights, local_weights))
+        t_new = per_call_us(flat_call)
+        t_dp = per_call_us(lambda: flat_call(mechanism))
+        stacked = [np.broadcast_to(w, (BATCH,) + w.shape).copy() for w in local_weights]
+        client_rngs = rng.spawn(BATCH)
+        b_old = per_call_us(lambda: legacy_batched(stacked, global_weights), 50) / BATCH
+        b_new = per_call_us(lambda: flat_batched(stacked, global_vector, client_rngs), 50) / BATCH
+        params = sum(np.prod(s) for s in shapes)
+        print(f"{group_name:<10}{params:>8}{t_old:>8.1f}{t_new:>7.1f}{t_old / t_new:>8.1f}x{t_dp:>7.1f}"
+              f"{b_old:>16.1f}{b_new:>14.1f}{b_old / b_new:>8.1f}x")
+
+    # Calibration and accounting sanity checks.
+    for eps in (0.5, 1.0, 4.0):
+        classic = np.sqrt(2 * np.log(1.25 / 1e-5)) / eps
+        print(f"epsilon={eps}: analytic sigma {gaussian_sigma(eps, 1e-5):.3f} (classic bound {classic:.3f})")
+    accountant = PrivacyAccountant(delta=1e-5)
+    per_round = GaussianMechanism(clip_norm=1.0, noise_multiplier=1.1)
+    for _ in range(100):
+        accountant.spend('client', per_round.rho)
+    print(f"noise multiplier 1.1 for 100 rounds: epsilon {accountant.epsilon('client'):.2f} at delta 1e-5")
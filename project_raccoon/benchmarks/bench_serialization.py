@@ -0,0 +1,34 @@
+import json
+import time
+import numpy as np
+from server.app import serialize_weights, deserialize_weights
+from server.groups import training_groups
+from utils.serialization import encode_weights, decode_weights
+
+REPEATS = 200
+
+
+def timeit(fn, *args):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        result = fn(*args)
+    return (time.perf_counter() - start) / REPEATS * 1e6, result
+
+
+def json_encode(weights):
+    return json.dumps({'group_name': 'bench', 'weights': serialize_weights(list(weights))}).encode('utf-8')
+
+
+def json_decode(body):
+    return deserialize_weights(json.loads(body)['weights'])
+
+
+if __name__ == "__main__":
+    print(f"{'group':<10}{'format':<8}{'bytes':>10}{'encode us':>12}{'decode us':>12}")
+    for group_name, group in training_groups.items():
+        weights = group.get_global_weights()
+        for fmt, encode, decode in (('json', json_encode, json_decode), ('binary', encode_weights, decode_weights)):
+            enc_us, payload = timeit(encode, weights)
+            dec_us, decoded = timeit(decode, payload)
+            assert all(np.array_equal(a, b) for a, b in zip(weights, decoded))
+            print(f"{group_name:<10}{fmt:<8}{len(payload):>10}{enc_us:>12.1f}{dec_us:>12.1f}")
@@ -0,0 +1,33 @@
+import argparse
+import os
+import threading
+import time
+from werkzeug.serving import make_server
+from server.app import app
+from server.simulate import Client
+
+
+def serve(port):
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rounds per minute of Client.simulate against worker count")
+    parser.add_argument('--group', default='lsd')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument('--engine', choices=['keras', 'batched'], default='keras')
+    parser.add_argument('--transport', choices=['http', 'inprocess'], default='http')
+    args = parser.parse_args()
+
+    server = serve(5000)
+    print(f"{'workers':>8}{'seconds':>10}{'rounds/min':>12}")
+    for workers in sorted(set(args.workers)):
+        sim = Client(args.group, args.clients, workers=workers, engine=args.engine, transport=args.transport)
+        start = time.perf_counter()
+        sim.simulate()
+        elapsed = time.perf_counter() - start
+        print(f"{workers:>8}{elapsed:>10.1f}{60 / elapsed:>12.2f}", flush=True)
+    server.shutdown()
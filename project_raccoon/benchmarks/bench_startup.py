@@ -0,0 +1,44 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Each sample is a fresh interpreter, so nothing is warm except the OS page cache.
+PROBE = r"""
+import json, os, sys, time
+def rss_mib():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+start = time.perf_counter()
+from server.app import app
+imported = time.perf_counter()
+client = app.test_client()
+client.get('/')
+served = time.perf_counter()
+rss_ready = rss_mib()
+client.post('/get_weights', json={'group_name': 'lsd'})
+first_weights = time.perf_counter()
+print(json.dumps({'import_s': imported - start, 'first_request_s': served - start,
+                  'first_weights_s': first_weights - start, 'rss_ready': rss_ready, 'rss_weights': rss_mib(),
+                  'tensorflow': 'tensorflow' in sys.modules}))
+"""
+
+
+def probe():
+    out = subprocess.run([sys.executable, '-c', PROBE], capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start of the Flask app: import time, first responses and RSS.")
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    samples = [probe() for _ in range(args.runs)]
+    median = {key: statistics.median(s[key] for s in samples) for key in samples[0] if key != 'tensorflow'}
+    print(f"median of {args.runs} cold starts")
+    print(f"import server.app       {median['import_s']:>7.2f} s")
+    print(f"first GET /             {median['first_request_s']:>7.2f} s   RSS {median['rss_ready']:>5.0f} MiB")
+    print(f"first POST /get_weights {median['first_weights_s']:>7.2f} s   RSS {median['rss_weights']:>5.0f} MiB")
+    print(f"TensorFlow loaded: {any(s['tensorflow'] for s in samples)}")
@@ -0,0 +1,52 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from utils import dataset_cache
+from utils.partitioning import load_and_partition_dataset
+
+
+def make_csv(path, rows):
+    """lsd.csv repeated until it has `rows` rows."""
+    base = pd.read_csv('data/lsd.csv')
+    reps = -(-rows // len(base))
+    pd.concat([base] * reps, ignore_index=True).iloc[:rows].to_csv(path, index=False)
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peak memory of in-memory vs streaming partitioning.")
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--chunksize', type=int, default=50_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset_cache.CACHE_DIR = os.path.join(tmp, 'cache')
+        csv_path = os.path.join(tmp, 'lsd.csv')
+        make_csv(csv_path, args.rows)
+        print(f"{args.rows} rows, {os.path.getsize(csv_path) / 2**20:.0f} MiB CSV, {args.clients} clients")
+
+        t_mem, peak_mem, (clients, val, test) = measure(lambda: load_and_partition_dataset(
+            csv_path, 'lsd', args.clients, use_cache=False))
+        t_str, peak_str, (s_clients, s_val, s_test) = measure(lambda: load_and_partition_dataset(
+            csv_path, 'lsd', args.clients, streaming=True, chunksize=args.chunksize))
+        for k in clients:
+            assert np.array_equal(clients[k][0], s_clients[k][0]) and np.array_equal(clients[k][1], s_clients[k][1])
+        assert np.array_equal(val[0], s_val[0]) and np.array_equal(test[1], s_test[1])
+
+        print(f"{'mode':<12}{'seconds':>9}{'peak MiB':>10}")
+        print(f"{'in-memory':<12}{t_mem:>9.2f}{peak_mem / 2**20:>10.1f}")
+        print(f"{'streaming':<12}{t_str:>9.2f}{peak_str / 2**20:>10.1f}")
@@ -0,0 +1,42 @@
+import os
+import time
+import numpy as np
+from benchmarks.bench_simulate import serve
+from server.groups import training_groups
+from server.simulate import Client
+from server.transport import HttpTransport, InProcessTransport
+
+CLIENTS = 32
+CALLS = 200
+
+
+def transport_round(transport, delta):
+    """The transport traffic of one simulated client: fetch, log, submit."""
+    transport.get_weights()
+    transport.log_metrics({'client_id': 0, 'accuracy': 0.0, 'loss': 0.0})
+    transport.submit_update(delta)
+
+
+if __name__ == "__main__":
+    server = serve(5000)
+    print(f"{'group':<10}{'transport':<11}{'per client ms':>14}{'round s':>10}")
+    for group_name, group in training_groups.items():
+        if not os.path.exists(f'data/{group_name}.csv'):
+            print(f"{group_name:<10}skipped: data/{group_name}.csv not found")
+            continue
+        delta = [np.zeros_like(w) for w in group.get_global_weights()]
+        Client(group_name, CLIENTS, engine='batched', transport='inprocess').simulate()  # warm-up
+        for transport in (HttpTransport(group_name), InProcessTransport(group_name)):
+            start = time.perf_counter()
+            for _ in range(CALLS):
+                transport_round(transport, delta)
+            per_client = (time.perf_counter() - start) / CALLS * 1e3
+            group.clear_deltas()
+
+            kind = 'http' if isinstance(transport, HttpTransport) else 'inprocess'
+            sim = Client(group_name, CLIENTS, engine='batched', transport=kind)
+            start = time.perf_counter()
+            sim.simulate()
+            round_s = time.perf_counter() - start
+            print(f"{group_name:<10}{kind:<11}{per_client:>14.2f}{round_s:>10.2f}", flush=True)
+    server.shutdown()
@@ -0,0 +1,82 @@
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from server.app import app
+from server.groups import training_groups
+from utils.serialization import CONTENT_TYPE, encode_weights, decode_weights
+
+GROUP = 'lsd'
+SUBMITTERS = 32
+UPDATES_PER_SUBMITTER = 25
+
+
+def submitter(client_id, shapes):
+    client = app.test_client()
+    payload = encode_weights([np.full(shape, client_id + 1, dtype=np.float32) for shape in shapes])
+    for _ in range(UPDATES_PER_SUBMITTER):
+        res = client.post('/submit_update', query_string={'group_name': GROUP},
+                          data=payload, content_type=CONTENT_TYPE)
+        assert res.status_code == 200, res.json
+
+
+def reader(stop):
+    """Every layer moves by the same amount per aggregation, so a torn read shows up as mismatched values.
+
+    Returns the number of reads and of distinct weight values seen.
+    """
+    client = app.test_client()
+    reads, seen = 0, set()
+    while not stop.is_set():
+        res = client.post('/get_weights', json={'group_name': GROUP}, headers={'Accept': CONTENT_TYPE})
+        values = {float(w.flat[0]) for w in decode_weights(res.data)}
+        assert len(values) == 1, f"torn read: {values}"
+        reads += 1
+        seen |= values
+    return reads, len(seen)
+
+
+if __name__ == "__main__":
+    group = training_groups[GROUP]
+    group.clear_deltas()
+    shapes = [w.shape for w in group.get_global_weights()]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=SUBMITTERS) as pool:
+        for f in [pool.submit(submitter, cid, shapes) for cid in range(SUBMITTERS)]:
+            f.result()
+    elapsed = time.perf_counter() - start
+
+    expected_count = SUBMITTERS * UPDATES_PER_SUBMITTER
+    expected_sum = UPDATES_PER_SUBMITTER * SUBMITTERS * (SUBMITTERS + 1) / 2
+    assert group.delta_count == expected_count, (group.delta_count, expected_count)
+    assert all(np.all(avg == expected_sum / expected_count) for avg in group.get_average_delta()), "lost delta"
+    print(f"{expected_count} updates from {SUBMITTERS} threads in {elapsed:.2f}s: no deltas lost")
+
+    # Submissions and reads racing with /aggregate: every aggregation must see a consistent buffer,
+    # and every read one whole published version.
+    group.clear_deltas()
+    group.set_global_weights([np.zeros(shape, dtype=np.float32) for shape in shapes])
+    client = app.test_client()
+    applied = []
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=SUBMITTERS + 4) as pool:
+        readers = [pool.submit(reader, stop) for _ in range(4)]
+        futures = [pool.submit(submitter, 0, shapes) for _ in range(SUBMITTERS)]
+        while not all(f.done() for f in futures):
+            if client.post('/aggregate', json={'group_name': GROUP}).status_code == 200:
+                applied.append(1)
+        for f in futures:
+            f.result()
+        stop.set()
+        results = [r.result() for r in readers]
+    reads = sum(n for n, _ in results)
+    # Otherwise no read overlapped a publish and the torn-read check proved nothing.
+    assert max(versions for _, versions in results) > 1, "readers never saw the weights change"
+    if client.post('/aggregate', json={'group_name': GROUP}).status_code == 200:
+        applied.append(1)
+    # Each aggregation of all-ones deltas adds exactly 1.0, regardless of how many were buffered.
+    assert np.all(group.get_global_weights()[0] == len(applied))
+    assert group.delta_count == 0
+    print(f"{SUBMITTERS * UPDATES_PER_SUBMITTER} updates across {len(applied)} concurrent aggregations, "
+          f"{reads} concurrent reads: consistent, no torn reads")
@@ -0,0 +1,70 @@
+import tempfile
+import time
+import numpy as np
+from multiprocessing import Process, Queue
+from server.groups import TrainingGroup
+from server.state import MmapState
+from utils.parameters import ParameterVector
+
+SHAPES = [(25, 64), (64,), (64, 32), (32,), (32, 2), (2,)]
+WORKERS = 4
+UPDATES_PER_WORKER = 200
+PUBLISHES = 400
+
+
+def open_group(directory):
+    return TrainingGroup('bench', MmapState('bench', SHAPES, directory))
+
+
+def uniform(value):
+    return ParameterVector(np.full(sum(int(np.prod(s)) for s in SHAPES), value, dtype=np.float32), SHAPES)
+
+
+def publisher(directory):
+    """Publishes new weights while the workers read them; every entry of version v is v - 1."""
+    group = open_group(directory)
+    for _ in range(PUBLISHES):
+        group.set_global_weights(uniform(group.get_version()))
+
+
+def worker(directory, worker_id, seen):
+    group = open_group(directory)
+    delta = [np.full(shape, worker_id + 1, dtype=np.float32) for shape in SHAPES]
+    versions = set()
+    for _ in range(UPDATES_PER_WORKER):
+        group.add_delta(delta)
+        version, weights = group.get_versioned_weights()
+        # A torn read mixes two slots, or pairs one version's number with another's weights.
+        assert np.all(weights.data == version - 1), f"torn read across processes at version {version}"
+        versions.add(version)
+    seen.put(len(versions))
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        group = open_group(directory)
+        group.initialize_global_weights(uniform(0))
+
+        seen = Queue()
+        start = time.perf_counter()
+        procs = [Process(target=publisher, args=(directory,))]
+        procs += [Process(target=worker, args=(directory, i, seen)) for i in range(WORKERS)]
+        for p in procs:
+            p.start()
+        versions_seen = [seen.get() for _ in range(WORKERS)]
+        for p in procs:
+            p.join()
+            assert p.exitcode == 0
+        elapsed = time.perf_counter() - start
+        # Otherwise no read overlapped a publish and the check above proved nothing.
+        assert max(versions_seen) > 1, "workers never saw the weights change"
+
+        expected = WORKERS * UPDATES_PER_WORKER
+        assert group.delta_count == expected, (group.delta_count, expected)
+        assert group.get_version() == PUBLISHES + 1
+        group.aggregate()
+        mean = UPDATES_PER_WORKER * WORKERS * (WORKERS + 1) / 2 / expected
+        assert all(np.allclose(w, PUBLISHES + mean) for w in group.get_global_weights())
+        print(f"{expected} updates from {WORKERS} processes and {PUBLISHES} weight versions published "
+              f"in {elapsed:.2f}s; workers read {min(versions_seen)}-{max(versions_seen)} distinct versions "
+              f"each: no torn reads, state consistent")
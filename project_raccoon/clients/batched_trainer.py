@@ -0,0 +1,142 @@
+import tensorflow as tf
+import numpy as np
+from utils.parameters import ParameterVector, as_parameter_vector
+from utils.privacy import add_gaussian_noise_
+
+
+class BatchedClientTrainer:
+    """Train K copies of the BaseClassifier MLP at once.
+
+    Every Dense kernel and bias is stacked along a leading client axis, so one
+    batched matmul runs the forward pass for all clients and one compiled
+    `tf.function` runs a whole epoch. Each client sees only its own shard, in
+    its own shuffled order, with its own Adam state; clients with fewer
+    samples simply sit out the trailing steps of an epoch. Each client also
+    has its own Generator for shuffling and noise: `seed` is one seed per
+    client, or a single seed (or None) from which theirs are spawned.
+    """
+    def __init__(self, global_weights, client_data, val_data, learning_rate=0.01, epochs=5, batch_size=32,
+                 beta_1=0.9, beta_2=0.999, epsilon=1e-7, seed=None):
+        self.num_clients = len(client_data)
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.learning_rate = learning_rate
+        self.beta_1 = beta_1
+        self.beta_2 = beta_2
+        self.epsilon = epsilon
+        if np.ndim(seed) == 1:
+            self.rngs = [np.random.default_rng(s) for s in seed]
+        else:
+            self.rngs = np.random.default_rng(seed).spawn(self.num_clients)
+
+        self.shapes = [w.shape for w in global_weights]
+        self.vars = [tf.Variable(np.broadcast_to(w, (self.num_clients,) + w.shape).astype(np.float32))
+                     for w in global_weights]
+        self.m = [tf.Variable(tf.zeros_like(v)) for v in self.vars]
+        self.v = [tf.Variable(tf.zeros_like(v)) for v in self.vars]
+        self.steps = tf.Variable(tf.zeros((self.num_clients,), dtype=tf.float32))
+
+        self.sizes = np.array([len(y) for _, y in client_data])
+        max_size = int(self.sizes.max())
+        input_dim = client_data[0][0].shape[1]
+        x = np.zeros((self.num_clients, max_size, input_dim), dtype=np.float32)
+        y = np.zeros((self.num_clients, max_size), dtype=np.int32)
+        for k, (xk, yk) in enumerate(client_data):
+            x[k, :len(yk)] = xk
+            y[k, :len(yk)] = yk
+        self.x = tf.constant(x)
+        self.y = tf.constant(y)
+        self.steps_per_epoch = -(-max_size // batch_size)
+
+        x_val, y_val = val_data
+        self.x_val = tf.constant(np.asarray(x_val, dtype=np.float32))
+        self.y_val = tf.constant(np.asarray(y_val, dtype=np.int32))
+
+    def _forward(self, x, weights):
+        """`x` is [K, B, in] (per-client batches) or [B, in] (one batch shared by all clients)."""
+        h = x
+        num_layers = len(weights) // 2
+        for i in range(num_layers):
+            kernel, bias = weights[2 * i], weights[2 * i + 1]
+            if len(h.shape) == 2:
+                h = tf.einsum('bi,kio->kbo', h, kernel)
+            else:
+                h = tf.matmul(h, kernel)
+            h = h + bias[:, None, :]
+            if i < num_layers - 1:
+                h = tf.nn.relu(h)
+        return h
+
+    def _epoch_indices(self):
+        """Per-client shuffled sample order for one epoch, plus a mask of real (non-padding) rows."""
+        total = self.steps_per_epoch * self.batch_size
+        idx = np.zeros((self.num_clients, total), dtype=np.int32)
+        valid = np.zeros((self.num_clients, total), dtype=np.float32)
+        for k, n in enumerate(self.sizes):
+            idx[k, :n] = self.rngs[k].permutation(n)
+            valid[k, :n] = 1.0
+        return tf.constant(idx), tf.constant(valid)
+
+    @tf.function
+    def _train_epoch(self, idx, valid):
+        for s in tf.range(self.steps_per_epoch):
+            batch_idx = idx[:, s * self.batch_size:(s + 1) * self.batch_size]
+            batch_valid = valid[:, s * self.batch_size:(s + 1) * self.batch_size]
+            xb = tf.gather(self.x, batch_idx, batch_dims=1)
+            yb = tf.gather(self.y, batch_idx, batch_dims=1)
+            counts = tf.reduce_sum(batch_valid, axis=1)
+            active = tf.cast(counts > 0, tf.float32)
+
+            with tf.GradientTape() as tape:
+                logits = self._forward(xb, self.vars)
+                ce = tf.nn.sparse_softmax_cross_entropy_with_logits(labels=yb, logits=logits)
+                per_client = tf.reduce_sum(ce * batch_valid, axis=1) / tf.maximum(counts, 1.0)
+                loss = tf.reduce_sum(per_client)
+            grads = tape.gradient(loss, self.vars)
+
+            t = self.steps + active
+            self.steps.assign(t)
+            t = tf.maximum(t, 1.0)
+            lr_t = self.learning_rate * tf.sqrt(1.0 - self.beta_2 ** t) / (1.0 - self.beta_1 ** t)
+            for var, m, v, g in zip(self.vars, self.m, self.v, grads):
+                mask = tf.reshape(active, [-1] + [1] * (len(var.shape) - 1))
+                lr = tf.reshape(lr_t, mask.shape)
+                m_new = self.beta_1 * m + (1.0 - self.beta_1) * g
+                v_new = self.beta_2 * v + (1.0 - self.beta_2) * tf.square(g)
+                m.assign(mask * m_new + (1.0 - mask) * m)
+                v.assign(mask * v_new + (1.0 - mask) * v)
+                var.assign_sub(mask * lr * m_new / (tf.sqrt(v_new) + self.epsilon))
+
+    def train(self):
+        for _ in range(self.epochs):
+            self._train_epoch(*self._epoch_indices())
+
+    @tf.function
+    def _evaluate(self, weights):
+        logits = self._forward(self.x_val, weights)
+        labels = tf.broadcast_to(self.y_val, tf.shape(logits)[:2])
+        loss = tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(labels=labels, logits=logits), axis=1)
+        correct = tf.cast(tf.equal(tf.argmax(logits, axis=-1, output_type=tf.int32), labels), tf.float32)
+        return loss, tf.reduce_mean(correct, axis=1)
+
+    def evaluate(self):
+        """Validation loss and accuracy for every client, as a list of dicts."""
+        loss, acc = self._evaluate(self.vars)
+        return [{'loss': float(l), 'accuracy': float(a)} for l, a in zip(loss.numpy(), acc.numpy())]
+
+    def get_weight_deltas(self, global_weights, noise_std=0.01, mechanism=None):
+        """One float32 ParameterVector delta per client, each a row of a single [K, P] matrix.
+
+        Noise is N(0, noise_std^2), or each client's row is clipped and noised by
+        `mechanism` (a utils.privacy.GaussianMechanism) when given.
+        """
+        global_vector = as_parameter_vector(global_weights)
+        flat = np.concatenate([v.numpy().reshape(self.num_clients, -1) for v in self.vars], axis=1)
+        flat -= global_vector.data
+        scratch = None
+        for row, rng in zip(flat, self.rngs):
+            if mechanism is not None:
+                scratch = mechanism.apply_(row, rng, scratch)
+            else:
+                scratch = add_gaussian_noise_(row, noise_std, rng, scratch)
+        return [ParameterVector(row, global_vector.shapes) for row in flat]
@@ -0,0 +1,22 @@
+import numpy as np
+import tensorflow as tf
+
+# Batch size for evaluation-only pipelines: no gradients, so larger batches just cut per-step overhead.
+EVAL_BATCH_SIZE = 1024
+
+
+def make_dataset(X, y, batch_size: int = EVAL_BATCH_SIZE, shuffle: bool = False, seed=None) -> tf.data.Dataset:
+    """A prefetched float32 tf.data pipeline over one in-memory shard.
+
+    The arrays are converted to tensors once, so every epoch reads the same
+    tensors instead of `fit` re-converting numpy input per call. Training
+    pipelines (`shuffle=True`) reshuffle each epoch, as `fit` does for arrays;
+    fixed-order ones cache their batches.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    ds = tf.data.Dataset.from_tensor_slices((X, np.asarray(y)))
+    if shuffle:
+        ds = ds.shuffle(len(X), seed=seed, reshuffle_each_iteration=True).batch(batch_size)
+    else:
+        ds = ds.batch(batch_size).cache()
+    return ds.prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,81 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+import tensorflow as tf
+from models.base_model import BaseClassifier
+from utils.instrumentation import span
+
+
+class ModelPool:
+    """Built and compiled BaseClassifiers, reused across simulated clients in one process.
+
+    Building, compiling and tracing a Keras model costs more than training a
+    small shard, so models are leased by `(input_dim, output_dim)` and handed
+    back afterwards. A lease swaps in the given weights and zeroes the
+    optimizer's step count and moments, so every client starts exactly as a
+    freshly built model would, and the traced train/evaluate functions are
+    kept. At most `max_idle` models per key are kept between leases.
+    """
+    def __init__(self, max_idle: int = 4, learning_rate: float = 0.001):
+        self.max_idle = max_idle
+        self.learning_rate = learning_rate
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+        self.built = 0
+        self.reused = 0
+
+    def _build(self, input_dim: int, output_dim: int) -> BaseClassifier:
+        model = BaseClassifier(input_dim=input_dim, output_dim=output_dim)
+        model.build(input_shape=(None, input_dim))
+        model.compile(optimizer=tf.keras.optimizers.Adam(self.learning_rate),
+                      loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True),
+                      metrics=[tf.keras.metrics.SparseCategoricalAccuracy()])
+        return model
+
+    def _reset_optimizer(self, model: BaseClassifier):
+        learning_rate = model.optimizer.learning_rate
+        for var in model.optimizer.variables:
+            if var is not learning_rate:
+                var.assign(tf.zeros_like(var))
+        # A trainer may have changed the rate during the last lease.
+        learning_rate.assign(self.learning_rate)
+
+    def acquire(self, input_dim: int, output_dim: int, weights) -> BaseClassifier:
+        """A compiled model holding `weights`, with fresh optimizer state; give it back with release()."""
+        key = (input_dim, output_dim)
+        with self._lock:
+            model = self._idle[key].pop() if self._idle[key] else None
+            if model is None:
+                self.built += 1
+            else:
+                self.reused += 1
+        with span('model_pool.build' if model is None else 'model_pool.reset'):
+            if model is None:
+                model = self._build(input_dim, output_dim)
+            else:
+                self._reset_optimizer(model)
+            model.set_weights(weights)
+        return model
+
+    def release(self, input_dim: int, output_dim: int, model: BaseClassifier):
+        with self._lock:
+            idle = self._idle[(input_dim, output_dim)]
+            if len(idle) < self.max_idle:
+                idle.append(model)
+
+    @contextmanager
+    def lease(self, input_dim: int, output_dim: int, weights):
+        model = self.acquire(input_dim, output_dim, weights)
+        try:
+            yield model
+        finally:
+            self.release(input_dim, output_dim, model)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'built': self.built, 'reused': self.reused,
+                    'idle': sum(len(models) for models in self._idle.values())}
+
+
+# One pool per process; process-pool workers each build their own.
+model_pool = ModelPool()
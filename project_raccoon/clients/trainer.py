@@ -1,43 +1,73 @@
-import tensorflow as tf
 import numpy as np
+from clients.datasets import make_dataset
+from utils.instrumentation import span
+from utils.parameters import as_parameter_vector
+from utils.privacy import add_gaussian_noise_
 
 class ClientTrainer:
-    def __init__(self, client_id, model, train_data, val_data, learning_rate=0.01, epochs=5, batch_size=32):
+    """Local training on a compiled model, with its own optimizer (e.g. one leased from clients.model_pool).
+
+    `learning_rate`, when given, overrides the rate the model was compiled with.
+    Training reads a shuffled tf.data pipeline over the shard; pass
+    `val_dataset` (see clients.datasets.make_dataset) to share one validation
+    pipeline between clients. `fit` validates every `eval_every` epochs, by
+    default only after the last one, and 0 turns validation off during
+    training. When the last epoch was validated, evaluate() reuses its result.
+    """
+    def __init__(self, client_id, model, train_data, val_data, learning_rate=None, epochs=5, batch_size=32,
+                 seed=None, val_dataset=None, eval_every=None):
         self.client_id = client_id
+        self.rng = np.random.default_rng(seed)
+        self._scratch = None
         self.model = model
         self.train_data = train_data
         self.val_data = val_data
         self.epochs = epochs
         self.batch_size = batch_size
-        self.optimizer = tf.keras.optimizers.Adam(learning_rate)
-        self.loss_fn = tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True)
-        self.train_acc = tf.keras.metrics.SparseCategoricalAccuracy()
-        self.val_acc = tf.keras.metrics.SparseCategoricalAccuracy()
+        self.eval_every = epochs if eval_every is None else eval_every
+        with span('trainer.datasets'):
+            self.train_dataset = make_dataset(*train_data, batch_size=batch_size, shuffle=True, seed=seed)
+            self.val_dataset = val_dataset if val_dataset is not None else make_dataset(*val_data)
+        self._final_metrics = None
+        if learning_rate is not None:
+            model.optimizer.learning_rate.assign(learning_rate)
 
     def train(self):
-        x_train, y_train = self.train_data
-        x_val, y_val = self.val_data
-        history = self.model.fit(
-            x_train, y_train,
-            validation_data=(x_val, y_val),
-            epochs=self.epochs,
-            batch_size=self.batch_size,
-            verbose=0
-        )
-        return history.history
+        validate = self.eval_every > 0
+        with span('trainer.fit'):
+            history = self.model.fit(
+                self.train_dataset,
+                validation_data=self.val_dataset if validate else None,
+                validation_freq=self.eval_every if validate else 1,
+                epochs=self.epochs,
+                shuffle=False,  # the pipeline reshuffles each epoch itself
+                verbose=0
+            ).history
+        self._final_metrics = None
+        if validate and self.epochs % self.eval_every == 0:
+            # Same weights and data as evaluate() would use, in the same (loss, accuracy) order.
+            loss, acc = [values[-1] for key, values in history.items() if key.startswith('val_')]
+            self._final_metrics = {'loss': loss, 'accuracy': acc}
+        return history
 
-    def get_weight_deltas(self, global_weights, noise_std=0.01):
-        deltas = []
-        local_weights = self.model.get_weights()
+    def get_weight_deltas(self, global_weights, noise_std=0.01, mechanism=None):
+        """The float32 delta from the global weights, as a ParameterVector.
 
-        for gw, lw in zip(global_weights, local_weights):
-            delta = lw - gw
-            noise = np.random.normal(0, noise_std, size=delta.shape)
-            delta_noised = delta + noise
-            deltas.append(delta_noised.astype(np.float32))
-        return deltas
+        Adds N(0, noise_std^2) noise, or clips and noises with `mechanism`
+        (a utils.privacy.GaussianMechanism) when given.
+        """
+        with span('trainer.deltas'):
+            delta = self.model.get_parameters()
+            np.subtract(delta.data, as_parameter_vector(global_weights).data, out=delta.data)
+            if mechanism is not None:
+                self._scratch = mechanism.apply_(delta.data, self.rng, self._scratch)
+            else:
+                self._scratch = add_gaussian_noise_(delta.data, noise_std, self.rng, self._scratch)
+        return delta
 
     def evaluate(self):
-        x_val, y_val = self.val_data
-        loss, acc = self.model.evaluate(x_val, y_val, verbose=0)
+        if self._final_metrics is not None:
+            return self._final_metrics
+        with span('trainer.evaluate'):
+            loss, acc = self.model.evaluate(self.val_dataset, verbose=0)
         return {'loss': loss, 'accuracy': acc}
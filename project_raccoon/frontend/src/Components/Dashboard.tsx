@@ -3,14 +3,19 @@ import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 
 interface Metric {
+  seq: number;
   client_id: string;
   accuracy: number;
   loss: number;
   timestamp: string;
-  global_accuracy: number;
-  global_loss: number;
+  // Null until the server has evaluated the global model the client trained from.
+  global_accuracy: number | null;
+  global_loss: number | null;
 }
 
+// Rows kept on screen; older ones are dropped as new records stream in.
+const MAX_ROWS = 500;
+
 const Dashboard: React.FC = () => {
   const navigate  = useNavigate();
   const groupName = localStorage.getItem('group_name') ?? '';
@@ -29,25 +34,38 @@ const Dashboard: React.FC = () => {
     }, [navigate]);
 
   useEffect(() => {
+    let source: EventSource | null = null;
+    let cancelled = false;
     const fetchMetrics = async () => {
       try {
         const res = await axios.get(`${serverUrl}/metrics`, {
-          params: { group_name: groupName }
+          params: { group_name: groupName, limit: MAX_ROWS }
         });
+        if (cancelled) return;
         if (res.data.status === 'success') {
           setMetrics(res.data.metrics as Metric[]);
           setError('');
+          // From here on the server pushes only records logged after this page.
+          const params = new URLSearchParams({ group_name: groupName, since: String(res.data.next_since) });
+          source = new EventSource(`${serverUrl}/metrics/stream?${params}`);
+          source.addEventListener('metrics', (event) => {
+            const fresh = JSON.parse((event as MessageEvent).data) as Metric[];
+            setMetrics(prev => [...prev, ...fresh].slice(-MAX_ROWS));
+          });
         } else {
           setError(res.data.message || 'backend error');
         }
       } catch (err: any) {
-        setError(err.message || 'network error');
+        if (!cancelled) setError(err.message || 'network error');
       } finally {
-        setLoading(false);
+        if (!cancelled) setLoading(false);
       }
     };
     fetchMetrics();
-    return () => {};
+    return () => {
+      cancelled = true;
+      source?.close();
+    };
   }, [groupName]);
 
 
@@ -96,11 +114,11 @@ const Dashboard: React.FC = () => {
             </tr>
           </thead>
           <tbody>
-            {metrics.map((m, idx) => (
-              <tr key={idx}>
+            {metrics.map((m) => (
+              <tr key={m.seq}>
                 <td>{m.client_id}</td>
-                <td>{m.global_accuracy.toFixed(4)}</td>
-                <td>{m.global_loss.toFixed(4)}</td>
+                <td>{m.global_accuracy?.toFixed(4) ?? '–'}</td>
+                <td>{m.global_loss?.toFixed(4) ?? '–'}</td>
                 <td>{m.accuracy.toFixed(4)}</td>
                 <td>{m.loss.toFixed(4)}</td>
                 <td>{new Date(m.timestamp).toLocaleTimeString()}</td>
@@ -2,14 +2,15 @@ import tensorflow as tf
 from tensorflow import keras
 from keras import layers, models
 import numpy as np
+from models.initializers import HIDDEN_UNITS
+from utils.parameters import ParameterVector
 
 class BaseClassifier(tf.keras.Model):
     def __init__(self, input_dim: int, output_dim: int):
         super(BaseClassifier, self).__init__()
         self.model=tf.keras.Sequential([
             layers.InputLayer(input_shape=(input_dim,)),
-            layers.Dense(64, activation='relu'),
-            layers.Dense(32, activation='relu'),
+            *[layers.Dense(units, activation='relu') for units in HIDDEN_UNITS],
             layers.Dense(output_dim)
         ])
 
@@ -19,7 +20,12 @@ class BaseClassifier(tf.keras.Model):
     def get_weights(self):
         return self.model.get_weights()
     
+    def get_parameters(self) -> ParameterVector:
+        """All weights copied into one flat float32 ParameterVector."""
+        return ParameterVector.from_layers(self.model.get_weights())
+
     def set_weights(self, weights):
+        """Accepts a list of layer arrays or a ParameterVector."""
         self.model.set_weights(weights)
 
 if __name__ == "__main__":
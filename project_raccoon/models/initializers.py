@@ -0,0 +1,27 @@
+from typing import List, Optional, Tuple
+import numpy as np
+from utils.parameters import ParameterVector
+
+# Hidden layer widths of BaseClassifier. Kept here, free of TensorFlow, so the
+# server can lay out and seed a group's weights without building a model.
+HIDDEN_UNITS = (64, 32)
+
+
+def layer_shapes(input_dim: int, output_dim: int) -> List[Tuple[int, ...]]:
+    """Shapes of BaseClassifier's weights, in get_weights() order: kernel then bias per Dense layer."""
+    widths = (input_dim,) + HIDDEN_UNITS + (output_dim,)
+    shapes = []
+    for fan_in, fan_out in zip(widths[:-1], widths[1:]):
+        shapes += [(fan_in, fan_out), (fan_out,)]
+    return shapes
+
+
+def glorot_uniform(input_dim: int, output_dim: int, seed: Optional[int] = None) -> ParameterVector:
+    """Initial BaseClassifier weights as Keras' Dense defaults draw them: Glorot-uniform kernels, zero biases."""
+    rng = np.random.default_rng(seed)
+    weights = ParameterVector.zeros(layer_shapes(input_dim, output_dim))
+    for layer in weights.layers():
+        if layer.ndim == 2:
+            limit = np.sqrt(6.0 / (layer.shape[0] + layer.shape[1]))
+            layer[...] = rng.uniform(-limit, limit, layer.shape)
+    return weights
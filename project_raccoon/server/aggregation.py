@@ -0,0 +1,202 @@
+from typing import Dict, Optional, Type
+import numpy as np
+
+# Server-side aggregation strategies. A strategy turns one round of client
+# deltas into a single update and applies it to the flat global weights.
+#   fedavg        sample-weighted mean of the deltas (McMahan et al. 2017)
+#   fedadam       weighted mean used as a pseudo-gradient for server Adam
+#   fedyogi       the same with Yogi's additive second moment (Reddi et al. 2021)
+#   median        coordinate-wise median of the deltas
+#   trimmed_mean  coordinate-wise mean after dropping the `beta` fraction of
+#                 largest and smallest values
+# Mean-based strategies read running weighted sums, so a round costs O(P)
+# memory whatever the client count. Robust ones need every delta, stacked
+# into an [N, P] float32 matrix by the state backend, and select order
+# statistics with np.partition instead of sorting each column. Robust
+# strategies ignore sample counts: a single client must not be able to buy
+# more influence by claiming more samples.
+#
+# Any strategy can also run buffered and asynchronous, FedBuff style (Nguyen
+# et al. 2022): the group aggregates by itself once `buffer_size` deltas are
+# in, or `timeout` seconds after the first one, and each delta is scaled by
+# (1 + staleness)^-staleness_exponent, where staleness is how many versions
+# the global model moved on since the client fetched the weights it trained
+# from. The scaled deltas are still divided by the unscaled total weight, so
+# a buffer of stale updates moves the model less, as in FedBuff.
+
+
+class Aggregator:
+    """Base strategy: apply `server_lr` times the round's update to the weights."""
+    name = None
+    # True if the strategy needs every delta rather than their weighted sum.
+    stacked = False
+
+    def __init__(self, server_lr: float = 1.0):
+        if server_lr <= 0:
+            raise ValueError("server_lr must be positive")
+        self.server_lr = float(server_lr)
+
+    def reduce_sums(self, sums: np.ndarray, total_weight: float) -> np.ndarray:
+        """The round's update from the weighted delta sums (mean-based strategies only)."""
+        return sums / total_weight
+
+    def reduce_stack(self, stack: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """The round's update from the [N, P] stacked deltas and their [N] sample weights."""
+        # float32 weights keep the product in BLAS sgemv instead of upcasting the whole stack.
+        return ((weights / weights.sum()).astype(stack.dtype) @ stack).astype(np.float64)
+
+    def step(self, weights: np.ndarray, update: np.ndarray) -> np.ndarray:
+        """New flat weights from the current ones and the round's update."""
+        return weights + self.server_lr * update
+
+    def params(self) -> Dict:
+        return {'server_lr': self.server_lr}
+
+    def to_dict(self) -> Dict:
+        return {'strategy': self.name, **self.params()}
+
+
+class FedAvg(Aggregator):
+    name = 'fedavg'
+
+
+class FedAdam(FedAvg):
+    """Server-side Adam on the weighted mean delta, with moments kept across rounds.
+
+    The moments live in this object, so with the mmap state backend they are
+    per process: keep aggregation on one worker when using adaptive strategies.
+    """
+    name = 'fedadam'
+
+    def __init__(self, server_lr: float = 0.01, beta_1: float = 0.9, beta_2: float = 0.99, tau: float = 1e-3):
+        super().__init__(server_lr)
+        if not (0 <= beta_1 < 1 and 0 <= beta_2 < 1) or tau <= 0:
+            raise ValueError("Need 0 <= beta_1, beta_2 < 1 and tau > 0")
+        self.beta_1 = float(beta_1)
+        self.beta_2 = float(beta_2)
+        self.tau = float(tau)
+        self.m: Optional[np.ndarray] = None
+        self.v: Optional[np.ndarray] = None
+
+    def _second_moment(self, update_sq: np.ndarray):
+        self.v *= self.beta_2
+        self.v += (1 - self.beta_2) * update_sq
+
+    def step(self, weights: np.ndarray, update: np.ndarray) -> np.ndarray:
+        if self.m is None or self.m.shape != update.shape:
+            self.m = np.zeros(update.shape, dtype=np.float64)
+            self.v = np.full(update.shape, self.tau ** 2, dtype=np.float64)
+        self.m *= self.beta_1
+        self.m += (1 - self.beta_1) * update
+        self._second_moment(np.square(update))
+        step = np.sqrt(self.v)
+        step += self.tau
+        np.divide(self.m, step, out=step)
+        step *= self.server_lr
+        step += weights
+        return step
+
+    def params(self) -> Dict:
+        return {'server_lr': self.server_lr, 'beta_1': self.beta_1, 'beta_2': self.beta_2, 'tau': self.tau}
+
+
+class FedYogi(FedAdam):
+    name = 'fedyogi'
+
+    def _second_moment(self, update_sq: np.ndarray):
+        # v -= (1 - beta_2) * u^2 * sign(v - u^2): v moves towards u^2 by a bounded amount.
+        change = np.sign(self.v - update_sq)
+        change *= update_sq
+        change *= 1 - self.beta_2
+        self.v -= change
+
+
+class CoordinateMedian(Aggregator):
+    name = 'median'
+    stacked = True
+
+    def reduce_sums(self, sums, total_weight):
+        raise NotImplementedError("median needs the stacked deltas")
+
+    def reduce_stack(self, stack: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        n = len(stack)
+        hi = n // 2
+        # One single-pivot partition: numpy vectorizes it, but not multi-pivot ones.
+        part = np.partition(stack, hi, axis=0)
+        median = part[hi].astype(np.float64)
+        if n % 2 == 0:
+            # The lower middle value is the largest of the rows below the pivot.
+            median += part[:hi].max(axis=0)
+            median /= 2
+        return median
+
+
+class TrimmedMean(Aggregator):
+    name = 'trimmed_mean'
+    stacked = True
+
+    def __init__(self, beta: float = 0.1, server_lr: float = 1.0):
+        super().__init__(server_lr)
+        if not 0 <= beta < 0.5:
+            raise ValueError("trimmed_mean beta must be in [0, 0.5)")
+        self.beta = float(beta)
+
+    def reduce_sums(self, sums, total_weight):
+        raise NotImplementedError("trimmed_mean needs the stacked deltas")
+
+    def reduce_stack(self, stack: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        n = len(stack)
+        k = int(self.beta * n)
+        if k == 0:
+            return stack.mean(axis=0, dtype=np.float64)
+        # Sum of the kept values = total - k smallest - k largest, each found with a
+        # single-pivot partition (numpy vectorizes those, but not multi-pivot ones).
+        part = np.partition(stack, k, axis=0)
+        kept = part[k:].sum(axis=0, dtype=np.float64)
+        rest = part[k:]
+        top = np.partition(rest, len(rest) - k, axis=0)
+        kept -= top[len(rest) - k:].sum(axis=0, dtype=np.float64)
+        kept /= n - 2 * k
+        return kept
+
+    def params(self) -> Dict:
+        return {'beta': self.beta, 'server_lr': self.server_lr}
+
+
+AGGREGATORS: Dict[str, Type[Aggregator]] = {
+    cls.name: cls for cls in (FedAvg, FedAdam, FedYogi, CoordinateMedian, TrimmedMean)
+}
+
+
+def validate_async(buffer_size: int, timeout: Optional[float] = None, staleness_exponent: float = 0.5,
+                   max_staleness: Optional[int] = None) -> Dict:
+    """Normalised buffered-aggregation config for a group, or ValueError."""
+    if int(buffer_size) < 1:
+        raise ValueError("buffer_size must be at least 1")
+    if timeout is not None and float(timeout) <= 0:
+        raise ValueError("timeout must be positive")
+    if float(staleness_exponent) < 0:
+        raise ValueError("staleness_exponent must be non-negative")
+    if max_staleness is not None and int(max_staleness) < 0:
+        raise ValueError("max_staleness must be non-negative")
+    return {
+        'buffer_size': int(buffer_size),
+        'timeout': float(timeout) if timeout is not None else None,
+        'staleness_exponent': float(staleness_exponent),
+        'max_staleness': int(max_staleness) if max_staleness is not None else None,
+    }
+
+
+def staleness_weight(staleness: int, exponent: float) -> float:
+    """Polynomial discount for a delta trained `staleness` versions ago."""
+    return (1.0 + staleness) ** -exponent
+
+
+def make_aggregator(strategy: str, params: Optional[Dict] = None) -> Aggregator:
+    """Build a strategy from AGGREGATORS, or ValueError for unknown names or bad parameters."""
+    if strategy not in AGGREGATORS:
+        raise ValueError(f"Unknown aggregation strategy: {strategy}")
+    try:
+        return AGGREGATORS[strategy](**(params or {}))
+    except TypeError as e:
+        raise ValueError(f"Bad parameters for {strategy}: {e}") from None
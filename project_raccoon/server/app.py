@@ -1,13 +1,23 @@
-from flask import Flask, request, jsonify
-from server.groups import training_groups
-import numpy as np
+from flask import Flask, request, jsonify, Response, g
+from server.groups import checkpointer, evaluator, training_groups
+from server.checkpoint import list_versions, load_snapshot, load_users
 import base64
+import json
 import pickle
 from flask_cors import CORS
 from datetime import datetime
+import os
+import struct
+import threading
+import time
 import warnings
 warnings.filterwarnings("ignore")
-from server.simulate import Client
+from server.jobs import JobManager, JobLimitExceeded
+from utils.serialization import CONTENT_TYPE, decode_weights
+from utils.partitioners import PARTITIONERS
+from utils.partitioning import check_partition_args
+from utils.privacy import GaussianMechanism
+from utils import instrumentation
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 
@@ -17,7 +27,13 @@ bcrypt= Bcrypt(app)
 jwt= JWTManager(app)
 app.config['SECRET_KEY']= 'no_idea_what_to_put_here'
 app.config['JWT_SECRET_KEY'] = 'no_idea_here_either'
-users = {}
+app.config['SIMULATION_WORKERS'] = int(os.environ.get('RACCOON_SIMULATION_WORKERS', 2))
+app.config['MAX_JOBS_PER_GROUP'] = int(os.environ.get('RACCOON_MAX_JOBS_PER_GROUP', 1))
+app.config['MAX_FINISHED_JOBS'] = int(os.environ.get('RACCOON_MAX_FINISHED_JOBS', 100))
+users = load_users(checkpointer.directory) if checkpointer is not None else {}
+users_lock = threading.Lock()
+jobs = JobManager(max_workers=app.config['SIMULATION_WORKERS'], max_per_group=app.config['MAX_JOBS_PER_GROUP'],
+                  max_finished=app.config['MAX_FINISHED_JOBS'])
 
 def serialize_weights(weights):
     """Convert numpy weights to a base64 string."""
@@ -27,6 +43,27 @@ def deserialize_weights(encoded):
     """Convert base64 string back to numpy weights."""
     return pickle.loads(base64.b64decode(encoded.encode('utf-8')))
 
+@app.before_request
+def start_request_span():
+    if instrumentation.enabled():
+        g.span_start = time.perf_counter_ns()
+
+@app.after_request
+def end_request_span(response):
+    """File the request's time and body sizes under `http.<endpoint>` for its group."""
+    start = g.pop('span_start', None)
+    if start is not None and instrumentation.enabled():
+        group_name = request.args.get('group_name')
+        if group_name is None and request.is_json:
+            # The view has already parsed the body, so this reads Flask's cached copy.
+            group_name = (request.get_json(silent=True) or {}).get('group_name')
+        name = f'http.{request.endpoint}'
+        instrumentation.record(name, group_name, start, time.perf_counter_ns())
+        instrumentation.count(f'{name}.bytes_in', request.content_length or 0, group_name)
+        if not response.is_streamed:
+            instrumentation.count(f'{name}.bytes_out', response.content_length or 0, group_name)
+    return response
+
 @app.route('/')
 def home():
     return "Welcome to Project Raccoon API! Use /register or other endpoints."
@@ -35,38 +72,273 @@ def home():
 def simulate():
     data = request.json
     group_name = data['group_name']
-    num_clients = data['num_clients']
-    clientSim = Client(group_name, num_clients)
-    clientSim.simulate()
+    num_clients = data.get('num_clients')
+    workers = data.get('workers', 1)
+    engine = data.get('engine', 'keras')
+    # The job runs inside this process, so it can skip the HTTP loopback.
+    transport = data.get('transport', 'inprocess')
+    streaming = data.get('streaming', False)
+    partitioner = data.get('partitioner', 'iid')
+    partition_args = data.get('partition_args')
+    dp = data.get('dp')
+    eval_every = data.get('eval_every')
+    seed = data.get('seed')
+    client_global_eval = data.get('client_global_eval', False)
+
+    if partitioner not in PARTITIONERS:
+        return jsonify({"status": "error", "message": f"Unknown partitioner: {partitioner}"}), 400
+
+    if group_name not in training_groups:
+        return jsonify({"status": "error", "message": "Invalid group"}), 400
 
-    return jsonify({"status": "success", "message": f"Client added to group {group_name}"})
+    # Checked here, not in the job, so a bad request fails with 400 instead of a failed job.
+    for name, value in (('num_clients', num_clients), ('workers', workers)):
+        if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+            return jsonify({"status": "error", "message": f"{name} must be a positive integer"}), 400
+
+    if engine not in ('keras', 'batched'):
+        return jsonify({"status": "error", "message": f"Unknown engine: {engine}"}), 400
+
+    if transport not in ('http', 'inprocess'):
+        return jsonify({"status": "error", "message": f"Unknown transport: {transport}"}), 400
+
+    try:
+        check_partition_args(f'data/{group_name}.csv', group_name, partitioner, partition_args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Invalid partition_args: {e}"}), 400
+
+    if eval_every is not None and (not isinstance(eval_every, int) or eval_every < 0):
+        return jsonify({"status": "error", "message": "eval_every must be a non-negative integer"}), 400
+
+    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or seed < 0):
+        return jsonify({"status": "error", "message": "seed must be a non-negative integer"}), 400
+
+    if not isinstance(client_global_eval, bool):
+        return jsonify({"status": "error", "message": "client_global_eval must be true or false"}), 400
+
+    if dp is not None:
+        try:
+            GaussianMechanism(**dp)
+        except (TypeError, ValueError) as e:
+            return jsonify({"status": "error", "message": f"Invalid dp settings: {e}"}), 400
+
+    def run(cancel_event):
+        # Imported here so that TensorFlow is only loaded once a simulation actually runs.
+        from server.simulate import Client
+        clientSim = Client(group_name, num_clients, workers=workers, engine=engine, transport=transport,
+                           streaming=streaming, partitioner=partitioner, partition_args=partition_args,
+                           dp=dp, accountant=training_groups[group_name].privacy, eval_every=eval_every,
+                           seed=seed, client_global_eval=client_global_eval)
+        clientSim.simulate(cancel_event=cancel_event)
+
+    params = {"num_clients": num_clients, "workers": workers, "engine": engine, "transport": transport,
+              "streaming": streaming, "partitioner": partitioner, "partition_args": partition_args,
+              "dp": dp, "eval_every": eval_every, "seed": seed,
+              "client_global_eval": client_global_eval}
+    try:
+        job = jobs.submit(group_name, params, run)
+    except JobLimitExceeded as e:
+        return jsonify({"status": "error", "message": str(e)}), 429
+
+    return jsonify({"status": "success", "message": f"Simulation queued for group {group_name}",
+                    "job_id": job.job_id}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify({"status": "success", "job": job.to_dict()})
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify({"status": "success", "job": job.to_dict()})
+
+def weights_tag(group_name, version):
+    return f'{group_name}-{version}'
+
+def weights_etag(group_name, version, diff=None):
+    # Weak: the binary and JSON bodies of one version are equivalent, not byte-identical.
+    # Weights rebuilt from a lossy diff only approximate the version, so they get a tag of their own.
+    tag = weights_tag(group_name, version)
+    return f'W/"{tag}~{diff}"' if diff is not None else f'W/"{tag}"'
+
+def held_etag(group_name, version):
+    """The client's If-None-Match ETag if it names `version`, exact or approximate, else None."""
+    tag = weights_tag(group_name, version)
+    for held in request.if_none_match.as_set(include_weak=True):
+        if held == tag or held.startswith(f'{tag}~'):
+            return f'W/"{held}"'
+    return None
 
 @app.route('/get_weights', methods=['POST'])
 def get_weights():
+    """Current global weights.
+
+    Responses carry the weights version in `X-Weights-Version` and a matching
+    ETag; `If-None-Match` with that ETag gets a 304 while the version is
+    unchanged. Binary clients may send `since_version` (plus an optional `diff`
+    compression scheme) to receive only the change from a version they hold,
+    flagged by `X-Weights-Diff-From`. Diffs use lossy schemes, so their ETag
+    marks the weights as an approximation of the version (see weights_etag).
+    """
     data = request.json
     group_name = data['group_name']
 
     if group_name not in training_groups:
         return jsonify({"status": "error", "message": "Invalid group"}), 400
+    group = training_groups[group_name]
 
-    weights = training_groups[group_name].get_global_weights()
-    if weights is None:
+    version = group.get_version()
+    if version == 0:
         return jsonify({"status": "error", "message": "Model not yet initialized"}), 400
-
-    encoded_weights = serialize_weights(weights)
-    return jsonify({"status": "success", "weights": encoded_weights})
+    held = held_etag(group_name, version)
+    if held is not None:
+        return Response(status=304, headers={'ETag': held, 'X-Weights-Version': str(version)})
+
+    if request.accept_mimetypes.best == CONTENT_TYPE:
+        headers = {}
+        diff = scheme = None
+        if data.get('since_version') is not None:
+            try:
+                scheme = data.get('diff', 'none')
+                diff = group.encoded_diff(int(data['since_version']), scheme)
+            except (TypeError, ValueError) as e:
+                return jsonify({"status": "error", "message": f"Invalid diff request: {e}"}), 400
+        if diff is not None:
+            version, body = diff
+            headers['X-Weights-Diff-From'] = str(data['since_version'])
+            headers['X-Weights-Compression'] = scheme
+            headers['ETag'] = weights_etag(group_name, version, scheme)
+        else:
+            version, body = group.encoded_weights()
+            headers['ETag'] = weights_etag(group_name, version)
+        headers['X-Weights-Version'] = str(version)
+        return Response(body, mimetype=CONTENT_TYPE, headers=headers)
+
+    # The whole JSON body is cached, since escaping the base64 string costs more than pickling.
+    # JSON clients get a plain list of per-layer arrays, as before.
+    version, body = group.encoded_weights('json', lambda weights: json.dumps(
+        {"status": "success", "weights": serialize_weights(list(weights))}))
+    return Response(body, mimetype='application/json',
+                    headers={'ETag': weights_etag(group_name, version), 'X-Weights-Version': str(version)})
 
 @app.route('/submit_update', methods=['POST'])
 def submit_update():
-    data = request.json
-    group_name = data['group_name']
-    delta = deserialize_weights(data['delta'])
+    if request.mimetype == CONTENT_TYPE:
+        group_name = request.args.get('group_name')
+        if group_name not in training_groups:
+            return jsonify({"status": "error", "message": "Invalid group"}), 400
+        payload, decode = request.get_data(), decode_weights
+        compression = request.args.get('compression')
+        num_samples = request.args.get('num_samples')
+        base_version = request.args.get('base_version')
+    else:
+        data = request.json
+        group_name = data['group_name']
+        if group_name not in training_groups:
+            return jsonify({"status": "error", "message": "Invalid group"}), 400
+        payload, decode = data['delta'], deserialize_weights
+        compression = data.get('compression')
+        num_samples = data.get('num_samples')
+        base_version = data.get('base_version')
+
+    try:
+        # A truncated or garbled body is the client's error, like a bad shape or version.
+        training_groups[group_name].add_delta(decode(payload), compression,
+                                              float(num_samples) if num_samples is not None else None,
+                                              int(base_version) if base_version is not None else None)
+    except (ValueError, struct.error, EOFError, pickle.UnpicklingError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"status": "success", "message": "Delta received"})
 
+@app.route('/compression', methods=['GET', 'POST'])
+def compression_settings():
+    """GET: a group's delta compression scheme and upload stats. POST: change the scheme."""
+    data = request.json if request.method == 'POST' else request.args
+    group_name = data.get('group_name')
     if group_name not in training_groups:
         return jsonify({"status": "error", "message": "Invalid group"}), 400
+    group = training_groups[group_name]
 
-    training_groups[group_name].add_delta(delta)
-    return jsonify({"status": "success", "message": "Delta received"})
+    if request.method == 'POST':
+        try:
+            group.set_compression(data['scheme'], data.get('ratio'))
+        except (KeyError, ValueError) as e:
+            return jsonify({"status": "error", "message": f"Invalid compression: {e}"}), 400
+
+    return jsonify({"status": "success", "compression": group.get_compression()})
+
+@app.route('/aggregation', methods=['GET', 'POST'])
+def aggregation_settings():
+    """GET: a group's aggregation strategy and async mode. POST: change either.
+
+    e.g. {"strategy": "trimmed_mean", "params": {"beta": 0.2}} or
+    {"async": {"buffer_size": 10, "timeout": 30}}; "async": null goes back to synchronous rounds.
+    """
+    data = request.json if request.method == 'POST' else request.args
+    group_name = data.get('group_name')
+    if group_name not in training_groups:
+        return jsonify({"status": "error", "message": "Invalid group"}), 400
+    group = training_groups[group_name]
+
+    if request.method == 'POST':
+        try:
+            if 'strategy' in data:
+                group.set_aggregation(data['strategy'], data.get('params'))
+            if 'async' in data:
+                group.set_async(data['async'])
+        except (TypeError, ValueError) as e:
+            return jsonify({"status": "error", "message": f"Invalid aggregation: {e}"}), 400
+
+    return jsonify({"status": "success", "aggregation": group.get_aggregation()})
+
+@app.route('/privacy', methods=['GET'])
+def privacy_budget():
+    group_name = request.args.get('group_name')
+    if group_name not in training_groups:
+        return jsonify({"status": "error", "message": "Invalid group"}), 400
+    return jsonify({"status": "success", "privacy": training_groups[group_name].privacy.summary()})
+
+@app.route('/global_metric', methods=['GET'])
+def global_metric():
+    """The server's evaluation of the newest global model it has evaluated, on the validation and test sets.
+
+    With `version`, first waits a few seconds for that version's evaluation (see wait_global_metric).
+    """
+    group_name = request.args.get('group_name')
+    if group_name not in training_groups:
+        return jsonify({"status": "error", "message": "Invalid group"}), 400
+    group = training_groups[group_name]
+    version = request.args.get('version', type=int)
+    metric = group.wait_global_metric(version) if version is not None else group.get_global_metric()
+    return jsonify({"status": "success", "global_metric": metric,
+                    "current_version": group.get_version(),
+                    "evaluation": evaluator.stats if evaluator is not None else None})
+
+@app.route('/stats', methods=['GET', 'POST'])
+def profiling_stats():
+    """GET: time per stage and byte counts, for every group or `group_name`. POST: turn profiling on or off.
+
+    e.g. {"enabled": true, "reset": true} clears what was recorded and starts again.
+    """
+    if request.method == 'POST':
+        data = request.json
+        if data.get('reset'):
+            instrumentation.reset()
+        if 'enabled' in data:
+            instrumentation.enable(bool(data['enabled']))
+        return jsonify({"status": "success", "enabled": instrumentation.enabled()})
+    return jsonify({"status": "success", **instrumentation.stats(request.args.get('group_name'))})
+
+@app.route('/stats/trace', methods=['GET'])
+def profiling_trace():
+    """Recorded spans as a Chrome trace; open it in Perfetto or chrome://tracing."""
+    return Response(json.dumps(instrumentation.trace()), mimetype='application/json',
+                    headers={'Content-Disposition': 'attachment; filename=raccoon-trace.json'})
 
 @app.route('/aggregate', methods=['POST'])
 def aggregate_updates():
@@ -76,28 +348,110 @@ def aggregate_updates():
     if group_name not in training_groups:
         return jsonify({"status": "error", "message": "Invalid group"}), 400
 
-    deltas = training_groups[group_name].get_all_deltas()
-    if not deltas:
+    if not training_groups[group_name].aggregate():
         return jsonify({"status": "error", "message": "No updates to aggregate"}), 400
 
-    avg_delta = [np.mean([d[i] for d in deltas], axis=0) for i in range(len(deltas[0]))]
-
-    global_weights = training_groups[group_name].get_global_weights()
-    new_weights = [w + dw for w, dw in zip(global_weights, avg_delta)]
-
-    training_groups[group_name].set_global_weights(new_weights)
-    training_groups[group_name].clear_deltas()
-
     return jsonify({"status": "success", "message": "Global model updated"})
 
+@app.route('/checkpoints', methods=['GET'])
+def list_checkpoints():
+    """The weight versions of a group that are checkpointed and can be rolled back to."""
+    group_name = request.args.get('group_name')
+    if group_name not in training_groups:
+        return jsonify({"status": "error", "message": "Invalid group"}), 400
+    if checkpointer is None:
+        return jsonify({"status": "error", "message": "Checkpointing is off; set RACCOON_CHECKPOINT_DIR"}), 400
+    return jsonify({"status": "success", "versions": list_versions(checkpointer.directory, group_name),
+                    "current_version": training_groups[group_name].get_version(), "stats": checkpointer.stats})
+
+@app.route('/checkpoints/rollback', methods=['POST'])
+def rollback_checkpoint():
+    """Republish a checkpointed version's weights as a new version; pending deltas are dropped."""
+    data = request.json
+    group_name = data.get('group_name')
+    if group_name not in training_groups:
+        return jsonify({"status": "error", "message": "Invalid group"}), 400
+    if checkpointer is None:
+        return jsonify({"status": "error", "message": "Checkpointing is off; set RACCOON_CHECKPOINT_DIR"}), 400
+    try:
+        snapshot = load_snapshot(checkpointer.directory, group_name, int(data['version']))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid rollback request: {e}"}), 400
+    if snapshot is None:
+        return jsonify({"status": "error", "message": f"No checkpoint of version {data['version']}"}), 404
+    version = training_groups[group_name].rollback(snapshot[1])
+    return jsonify({"status": "success", "message": f"Rolled back to version {snapshot[0]}",
+                    "version": version})
+
+def metrics_cursor(args):
+    """(since, limit, max_points) from query arguments; ValueError for bad values."""
+    values = []
+    for name, lowest in (('since', -1), ('limit', 1), ('max_points', 1)):
+        value = args.get(name)
+        value = None if value in (None, '') else int(value)
+        if value is not None and value < lowest:
+            raise ValueError(f"{name} must be at least {lowest}")
+        values.append(value)
+    return values
+
 @app.route('/metrics', methods=['GET'])
 def get_metrics():
+    """A page of a group's metric records.
+
+    `since` returns only records with a larger `seq`, `limit` caps the page
+    (without `since`, the newest `limit` records), and `max_points` averages
+    the page down to that many rows. `format=columns` returns one list per
+    field instead of one object per record. Pass `next_since` back as `since`
+    to read on.
+    """
     group_name = request.args.get('group_name')
     if group_name not in training_groups:
         return jsonify({"status": "error", "message": "Invalid group"}), 400
-
-    metrics = training_groups[group_name].metrics if hasattr(training_groups[group_name], 'metrics') else []
-    return jsonify({"status": "success", "metrics": metrics})
+    try:
+        since, limit, max_points = metrics_cursor(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Invalid metrics query: {e}"}), 400
+
+    store = training_groups[group_name].metrics
+    if request.args.get('format') == 'columns':
+        page = store.query_columns(since, limit, max_points)
+    else:
+        page = store.query(since, limit, max_points)
+        page['metrics'] = page.pop('records')
+    return jsonify({"status": "success", **page})
+
+# Seconds between keep-alive comments on an idle metrics stream.
+METRICS_KEEPALIVE = 15
+
+@app.route('/metrics/stream', methods=['GET'])
+def stream_metrics():
+    """Server-Sent Events: each `metrics` event carries the records logged since the previous one.
+
+    Starts after `since` (or the `Last-Event-ID` a reconnecting EventSource
+    sends); without either, only records logged from now on are sent.
+    """
+    group_name = request.args.get('group_name')
+    if group_name not in training_groups:
+        return jsonify({"status": "error", "message": "Invalid group"}), 400
+    store = training_groups[group_name].metrics
+    try:
+        since = request.headers.get('Last-Event-ID', request.args.get('since'))
+        since = store.next_seq - 1 if since in (None, '') else int(since)
+    except ValueError:
+        return jsonify({"status": "error", "message": "since must be an integer"}), 400
+
+    def events(since):
+        yield 'retry: 2000\n\n'
+        while True:
+            if not store.wait(since, METRICS_KEEPALIVE):
+                yield ': keep-alive\n\n'
+                continue
+            page = store.query(since, limit=1000)
+            since = page['next_since']
+            yield f"id: {since}\nevent: metrics\ndata: {json.dumps(page['records'])}\n\n"
+
+    return Response(events(since), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/log_metrics', methods=['POST'])
@@ -129,11 +483,13 @@ def register():
     username = data['username']
     password = data['password']
 
-    if username in users:
-        return jsonify({"status": "error", "message": "User already exists"}), 400
-
     hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
-    users[username] = hashed_password
+    with users_lock:
+        if username in users:
+            return jsonify({"status": "error", "message": "User already exists"}), 400
+        users[username] = hashed_password
+        if checkpointer is not None:
+            checkpointer.save_users(users)
     return jsonify({"status": "success", "message": "User registered successfully"})
 
 @app.route('/login', methods=['POST'])
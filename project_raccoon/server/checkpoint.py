@@ -0,0 +1,247 @@
+import atexit
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from utils.instrumentation import span
+from utils.parameters import ParameterVector
+
+# On-disk checkpoints of group state, one directory per group:
+#   <dir>/<group>/v00000042/weights.bin   flat little-endian float32 weights
+#   <dir>/<group>/v00000042/meta.json     format, version, layer shapes, and the
+#                                         group's settings and history (see
+#                                         TrainingGroup.snapshot_meta)
+#   <dir>/users.json                      registered users and password hashes
+# A version directory is written under a temporary name and renamed into place,
+# so any `v*` directory is complete; later saves of the same version only
+# replace meta.json, again through a rename. Restoring memory-maps weights.bin
+# read-only instead of reading it, so a restarted server can publish the
+# weights before touching most of their pages. The newest `keep` versions of
+# each group are kept for rollback.
+
+FORMAT = 1
+WEIGHTS_FILE = 'weights.bin'
+META_FILE = 'meta.json'
+
+
+def _json_default(value):
+    # numpy scalars in metrics, e.g. compression ratios.
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _fsync_dir(path: str):
+    """Persist a rename in `path`, where the platform allows it.
+
+    Best-effort: Windows cannot open a directory this way, and the rename has
+    already happened by now, so failing here would only skip prune().
+    """
+    if os.name == 'nt':
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path: str, obj):
+    """Replace `path` with `obj` as JSON, so readers see the old file or the new one, never a mix."""
+    tmp = f'{path}.tmp-{os.getpid()}-{threading.get_ident()}'
+    with open(tmp, 'w') as f:
+        json.dump(obj, f, default=_json_default)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def version_dir(directory: str, group_name: str, version: int) -> str:
+    return os.path.join(directory, group_name, f'v{version:08d}')
+
+
+def list_versions(directory: str, group_name: str) -> List[int]:
+    """Checkpointed versions of a group, oldest first."""
+    try:
+        names = os.listdir(os.path.join(directory, group_name))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[1:]) for name in names if name.startswith('v') and name[1:].isdigit())
+
+
+def load_snapshot(directory: str, group_name: str, version: Optional[int] = None
+                  ) -> Optional[Tuple[int, ParameterVector, Dict]]:
+    """(version, memory-mapped weights, meta) of a checkpoint, the newest if `version` is None."""
+    versions = list_versions(directory, group_name)
+    if version is None:
+        if not versions:
+            return None
+        version = versions[-1]
+    elif version not in versions:
+        return None
+    path = version_dir(directory, group_name, version)
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    if meta.get('format') != FORMAT:
+        raise ValueError(f"{path} has checkpoint format {meta.get('format')}, expected {FORMAT}")
+    shapes = [tuple(s) for s in meta['shapes']]
+    flat = np.memmap(os.path.join(path, WEIGHTS_FILE), dtype='<f4', mode='r')
+    return version, ParameterVector(flat, shapes), meta
+
+
+def write_snapshot(directory: str, group_name: str, version: int, weights: ParameterVector, meta: Dict) -> int:
+    """Write one checkpoint; returns the bytes written. Only meta.json is rewritten if the version exists."""
+    meta = {'format': FORMAT, 'group': group_name, 'version': version,
+            'shapes': [list(s) for s in weights.shapes], 'created': time.time(), **meta}
+    final = version_dir(directory, group_name, version)
+    if os.path.isdir(final):
+        write_json_atomic(os.path.join(final, META_FILE), meta)
+        return os.path.getsize(os.path.join(final, META_FILE))
+    parent = os.path.dirname(final)
+    os.makedirs(parent, exist_ok=True)
+    tmp = os.path.join(parent, f'.tmp-v{version:08d}-{os.getpid()}')
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.mkdir(tmp)
+    with open(os.path.join(tmp, WEIGHTS_FILE), 'wb') as f:
+        f.write(np.ascontiguousarray(weights.data, dtype='<f4').data)
+        f.flush()
+        os.fsync(f.fileno())
+    write_json_atomic(os.path.join(tmp, META_FILE), meta)
+    try:
+        os.rename(tmp, final)
+    except OSError:
+        # Another worker checkpointed the same version first; theirs is just as good.
+        shutil.rmtree(tmp, ignore_errors=True)
+        return 0
+    _fsync_dir(parent)
+    return weights.nbytes + os.path.getsize(os.path.join(final, META_FILE))
+
+
+def prune(directory: str, group_name: str, keep: int):
+    for version in list_versions(directory, group_name)[:-keep]:
+        shutil.rmtree(version_dir(directory, group_name, version), ignore_errors=True)
+
+
+def load_users(directory: str) -> Dict[str, str]:
+    try:
+        with open(os.path.join(directory, 'users.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+class Checkpointer:
+    """Writes group checkpoints on a background thread.
+
+    schedule() only marks a group dirty, so aggregation never waits on disk.
+    The writer snapshots each dirty group when it gets to it, and every
+    `interval` seconds it also checks every watched group, to pick up metrics
+    that arrived without a new version. Groups whose version, metric seq and
+    global metric are unchanged since their last checkpoint are skipped.
+    """
+    def __init__(self, directory: str, keep: int = 5, interval: float = 60.0):
+        if keep < 1:
+            raise ValueError("keep must be at least 1")
+        self.directory = directory
+        self.keep = keep
+        self.interval = interval
+        self._groups = {}
+        self._dirty = set()
+        self._users = None
+        self._written = {}
+        self._busy = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {'snapshots': 0, 'skipped': 0, 'errors': 0, 'bytes': 0, 'seconds': 0.0, 'last_error': None}
+        os.makedirs(directory, exist_ok=True)
+
+    def watch(self, group):
+        """Checkpoint `group` from now on, on every aggregation and periodically."""
+        with self._cond:
+            self._groups[group.group_name] = group
+            self._start()
+        group.checkpointer = self
+
+    def schedule(self, group):
+        with self._cond:
+            self._dirty.add(group.group_name)
+            self._start()
+            self._cond.notify()
+
+    def save_users(self, users: Dict[str, str]):
+        with self._cond:
+            self._users = dict(users)
+            self._start()
+            self._cond.notify()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything scheduled so far is on disk; False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._dirty or self._users is not None or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def checkpoint_now(self, group) -> Optional[int]:
+        """Write `group`'s checkpoint on the calling thread; returns its version, or None if unchanged."""
+        version, weights = group.get_versioned_weights()
+        if weights is None:
+            return None
+        meta = group.snapshot_meta()
+        key = (version, meta['metrics_next_seq'], json.dumps(meta['global_metric'], default=_json_default))
+        if self._written.get(group.group_name) == key:
+            self.stats['skipped'] += 1
+            return None
+        start = time.perf_counter()
+        with span('checkpoint.write', group.group_name):
+            written = write_snapshot(self.directory, group.group_name, version, weights, meta)
+            prune(self.directory, group.group_name, self.keep)
+        self._written[group.group_name] = key
+        self.stats['snapshots'] += 1
+        self.stats['bytes'] += written
+        self.stats['seconds'] += time.perf_counter() - start
+        return version
+
+    def _start(self):
+        # Needs _cond.
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='checkpointer', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush, 10.0)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._dirty and self._users is None:
+                    self._cond.notify_all()
+                    if not self._cond.wait(self.interval):
+                        self._dirty.update(self._groups)
+                names, self._dirty = self._dirty, set()
+                users, self._users = self._users, None
+                groups = [self._groups[name] for name in names if name in self._groups]
+                self._busy = True
+            try:
+                if users is not None:
+                    write_json_atomic(os.path.join(self.directory, 'users.json'), users)
+                for group in groups:
+                    self.checkpoint_now(group)
+            except Exception as e:
+                # Keep serving; the next aggregation or tick tries again.
+                self.stats['errors'] += 1
+                self.stats['last_error'] = repr(e)
+                self._written.clear()
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
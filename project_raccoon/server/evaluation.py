@@ -0,0 +1,137 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+import numpy as np
+from utils.instrumentation import span
+from utils.parameters import ParameterVector
+
+# Server-side evaluation of a group's global model. BaseClassifier is a ReLU
+# MLP, so the forward pass is a few float32 matmuls over the flat weights
+# (kernel, bias per layer, as in models/initializers.layer_shapes). Running it
+# in numpy needs no TensorFlow in the server, no model to build or trace, and
+# takes the whole set in batches of thousands of rows rather than Keras'
+# default 32. The loss is sparse categorical cross-entropy on the logits,
+# the same quantity `model.evaluate` reports for the compiled model.
+
+EVAL_BATCH_SIZE = 8192
+
+
+def logits(weights: ParameterVector, X: np.ndarray, batch_size: int = EVAL_BATCH_SIZE) -> np.ndarray:
+    """Output logits of the MLP held in `weights` for every row of `X`."""
+    layers = weights.layers()
+    pairs = list(zip(layers[::2], layers[1::2]))
+    out = np.empty((len(X), pairs[-1][1].shape[0]), dtype=np.float32)
+    for start in range(0, len(X), batch_size):
+        h = np.asarray(X[start:start + batch_size], dtype=np.float32)
+        for i, (kernel, bias) in enumerate(pairs):
+            h = h @ kernel
+            h += bias
+            if i < len(pairs) - 1:
+                np.maximum(h, 0, out=h)
+        out[start:start + batch_size] = h
+    return out
+
+
+def evaluate(weights: ParameterVector, X: np.ndarray, y: np.ndarray,
+             batch_size: int = EVAL_BATCH_SIZE) -> Dict[str, float]:
+    """{'loss', 'accuracy'} of the global model on (X, y)."""
+    z = logits(weights, X, batch_size).astype(np.float64)
+    y = np.asarray(y, dtype=np.int64)
+    top = z.max(axis=1)
+    log_norm = top + np.log(np.exp(z - top[:, None]).sum(axis=1))
+    loss = float(np.mean(log_norm - z[np.arange(len(y)), y]))
+    accuracy = float(np.mean(z.argmax(axis=1) == y))
+    return {'loss': loss, 'accuracy': accuracy}
+
+
+def load_eval_sets(group_name: str):
+    """((X_val, y_val), (X_test, y_test)) of a group's dataset, from the preprocessing cache."""
+    # Imported here so that pandas is only loaded once a group is evaluated.
+    from utils.partitioning import load_preprocessed
+    data = load_preprocessed(f'data/{group_name}.csv', group_name)
+    X, y = data['X'], data['y']
+    return (X[data['val_idx']], y[data['val_idx']]), (X[data['test_idx']], y[data['test_idx']])
+
+
+class Evaluator:
+    """Evaluates groups' new global weights on a background thread.
+
+    schedule() only marks a group, so aggregation never waits for inference.
+    Each pass evaluates the newest version of every marked group, so a burst
+    of aggregations costs one evaluation, on validation and test sets loaded
+    once per group. Results go to TrainingGroup.set_global_metric.
+    """
+    def __init__(self, batch_size: int = EVAL_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._pending = {}
+        self._datasets: Dict[str, Optional[Tuple]] = {}
+        self._busy = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {'evaluations': 0, 'skipped': 0, 'errors': 0, 'seconds': 0.0, 'last_error': None}
+
+    def schedule(self, group):
+        with self._cond:
+            self._pending[group.group_name] = group
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='evaluator', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every scheduled evaluation is done; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def wait(self, group, version: int, timeout: Optional[float] = None) -> bool:
+        """Wait until `group` has a global metric for `version` or a newer one; False on timeout."""
+        def ready():
+            metric = group.get_global_metric()
+            return metric is not None and metric['version'] is not None and metric['version'] >= version
+        with self._cond:
+            return self._cond.wait_for(ready, timeout)
+
+    def datasets(self, group_name: str):
+        """Cached (val, test) sets of a group, or None if it has no dataset on this server."""
+        if group_name not in self._datasets:
+            try:
+                self._datasets[group_name] = load_eval_sets(group_name)
+            except FileNotFoundError:
+                self._datasets[group_name] = None
+        return self._datasets[group_name]
+
+    def evaluate_group(self, group) -> Optional[Dict]:
+        """Evaluate `group`'s current weights on the calling thread and record the result."""
+        version, weights = group.get_versioned_weights()
+        sets = self.datasets(group.group_name)
+        if weights is None or sets is None:
+            self.stats['skipped'] += 1
+            return None
+        start = time.perf_counter()
+        (X_val, y_val), (X_test, y_test) = sets
+        with span('server.evaluate', group.group_name):
+            val = evaluate(weights, X_val, y_val, self.batch_size)
+            test = evaluate(weights, X_test, y_test, self.batch_size)
+        elapsed = time.perf_counter() - start
+        group.set_global_metric(val['accuracy'], val['loss'], version=version,
+                                test_accuracy=test['accuracy'], test_loss=test['loss'])
+        self.stats['evaluations'] += 1
+        self.stats['seconds'] += elapsed
+        return group.get_global_metric()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                groups, self._pending = list(self._pending.values()), {}
+                self._busy = True
+            try:
+                for group in groups:
+                    self.evaluate_group(group)
+            except Exception as e:
+                self.stats['errors'] += 1
+                self.stats['last_error'] = repr(e)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
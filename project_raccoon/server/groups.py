@@ -1,51 +1,513 @@
-from models.base_model import BaseClassifier
+from models.initializers import glorot_uniform, layer_shapes
+from server.aggregation import make_aggregator, staleness_weight, validate_async
+from server.checkpoint import Checkpointer, load_snapshot
+from server.evaluation import Evaluator
+from server.metrics import MetricsStore
+from server.state import InMemoryState, make_state
+from utils.compression import Compressor, decompress, decompress_into, payload_nbytes, validate_config
+from utils.instrumentation import span
+from utils.parameters import ParameterVector, as_parameter_vector
+from utils.privacy import PrivacyAccountant
+from utils.serialization import decode_weights, encode_weights
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Optional
 from datetime import datetime
+import os
+import threading
+import numpy as np
+
+# Default delta compression for every group, e.g. "q8" or "topk:0.01".
+DEFAULT_COMPRESSION = os.environ.get('RACCOON_COMPRESSION', 'none')
+
+def parse_compression(spec: str):
+    scheme, _, ratio = spec.partition(':')
+    return validate_config(scheme, float(ratio) if ratio else None)
+
+# Default aggregation strategy for every group (see server/aggregation.py).
+DEFAULT_AGGREGATION = os.environ.get('RACCOON_AGGREGATION', 'fedavg')
+
+# How many past weight versions a group keeps to serve diffs against.
+WEIGHT_HISTORY = int(os.environ.get('RACCOON_WEIGHT_HISTORY', 4))
+
+# Evaluate the global model on the server after every aggregation (see server/evaluation.py); '0' turns it off.
+SERVER_EVALUATION = os.environ.get('RACCOON_SERVER_EVALUATION', '1') != '0'
+
+# Longest a client waits for the server to evaluate the weights version it fetched.
+GLOBAL_METRIC_WAIT = float(os.environ.get('RACCOON_GLOBAL_METRIC_WAIT', 5))
+
+# How many metric records each group keeps (see server/metrics.py).
+METRICS_RETENTION = int(os.environ.get('RACCOON_METRICS_RETENTION', 10_000))
+
+# Optional directory of `<group>.weights` files (binary /get_weights format) to seed groups from.
+INITIAL_WEIGHTS_DIR = os.environ.get('RACCOON_INITIAL_WEIGHTS')
+
+# Checkpoints (see server/checkpoint.py) are written to, and restored from, this directory when set.
+CHECKPOINT_DIR = os.environ.get('RACCOON_CHECKPOINT_DIR')
+CHECKPOINT_KEEP = int(os.environ.get('RACCOON_CHECKPOINT_KEEP', 5))
+CHECKPOINT_INTERVAL = float(os.environ.get('RACCOON_CHECKPOINT_INTERVAL', 60))
+
 class TrainingGroup:
-    def __init__(self, group_name):
+    """Per-group federated state.
+
+    Global weights and delta accumulators live in a pluggable state backend
+    (see server/state.py) that owns the group's lock and version counter, so
+    groups never contend with each other and several worker processes can
+    share one group. Weights are published read-copy-update style: aggregation
+    builds a fresh set and swaps it in, so readers never take the lock and
+    never see a half-updated model.
+    """
+    def __init__(self, group_name, state=None):
         self.group_name = group_name
+        self.state = state if state is not None else InMemoryState(group_name)
         self.clients = set()
-        self.global_weights = None
-        self.deltas_buffer = []
-        self.metrics = []
+        self.metrics = MetricsStore(METRICS_RETENTION)
+        self._lock = threading.Lock()
+        self.compression = parse_compression(DEFAULT_COMPRESSION)
+        self.aggregator = make_aggregator(DEFAULT_AGGREGATION)
+        # None for synchronous rounds, else a validate_async() config for buffered asynchronous ones.
+        self.async_config = None
+        self.async_stats = {'aggregations': 0, 'timeouts': 0, 'dropped': 0, 'updates': 0, 'staleness_sum': 0}
+        # Weights version whose round has a timeout timer pending, if any; guarded by the state lock.
+        self._timeout_version = None
+        self.upload_stats = {'updates': 0, 'dense_bytes': 0, 'wire_bytes': 0}
+        # Per-client privacy budget spent by differentially private simulations of this group.
+        self.privacy = PrivacyAccountant()
+        # Encoded payloads for the newest version seen, built once and shared by every request.
+        self._payload_lock = threading.Lock()
+        self._payload_version = 0
+        self._payloads = {}
+        self._history = OrderedDict()
+        # A server.checkpoint.Checkpointer and a server.evaluation.Evaluator to notify
+        # when the weights change, if any.
+        self.checkpointer = None
+        self.evaluator = None
 
     def add_client(self, client_id):
-        self.clients.add(client_id)
+        with self._lock:
+            self.clients.add(client_id)
+
+    def initialize_global_weights(self, weights, version: int = 1):
+        """Seed the global weights unless another worker already has; a restored checkpoint keeps its version."""
+        return self.state.initialize(weights, version)
 
     def set_global_weights(self, weights):
-        self.global_weights = weights
+        with self.state.lock():
+            self.state.write_weights(weights)
+        self._on_new_weights()
+
+    def _on_new_weights(self):
+        """New weights are live: queue their checkpoint and evaluation, both of which run on their own threads."""
+        if self.checkpointer is not None:
+            self.checkpointer.schedule(self)
+        if self.evaluator is not None:
+            self.evaluator.schedule(self)
+
+    def rollback(self, weights) -> int:
+        """Publish earlier weights as a new version, dropping the pending round; returns the new version."""
+        with self.state.lock():
+            self.state.write_weights(weights)
+            self._reset_deltas()
+            version = self.state.version
+        self._on_new_weights()
+        return version
 
     def get_global_weights(self):
-        return self.global_weights
+        return self.state.read_weights()
+
+    def get_version(self) -> int:
+        return self.state.version
+
+    def get_versioned_weights(self):
+        """(version, weights) read as one consistent pair."""
+        return self.state.read_versioned()
+
+    def _observe(self, version, weights) -> bool:
+        """Note a version read from the state; False if it is already superseded. Needs _payload_lock."""
+        if version > self._payload_version:
+            self._payload_version = version
+            self._payloads = {}
+            self._history[version] = weights
+            while len(self._history) > WEIGHT_HISTORY:
+                self._history.popitem(last=False)
+        return version == self._payload_version
+
+    def _cached_payload(self, version, weights, key, build):
+        with self._payload_lock:
+            if self._observe(version, weights):
+                payload = self._payloads.get(key)
+                if payload is None:
+                    with span('group.encode_weights', self.group_name):
+                        payload = self._payloads[key] = build()
+                return payload
+        # A reader that raced an aggregation; serve it without caching.
+        with span('group.encode_weights', self.group_name):
+            return build()
+
+    def encoded_weights(self, fmt='binary', encode=encode_weights):
+        """(version, encode(weights)) for the current weights, encoded once per version and `fmt`."""
+        version, weights = self.state.read_versioned()
+        if weights is None:
+            return version, None
+        return version, self._cached_payload(version, weights, (fmt,), lambda: encode(weights))
+
+    def encoded_diff(self, base_version: int, scheme='none'):
+        """(version, payload) of `current - weights@base_version`, compressed with `scheme`.
+
+        The payload is in utils/compression.py format. Returns None when the
+        base version is no longer (or was never) held in this process, and for
+        'none': an uncompressed diff is as large as the weights, and
+        `base + (current - base)` is not bit-exact in float32.
+        """
+        version, weights = self.state.read_versioned()
+        validate_config(scheme)
+        if weights is None or scheme == 'none':
+            return None
+        with self._payload_lock:
+            self._observe(version, weights)
+            base = self._history.get(base_version)
+        if base is None or base_version >= version:
+            return None
+
+        def build():
+            diff = ParameterVector(weights.data - base.data, weights.shapes)
+            return encode_weights(Compressor(scheme, seed=version).compress(diff), dtype=None)
+        return version, self._cached_payload(version, weights, ('diff', base_version, scheme), build)
     
-    def set_global_metric(self, accuracy: float, loss: float):
+    def set_global_metric(self, accuracy: float, loss: float, version=None, test_accuracy=None, test_loss=None):
+        """Record the global model's validation (and optionally test) metrics for weights `version`."""
         self.global_metric = {
             "accuracy": accuracy,
             "loss": loss,
+            "version": version,
+            "test_accuracy": test_accuracy,
+            "test_loss": test_loss,
             "timestamp": datetime.utcnow().isoformat()
         }
+        if self.checkpointer is not None:
+            self.checkpointer.schedule(self)
 
     def get_global_metric(self):
         return self.global_metric if hasattr(self, 'global_metric') else None
 
-    def add_delta(self, delta):
-        self.deltas_buffer.append(delta)
+    def wait_global_metric(self, version: int, timeout: float = GLOBAL_METRIC_WAIT):
+        """The global metric, after waiting up to `timeout` seconds for the evaluator to reach `version`."""
+        if self.evaluator is not None:
+            self.evaluator.wait(self, version, timeout)
+        return self.get_global_metric()
+
+    @property
+    def delta_count(self) -> int:
+        return self.state.count
+
+    def set_compression(self, scheme: str, ratio=None):
+        """Choose the delta encoding clients of this group should use (see utils/compression.py)."""
+        self.compression = validate_config(scheme, ratio)
+
+    def get_compression(self):
+        with self._lock:
+            stats = dict(self.upload_stats)
+        stats['compression_ratio'] = stats['dense_bytes'] / stats['wire_bytes'] if stats['wire_bytes'] else None
+        return {**self.compression, 'stats': stats}
+
+    def set_aggregation(self, strategy: str, params=None):
+        """Choose how this group combines a round of deltas (see server/aggregation.py)."""
+        aggregator = make_aggregator(strategy, params)
+        with self.state.lock():
+            if self.state.count and aggregator.stacked != self.aggregator.stacked:
+                raise ValueError(f"{self.state.count} deltas are pending under {self.aggregator.name}; "
+                                 "aggregate or clear them first")
+            self.aggregator = aggregator
+
+    def set_async(self, config=None):
+        """Switch to buffered asynchronous aggregation with `config` (see validate_async), or back to synchronous with None."""
+        if config is not None:
+            try:
+                config = validate_async(**config)
+            except TypeError as e:
+                raise ValueError(f"Bad async settings: {e}") from None
+        with self.state.lock():
+            self.async_config = config
+            if config is not None and self.state.count:
+                self._after_add(config)
+
+    def get_aggregation(self):
+        with self._lock:
+            stats = dict(self.async_stats)
+        staleness_sum = stats.pop('staleness_sum')
+        stats['mean_staleness'] = staleness_sum / stats['updates'] if stats['updates'] else None
+        return {**self.aggregator.to_dict(), 'async': self.async_config, 'async_stats': stats}
+
+    def _dense_vector(self, delta, shapes) -> ParameterVector:
+        if isinstance(delta, ParameterVector) and delta.shapes == shapes:
+            return delta
+        if len(delta) != len(shapes):
+            raise ValueError(f"Expected {len(shapes)} layers, got {len(delta)}")
+        for shape, d in zip(shapes, delta):
+            if np.shape(d) != shape:
+                raise ValueError(f"Expected layer shape {shape}, got {np.shape(d)}")
+        return ParameterVector.from_layers(delta)
+
+    def add_delta(self, delta, compression=None, num_samples=None, base_version=None):
+        """Fold a client delta into the round.
+
+        `compression` names the scheme `delta` is encoded with; it must be the
+        group's negotiated scheme, or None/'none' for a dense delta.
+        `num_samples` is the client's training set size, which weights the
+        delta in mean-based strategies (1 when not given). Deltas are added to
+        running weighted sums with one vectorized call, or stacked as a row
+        when the group's strategy needs every delta.
+
+        `base_version` is the weights version the client trained from. In
+        asynchronous mode it sets the delta's staleness discount, and the
+        round is aggregated here once the buffer is full.
+        """
+        scheme = compression or 'none'
+        if scheme not in ('none', self.compression['scheme']):
+            raise ValueError(f"Group {self.group_name} does not accept {scheme} deltas")
+        weight = 1.0 if num_samples is None else float(num_samples)
+        if not weight > 0:
+            raise ValueError("num_samples must be positive")
+        # Includes the wait for the state lock, which is where concurrent uploads queue.
+        with span('group.add_delta', self.group_name), self.state.lock():
+            config = self.async_config
+            staleness = 0
+            if base_version is not None:
+                staleness = self.state.version - int(base_version)
+                if staleness < 0:
+                    raise ValueError(f"Unknown base version {base_version}")
+            if config is not None and config['max_staleness'] is not None and staleness > config['max_staleness']:
+                with self._lock:
+                    self.async_stats['dropped'] += 1
+                raise ValueError(f"Delta is {staleness} versions stale (max {config['max_staleness']})")
+            scale = weight
+            if config is not None:
+                scale *= staleness_weight(staleness, config['staleness_exponent'])
+
+            sums = self.state.accumulator_vector()
+            if self.aggregator.stacked:
+                if scheme != 'none':
+                    dense = decompress(scheme, delta, sums.shapes)
+                else:
+                    dense = self._dense_vector(delta, sums.shapes)
+                row = dense.data if scale == weight else (scale / weight) * dense.data
+                self.state.append_update(row, weight)
+            elif scheme != 'none':
+                decompress_into(scheme, delta, sums, scale=scale)
+            else:
+                dense = self._dense_vector(delta, sums.shapes)
+                if scale == 1.0:
+                    np.add(sums.data, dense.data, out=sums.data)
+                else:
+                    sums.data += scale * dense.data
+            self.state.count += 1
+            self.state.weight_total += weight
+            dense_bytes = sums.size * 4
+            if config is not None:
+                with self._lock:
+                    self.async_stats['updates'] += 1
+                    self.async_stats['staleness_sum'] += staleness
+                self._after_add(config)
+        with self._lock:
+            self.upload_stats['updates'] += 1
+            self.upload_stats['dense_bytes'] += dense_bytes
+            self.upload_stats['wire_bytes'] += payload_nbytes(delta) if scheme != 'none' else dense_bytes
 
     def clear_deltas(self):
-        self.deltas_buffer = []
+        with self.state.lock():
+            self._reset_deltas()
+
+    def _reset_deltas(self):
+        self.state.accumulator_vector().data.fill(0.0)
+        self.state.count = 0
+        self.state.weight_total = 0.0
+
+    def _round_update(self):
+        """The round's combined delta under the group's strategy; needs the state lock."""
+        if self.aggregator.stacked:
+            return self.aggregator.reduce_stack(*self.state.stacked_updates())
+        return self.aggregator.reduce_sums(self.state.accumulator_vector().data, self.state.weight_total)
+
+    def get_average_delta(self):
+        """Combined delta of everything received since the last clear, or None if there is nothing."""
+        with self.state.lock():
+            if self.state.count == 0:
+                return None
+            return ParameterVector(self._round_update(), self.state.shapes)
+
+    def _apply_round(self):
+        """Apply the round's combined delta and start a new round; needs the state lock and pending deltas."""
+        with span('group.aggregate', self.group_name):
+            current = self.state.read_weights()
+            updated = self.aggregator.step(current.data, self._round_update())
+            self.state.write_weights(ParameterVector(updated.astype(current.data.dtype), current.shapes))
+            self._reset_deltas()
+        self._on_new_weights()
+
+    def _after_add(self, config):
+        """Asynchronous mode: aggregate a full buffer, or arm the timeout for a pending round that has none.
+
+        The round may be older than its first delta: set_async can switch a
+        group that already holds several.
+        """
+        if self.state.count >= config['buffer_size']:
+            self._apply_round()
+            with self._lock:
+                self.async_stats['aggregations'] += 1
+        elif self.state.count and config['timeout'] is not None and self._timeout_version != self.state.version:
+            self._timeout_version = self.state.version
+            timer = threading.Timer(config['timeout'], self._on_timeout, args=(self.state.version,))
+            timer.daemon = True
+            timer.start()
 
-    def get_all_deltas(self):
-        return self.deltas_buffer
+    def _on_timeout(self, version):
+        with self.state.lock():
+            if self._timeout_version == version:
+                self._timeout_version = None
+            # Skip if the round already closed: the version moved on, or the group went synchronous.
+            if self.async_config is None or self.state.version != version or self.state.count == 0:
+                return
+            self._apply_round()
+        with self._lock:
+            self.async_stats['aggregations'] += 1
+            self.async_stats['timeouts'] += 1
+
+    def aggregate(self) -> bool:
+        """Apply the round's combined delta to the global weights and reset the round.
+
+        Returns False when there was nothing to aggregate.
+        """
+        with self.state.lock():
+            if self.state.count == 0:
+                return False
+            self._apply_round()
+            return True
     
-    def add_metric(self, metric):
-        self.metrics.append(metric)
+    def add_metric(self, metric) -> int:
+        return self.metrics.append(metric)
+
+    def get_metrics(self, since=None, limit=None, max_points=None):
+        """Retained metric records after `since`; see MetricsStore.query."""
+        return self.metrics.query(since, limit, max_points)['records']
+
+    def snapshot_meta(self) -> dict:
+        """The group's settings and history besides its weights, as JSON-ready values for a checkpoint.
+
+        Server optimizer moments (fedadam, fedyogi) are not included; they restart from zero.
+        """
+        with self._lock:
+            return {
+                'aggregation': self.aggregator.to_dict(),
+                'async': self.async_config,
+                'compression': dict(self.compression),
+                'global_metric': self.get_global_metric(),
+                'metrics': self.metrics.query()['records'],
+                'metrics_next_seq': self.metrics.next_seq,
+                'privacy': self.privacy.to_dict(),
+            }
+
+    def restore_meta(self, meta: dict):
+        """Apply what snapshot_meta() saved to a group that has no pending deltas yet."""
+        aggregation = dict(meta['aggregation'])
+        self.aggregator = make_aggregator(aggregation.pop('strategy'), aggregation)
+        self.async_config = meta['async']
+        self.compression = validate_config(meta['compression']['scheme'], meta['compression'].get('ratio'))
+        if meta['global_metric'] is not None:
+            self.global_metric = meta['global_metric']
+        privacy = PrivacyAccountant.from_dict(meta['privacy'])
+        self.metrics.restore(meta['metrics'], meta.get('metrics_next_seq'))
+        with self._lock:
+            self.privacy = privacy
+
+
+def initial_weights(group_name: str, input_dim: int, output_dim: int) -> ParameterVector:
+    """Starting weights for a group: its file in INITIAL_WEIGHTS_DIR if there is one, else a Glorot draw."""
+    shapes = layer_shapes(input_dim, output_dim)
+    path = os.path.join(INITIAL_WEIGHTS_DIR, f'{group_name}.weights') if INITIAL_WEIGHTS_DIR else None
+    if path is None or not os.path.exists(path):
+        return glorot_uniform(input_dim, output_dim)
+    with open(path, 'rb') as f:
+        weights = as_parameter_vector(decode_weights(f.read()))
+    if list(weights.shapes) != shapes:
+        raise ValueError(f"{path} holds weights of shapes {weights.shapes}, expected {shapes}")
+    return weights
+
+
+class GroupRegistry(Mapping):
+    """`{group_name: TrainingGroup}` for the groups declared in `dims`, built on first lookup.
+
+    Declaring a group costs nothing: its state backend and initial weights
+    (see initial_weights) are only created when a request first touches it,
+    and membership tests never build anything. Groups created elsewhere can
+    be registered by assignment. With a `checkpointer`, groups are restored
+    from their latest checkpoint when there is one, and checkpointed from then
+    on; with an `evaluator`, every new global model is evaluated on the server.
+    """
+    def __init__(self, dims: dict, checkpointer: Optional[Checkpointer] = None,
+                 evaluator: Optional[Evaluator] = None):
+        self.dims = dims
+        self.checkpointer = checkpointer
+        self.evaluator = evaluator
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def _create(self, group_name: str) -> TrainingGroup:
+        input_dim, output_dim = self.dims[group_name]
+        shapes = layer_shapes(input_dim, output_dim)
+        group = TrainingGroup(group_name, make_state(group_name, shapes))
+        checkpointer = self.checkpointer
+        snapshot = load_snapshot(checkpointer.directory, group_name) if checkpointer is not None else None
+        if snapshot is not None:
+            version, weights, meta = snapshot
+            if list(weights.shapes) != shapes:
+                raise ValueError(f"Checkpoint of {group_name} has shapes {weights.shapes}, expected {shapes}")
+            # Zero-copy with the in-memory backend: the published weights are the read-only mapping.
+            group.initialize_global_weights(weights, version)
+            group.restore_meta(meta)
+        # With the mmap backend another worker may already have seeded the shared weights.
+        elif group.get_version() == 0:
+            group.initialize_global_weights(initial_weights(group_name, input_dim, output_dim))
+        if checkpointer is not None:
+            checkpointer.watch(group)
+        group.evaluator = self.evaluator
+        metric = group.get_global_metric()
+        if self.evaluator is not None and (metric is None or metric['version'] != group.get_version()):
+            # Later versions are evaluated as they are published; this covers the one the group starts from.
+            self.evaluator.schedule(group)
+        return group
+
+    def __getitem__(self, group_name: str) -> TrainingGroup:
+        group = self._groups.get(group_name)
+        if group is not None:
+            return group
+        if group_name not in self.dims:
+            raise KeyError(group_name)
+        with self._lock:
+            if group_name not in self._groups:
+                self._groups[group_name] = self._create(group_name)
+            return self._groups[group_name]
+
+    def __setitem__(self, group_name: str, group: TrainingGroup):
+        with self._lock:
+            self._groups[group_name] = group
+
+    def __contains__(self, group_name) -> bool:
+        return group_name in self.dims or group_name in self._groups
+
+    def __iter__(self):
+        return iter(list(self.dims) + [name for name in self._groups if name not in self.dims])
+
+    def __len__(self) -> int:
+        return len(set(self.dims) | set(self._groups))
+
+    def loaded(self) -> list:
+        """Names of the groups built so far."""
+        return list(self._groups)
+
+    def __repr__(self):
+        return f"GroupRegistry({list(self)}, loaded={self.loaded()})"
 
 
-training_groups = {
-    "income": TrainingGroup("income"),
-    "credit": TrainingGroup("credit"),
-    "lsd": TrainingGroup("lsd"),
-    "smoking": TrainingGroup("smoking")
-}
 group_dims = {
     "income": (14, 2),
     "credit": (23, 3),
@@ -53,13 +515,11 @@ group_dims = {
     "smoking": (25, 2)
 }
 
-training_groups = {}
-for group_name, (input_dim, output_dim) in group_dims.items():
-    group = TrainingGroup(group_name)
-    model = BaseClassifier(input_dim=input_dim, output_dim=output_dim)
-    model.build(input_shape=(None, input_dim))
-    group.set_global_weights(model.get_weights())
-    training_groups[group_name] = group
+checkpointer = Checkpointer(CHECKPOINT_DIR, CHECKPOINT_KEEP, CHECKPOINT_INTERVAL) if CHECKPOINT_DIR else None
+
+evaluator = Evaluator() if SERVER_EVALUATION else None
+
+training_groups = GroupRegistry(group_dims, checkpointer, evaluator)
 
 if __name__ == "__main__":
     print(training_groups)
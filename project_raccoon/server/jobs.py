@@ -0,0 +1,108 @@
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+
+class JobLimitExceeded(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id: str, group_name: str, params: dict):
+        self.job_id = job_id
+        self.group_name = group_name
+        self.params = params
+        self.status = 'queued'
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('queued', 'running')
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.job_id,
+            'group_name': self.group_name,
+            'params': self.params,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobManager:
+    """Runs simulation jobs on a background thread pool.
+
+    `max_per_group` caps how many jobs (queued or running) one group may have
+    at a time; cancellation is cooperative through each job's `cancel_event`.
+    Only the newest `max_finished` finished, failed or cancelled jobs are kept
+    for `get()`; older ones are forgotten.
+    """
+    def __init__(self, max_workers: int = 2, max_per_group: int = 1, max_finished: int = 100):
+        self.max_per_group = max_per_group
+        self.max_finished = max_finished
+        self.jobs: Dict[str, Job] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sim-job')
+        self._lock = threading.Lock()
+
+    def submit(self, group_name: str, params: dict, fn: Callable[[threading.Event], None]) -> Job:
+        """Queue `fn(cancel_event)` for `group_name` or raise JobLimitExceeded."""
+        with self._lock:
+            active = sum(1 for j in self.jobs.values() if j.group_name == group_name and j.active)
+            if active >= self.max_per_group:
+                raise JobLimitExceeded(f"Group {group_name} already has {active} active job(s)")
+            job = Job(uuid.uuid4().hex, group_name, params)
+            self.jobs[job.job_id] = job
+            job.future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def _prune(self):
+        # Needs _lock. Jobs are kept in submission order, so the oldest go first.
+        finished = [job_id for job_id, job in self.jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    def _run(self, job: Job, fn):
+        with self._lock:
+            if job.cancel_event.is_set():
+                return
+            job.status = 'running'
+            job.started_at = datetime.now().isoformat()
+        try:
+            fn(job.cancel_event)
+            status, error = ('cancelled' if job.cancel_event.is_set() else 'finished'), None
+        except Exception as e:
+            traceback.print_exc()
+            status, error = ('cancelled' if job.cancel_event.is_set() else 'failed'), str(e)
+        with self._lock:
+            job.status = status
+            job.error = error
+            job.finished_at = datetime.now().isoformat()
+            self._prune()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued job outright or ask a running one to stop at its next checkpoint."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or not job.active:
+                return job
+            job.cancel_event.set()
+            if job.status == 'queued':
+                job.future.cancel()
+                job.status = 'cancelled'
+                job.finished_at = datetime.now().isoformat()
+                self._prune()
+            return job
@@ -0,0 +1,171 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Per-group metrics history. Records are flat dicts (see simulate.client_metrics)
+# kept column by column in ring buffers of `retention` rows: one numpy array
+# per key, int64 or float64 while a key only ever holds numbers, object
+# otherwise, plus a mask of which rows have the key. Every record gets a
+# sequence number `seq`, so readers page with `since` (the last seq they
+# hold) instead of re-downloading history, and locating a range is index
+# arithmetic rather than a scan. Downsampling averages float columns over
+# equal buckets of rows and keeps the last value of the others.
+
+
+def _kind(value) -> str:
+    if isinstance(value, (bool, np.bool_)):
+        return 'O'
+    if isinstance(value, (int, np.integer)):
+        return 'i8'
+    if isinstance(value, (float, np.floating)):
+        return 'f8'
+    return 'O'
+
+
+def _widen(a: str, b: str) -> str:
+    if a == b:
+        return a
+    if {a, b} == {'i8', 'f8'}:
+        return 'f8'
+    return 'O'
+
+
+class MetricsStore:
+    """Bounded, columnar `{seq: record}` history with cursor reads; thread-safe."""
+    def __init__(self, retention: int = 10_000):
+        if retention < 1:
+            raise ValueError("retention must be at least 1")
+        self.retention = retention
+        self._next = 0
+        self._columns: Dict[str, Tuple[str, np.ndarray, np.ndarray]] = {}
+        self._cond = threading.Condition()
+
+    @property
+    def next_seq(self) -> int:
+        return self._next
+
+    def __len__(self) -> int:
+        return min(self._next, self.retention)
+
+    def _column(self, name: str, kind: str):
+        column = self._columns.get(name)
+        if column is None:
+            column = (kind, np.zeros(self.retention, dtype=object if kind == 'O' else kind),
+                      np.zeros(self.retention, dtype=bool))
+        elif _widen(column[0], kind) != column[0]:
+            kind = _widen(column[0], kind)
+            column = (kind, column[1].astype(object if kind == 'O' else kind), column[2])
+        else:
+            return column
+        self._columns[name] = column
+        return column
+
+    def append(self, record: Dict) -> int:
+        """Store a record, overwriting the oldest once full; returns its seq."""
+        with self._cond:
+            seq = self._next
+            row = seq % self.retention
+            for _, _, present in self._columns.values():
+                present[row] = False
+            for name, value in record.items():
+                if name == 'seq':
+                    continue
+                _, values, present = self._column(name, _kind(value))
+                values[row] = value
+                present[row] = True
+            self._next += 1
+            self._cond.notify_all()
+            return seq
+
+    def _bounds(self, since: Optional[int], limit: Optional[int]) -> Tuple[int, int]:
+        """[start, end) seqs to read: the `limit` records after `since`, or the newest `limit` without it."""
+        oldest = max(0, self._next - self.retention)
+        if since is None:
+            start = oldest if limit is None else max(oldest, self._next - limit)
+            return start, self._next
+        start = max(since + 1, oldest)
+        end = self._next if limit is None else min(self._next, start + limit)
+        return start, max(start, end)
+
+    def _read(self, since, limit, max_points):
+        """(seqs, {name: (kind, values, present)}, bucket sizes or None) for a read, copied under the lock."""
+        with self._cond:
+            start, end = self._bounds(since, limit)
+            rows = np.arange(start, end) % self.retention
+            columns = {name: (kind, values[rows], present[rows])
+                       for name, (kind, values, present) in self._columns.items()}
+        seqs = np.arange(start, end)
+        if max_points is None or len(seqs) <= max_points:
+            return seqs, columns, None
+
+        edges = np.unique(np.linspace(0, len(seqs), max_points + 1).astype(np.int64))
+        starts, sizes = edges[:-1], np.diff(edges)
+        index = np.arange(len(seqs))
+        sampled = {}
+        for name, (kind, values, present) in columns.items():
+            if kind == 'f8':
+                counts = np.add.reduceat(present.astype(np.int64), starts)
+                sums = np.add.reduceat(np.where(present, values, 0.0), starts)
+                sampled[name] = (kind, sums / np.maximum(counts, 1), counts > 0)
+            else:
+                last = np.maximum.reduceat(np.where(present, index, -1), starts)
+                sampled[name] = (kind, values[np.maximum(last, 0)], last >= 0)
+        return seqs[edges[1:] - 1], sampled, sizes
+
+    def query(self, since: Optional[int] = None, limit: Optional[int] = None,
+              max_points: Optional[int] = None) -> Dict:
+        """Records after `since` (oldest first), at most `limit` of them, averaged down to `max_points` rows.
+
+        Without `since`, the newest `limit` records (all retained ones by
+        default). `next_since` is the cursor for the following read, and
+        `oldest` the first seq still retained; a reader whose cursor is older
+        than that has missed records. Downsampled rows carry `bucket_size`.
+        """
+        seqs, columns, sizes = self._read(since, limit, max_points)
+        lists = {name: (values.tolist(), present.tolist()) for name, (_, values, present) in columns.items()}
+        records = []
+        for i, seq in enumerate(seqs.tolist()):
+            record = {'seq': seq}
+            for name, (values, present) in lists.items():
+                if present[i]:
+                    record[name] = values[i]
+            if sizes is not None:
+                record['bucket_size'] = int(sizes[i])
+            records.append(record)
+        return {'records': records, **self._cursor(seqs, since)}
+
+    def query_columns(self, since: Optional[int] = None, limit: Optional[int] = None,
+                      max_points: Optional[int] = None) -> Dict:
+        """As query(), but `columns` maps each key to a list of values, None where a record lacks it."""
+        seqs, columns, sizes = self._read(since, limit, max_points)
+        out = {'seq': seqs.tolist()}
+        for name, (_, values, present) in columns.items():
+            if not present.any():
+                continue
+            if present.all():
+                out[name] = values.tolist()
+            else:
+                out[name] = [v if p else None for v, p in zip(values.tolist(), present.tolist())]
+        if sizes is not None:
+            out['bucket_size'] = sizes.tolist()
+        return {'columns': out, **self._cursor(seqs, since)}
+
+    def _cursor(self, seqs: np.ndarray, since: Optional[int]) -> Dict:
+        next_since = int(seqs[-1]) if len(seqs) else (since if since is not None else self._next - 1)
+        return {'next_since': next_since, 'oldest': max(0, self._next - self.retention)}
+
+    def wait(self, since: int, timeout: Optional[float] = None) -> bool:
+        """Block until there is a record after `since`; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._next - 1 > since, timeout)
+
+    def restore(self, records: List[Dict], next_seq: Optional[int] = None):
+        """Replace the contents with checkpointed `records`, numbered so that the last one is `next_seq - 1`."""
+        if next_seq is None:
+            next_seq = len(records)
+        records = records[-self.retention:]
+        with self._cond:
+            self._columns = {}
+            self._next = max(0, next_seq - len(records))
+        for record in records:
+            self.append(record)
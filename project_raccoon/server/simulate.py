@@ -1,85 +1,379 @@
-import requests
 import numpy as np
-import base64
-import pickle
-from models.base_model import BaseClassifier
+import multiprocessing
+import os
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from clients.datasets import make_dataset
+from clients.model_pool import model_pool
 from clients.trainer import ClientTrainer
+from clients.batched_trainer import BatchedClientTrainer
 from utils.partitioning import load_and_partition_dataset
+from utils.compression import Compressor, compression_report
+from utils import instrumentation
+from utils.instrumentation import span
+from utils.privacy import GaussianMechanism, PrivacyAccountant
+from server.transport import HttpTransport, make_transport
 from datetime import datetime
 import tensorflow as tf
 
-class Client:
-    def __init__(self, group_name, num_clients):
-        self.group_name = group_name
-        self.num_clients = num_clients
-        self.client_data, self.val_data, self.test_data = load_and_partition_dataset(f'data/{group_name}.csv', f'{group_name}', num_clients=num_clients)
-        self.X_val, self.y_val = self.val_data
-        self.X_test, self.y_test = self.test_data
-        self.input_dim = self.client_data[0][0].shape[1]
-        self.output_dim = len(np.unique(self.client_data[0][1]))
-        self.server_url = 'http://127.0.0.1:5000'
 
-    def serialize_weights(self,weights):
-        return base64.b64encode(pickle.dumps(weights)).decode('utf-8')
+@contextmanager
+def tf_thread_env(intra_op_threads: int, inter_op_threads: int):
+    """Export TensorFlow thread-pool sizes to processes spawned inside the block.
+
+    Spawned workers re-import the parent's main module, which may initialise
+    TensorFlow before the pool initializer runs, so the environment is the
+    only setting that is guaranteed to be read first.
+    """
+    saved = {k: os.environ.get(k) for k in ('TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS')}
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(intra_op_threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(inter_op_threads)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+_stop_event = None
+
+
+def init_worker(intra_op_threads: int, inter_op_threads: int, stop_event=None):
+    """Pin TensorFlow's thread pools so parallel workers don't oversubscribe the cores.
+
+    `stop_event`, if given, is set by the parent on cancellation; workers check it between clients.
+    """
+    global _stop_event
+    _stop_event = stop_event
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError:
+        # Already initialised from TF_NUM_*_THREADS set by tf_thread_env.
+        pass
+
+
+class SimulationCancelled(Exception):
+    pass
+
+
+def client_metrics(client_id, metrics, global_loss, global_accuracy):
+    record = {
+        'client_id': client_id+1,
+        'timestamp': datetime.now().isoformat(),
+        'accuracy': metrics['accuracy'],
+        'loss': metrics['loss'],
+    }
+    # Left out, not None, when there is no evaluation of the global model, so the metric columns stay numeric.
+    if global_accuracy is not None:
+        record.update(global_accuracy=global_accuracy, global_loss=global_loss)
+    return record
+
+
+def client_seed(seed, client_id, version):
+    """A client's own seed for one round, from the simulation's `seed`, its id and the weights version.
+
+    None when `seed` is None, leaving the client's Generator to OS entropy.
+    """
+    if seed is None:
+        return None
+    return int(np.random.SeedSequence([seed, client_id, version or 0]).generate_state(1)[0])
+
+
+_WAITED = object()
+
+
+def global_metrics(transport, global_evals=None, evaluate=None):
+    """(loss, accuracy) of the global weights last fetched through `transport`.
+
+    By default this is the server's own evaluation (server/evaluation.py),
+    waited for briefly; (None, None) if the server has none. With `evaluate`,
+    a callable returning (loss, accuracy), the client evaluates the weights
+    itself. Clients that fetched the same version share the result through
+    the `global_evals` dict, which also records a wait that came back empty so
+    the other clients of the round do not wait again.
+    """
+    version = transport.version
+    cached = global_evals.get(version) if global_evals is not None and version is not None else None
+    if cached is not None and cached is not _WAITED:
+        return cached
+    if evaluate is not None:
+        with span('client.global_evaluate'):
+            result = tuple(evaluate())
+    else:
+        with span('client.global_metric'):
+            # Only the first client of a version waits; the rest take whatever the server has by then.
+            metric = transport.get_global_metric(None if cached is _WAITED else version)
+        if metric is None or metric['version'] != version:
+            if global_evals is not None and version is not None:
+                global_evals.clear()
+                global_evals[version] = _WAITED
+            return (None, None) if metric is None else (metric['loss'], metric['accuracy'])
+        result = (metric['loss'], metric['accuracy'])
+    if global_evals is not None and version is not None:
+        # Versions only move forward, so older evaluations are never needed again.
+        global_evals.clear()
+        global_evals[version] = result
+    return result
+    if global_evals is not None and version is not None:
+        # Versions only move forward, so older evaluations are never needed again.
+        global_evals.clear()
+        global_evals[version] = result
+    return result
 
-    def deserialize_weights(self,encoded):
-        return pickle.loads(base64.b64decode(encoded.encode('utf-8')))
-    
-    def simulate(self):
-        for client_id in range(self.num_clients):
-            print(f"\n--- Client {client_id} ---")
 
-            X_train, y_train = self.client_data[client_id]
+def encode_delta(compressor, client_id, delta):
+    """Compress `delta` for upload; returns (payload, scheme, metrics about the compression)."""
+    if compressor is None or compressor.scheme == 'none':
+        return delta, 'none', {}
+    payload = compressor.compress(delta, client_id)
+    report = compression_report(delta, payload, compressor.scheme)
+    return payload, compressor.scheme, {'compression': compressor.scheme, **report}
 
-            res = requests.post(f'{self.server_url}/get_weights', json={'group_name': self.group_name})
-            data = res.json()
-            if data['status'] != 'success':
-                raise Exception("Failed to get weights from server")
 
-            global_weights = self.deserialize_weights(data['weights'])
+def train_and_submit(transport, client_id, train_data, val_data, input_dim, output_dim, compressor=None,
+                     mechanism=None, val_dataset=None, eval_every=None, global_evals=None, seed=None,
+                     client_global_eval=False):
+    """Run one simulated client: fetch global weights, train locally, report metrics and submit the delta.
 
-            model = BaseClassifier(input_dim=self.input_dim, output_dim=self.output_dim)
-            model.build(input_shape=(None, self.input_dim))
-            model.set_weights(global_weights)
-            model.compile(optimizer='adam', loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True), metrics=[tf.keras.metrics.SparseCategoricalAccuracy()])
-            global_loss, global_accuracy= model.evaluate(self.X_val, self.y_val)
+    The client shuffles and draws its noise from client_seed(seed, client_id, version).
 
+    `val_dataset` is the shared validation pipeline for `val_data`. The global
+    model's metrics come from the server, or with `client_global_eval` from
+    the client's own evaluation (see global_metrics).
+    """
+    print(f"\n--- Client {client_id} ---")
+
+    # Stages inside this span (and the trainer's) are filed under the client's group.
+    with span('client', transport.group_name):
+        X_train, y_train = train_data
+        if val_dataset is None:
+            val_dataset = make_dataset(*val_data)
+
+        with span('client.get_weights'):
+            global_weights = transport.get_weights()
+
+        # A pooled model is already built and compiled; the lease resets its optimizer.
+        with model_pool.lease(input_dim, output_dim, global_weights) as model:
+            version = transport.version
+            evaluate = (lambda: model.evaluate(val_dataset, verbose=0)) if client_global_eval else None
+            global_loss, global_accuracy = global_metrics(transport, global_evals, evaluate)
 
             trainer = ClientTrainer(
                 client_id=client_id,
                 model=model,
                 train_data=(X_train, y_train),
-                val_data=(self.X_val, self.y_val),
-                learning_rate=0.01,
+                val_data=val_data,
                 epochs=5,
-                batch_size=32
+                batch_size=32,
+                val_dataset=val_dataset,
+                eval_every=eval_every,
+                seed=client_seed(seed, client_id, version)
             )
 
             print("Training locally...")
             trainer.train()
             metrics = trainer.evaluate()
             print(f"Validation: Loss={metrics['loss']:.4f}, Acc={metrics['accuracy']:.4f}")
-            requests.post(f'{self.server_url}/log_metrics', json={
-            'group_name': self.group_name,
-            'metrics': {
-                'client_id': client_id+1,
-                'timestamp': datetime.now().isoformat(),
-                'accuracy': metrics['accuracy'],
-                'loss': metrics['loss'],
-                'global_accuracy': global_accuracy,
-                'global_loss': global_loss
-            }
-        })
-
-            delta = trainer.get_weight_deltas(global_weights)
-            encoded_delta = self.serialize_weights(delta)
-            res = requests.post(f'{self.server_url}/submit_update', json={
-                'group_name': self.group_name,
-                'delta': encoded_delta
-            })
-            print("Update submission:", res.json())
-
-        print("\n--- Aggregating updates on server ---")
-        res = requests.post(f'{self.server_url}/aggregate', json={'group_name': self.group_name})
-        print(res.json())
-    
+
+            delta = trainer.get_weight_deltas(global_weights, mechanism=mechanism)
+        with span('client.compress'):
+            payload, scheme, report = encode_delta(compressor, client_id, delta)
+        if mechanism is not None:
+            report['dp_sigma'] = mechanism.sigma
+        with span('client.log_metrics'):
+            transport.log_metrics({**client_metrics(client_id, metrics, global_loss, global_accuracy), **report})
+        with span('client.submit_update'):
+            result = transport.submit_update(payload, scheme, len(y_train))
+    print("Update submission:", result)
+
+
+def train_client_slice(group_name, server_url, clients, val_data, input_dim, output_dim, compression=None,
+                       dp=None, eval_every=None, profile=False, seed=None, client_global_eval=False):
+    """Process-pool entry point: train a slice of `(client_id, train_data)` pairs in order.
+
+    Workers live in their own processes, so they always reach the server over HTTP,
+    and keep their own top-k residuals, validation pipeline and global evaluations
+    for the length of the slice. With `profile`, returns the worker's spans
+    (utils.instrumentation.export) for the parent to merge, else None.
+    """
+    # A pool worker may run several slices; each returns only its own spans.
+    instrumentation.reset()
+    instrumentation.enable(profile)
+    transport = HttpTransport(group_name, server_url)
+    compressor = Compressor(compression['scheme'], compression.get('ratio')) if compression else None
+    mechanism = GaussianMechanism(**dp) if dp else None
+    val_dataset = make_dataset(*val_data)
+    global_evals = {}
+    for client_id, train_data in clients:
+        if _stop_event is not None and _stop_event.is_set():
+            break
+        train_and_submit(transport, client_id, train_data, val_data, input_dim, output_dim, compressor, mechanism,
+                         val_dataset, eval_every, global_evals, seed, client_global_eval)
+    return instrumentation.export() if profile else None
+
+
+class Client:
+    def __init__(self, group_name, num_clients, workers=1, intra_op_threads=1, inter_op_threads=1,
+                 engine='keras', client_batch=256, transport='http', streaming=False,
+                 partitioner='iid', partition_args=None, compression=None, dp=None, accountant=None,
+                 eval_every=None, seed=None, client_global_eval=False):
+        if engine not in ('keras', 'batched'):
+            raise ValueError(f"Unknown simulation engine: {engine}")
+        self.group_name = group_name
+        self.num_clients = num_clients
+        self.engine = engine
+        self.client_batch = client_batch
+        self.workers = max(1, min(workers, num_clients))
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        with span('simulate.load_dataset', group_name):
+            self.client_data, self.val_data, self.test_data = load_and_partition_dataset(
+                f'data/{group_name}.csv', f'{group_name}', num_clients=num_clients, streaming=streaming,
+                partitioner=partitioner, partition_args=partition_args)
+        # Skewed partitioners can leave clients with no samples; they sit the round out.
+        self.client_ids = [cid for cid, size in enumerate(self.client_data.sizes()) if size > 0]
+        self.X_val, self.y_val = self.val_data
+        # Built once and shared by every client this process trains.
+        self.val_dataset = make_dataset(self.X_val, self.y_val)
+        # Validate inside fit every `eval_every` epochs; None means after the last epoch only.
+        self.eval_every = eval_every
+        self.global_evals = {}
+        self.X_test, self.y_test = self.test_data
+        self.input_dim = self.client_data.X.shape[1]
+        self.output_dim = len(np.unique(self.client_data.y))
+        self.server_url = 'http://127.0.0.1:5000'
+        self.transport = make_transport(transport, group_name, self.server_url)
+        self.cancel_event = None
+        # None negotiates the group's scheme at the start of every round.
+        self.compression = compression
+        self.compressor = None
+        # Optional client-level differential privacy: GaussianMechanism keyword arguments,
+        # e.g. {'clip_norm': 1.0, 'epsilon': 1.0, 'delta': 1e-5}.
+        self.dp = dp
+        self.mechanism = GaussianMechanism(**dp) if dp else None
+        self.accountant = accountant if accountant is not None else PrivacyAccountant()
+        # Makes runs reproducible; each client is seeded from it, its id and the round's weights version.
+        self.seed = seed
+        # The server evaluates every global model; clients only repeat that when asked to.
+        self.client_global_eval = client_global_eval
+
+    def simulate(self, cancel_event=None):
+        """Run one round and aggregate it.
+
+        If `cancel_event` is set mid-round, stops at the next client boundary,
+        discards the deltas already submitted this round and raises
+        SimulationCancelled without aggregating.
+        """
+        self.cancel_event = cancel_event
+        try:
+            self._round()
+        except SimulationCancelled:
+            # Left pending, they would be folded into whichever round aggregates next.
+            self.transport.clear_deltas()
+            raise
+
+    def _round(self):
+        with span('simulate.round', self.group_name):
+            with span('simulate.negotiate'):
+                self._negotiate_compression()
+            if self.engine == 'batched':
+                self._simulate_batched()
+            elif self.workers == 1:
+                for client_id in self.client_ids:
+                    self._check_cancelled()
+                    train_and_submit(self.transport, client_id, self.client_data[client_id],
+                                     self.val_data, self.input_dim, self.output_dim, self.compressor,
+                                     self.mechanism, self.val_dataset, self.eval_every, self.global_evals,
+                                     self.seed, self.client_global_eval)
+            else:
+                self._simulate_parallel()
+            self._check_cancelled()
+            if self.mechanism is not None:
+                for client_id in self.client_ids:
+                    self.accountant.spend(client_id, self.mechanism.rho)
+                print("Privacy budget:", self.accountant.summary())
+
+            print("\n--- Aggregating updates on server ---")
+            with span('simulate.aggregate'):
+                result = self.transport.aggregate()
+        print(result)
+
+    def _negotiate_compression(self):
+        config = self.compression or self.transport.get_compression()
+        scheme, ratio = config['scheme'], config.get('ratio')
+        # Reuse the compressor while the scheme is unchanged so top-k residuals carry over between rounds.
+        if self.compressor is None or (self.compressor.scheme, self.compressor.ratio) != (scheme, ratio):
+            self.compressor = Compressor(scheme, ratio)
+
+    def _check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise SimulationCancelled(f"Simulation for group {self.group_name} cancelled")
+
+    def _simulate_parallel(self):
+        # Round-robin slices keep per-worker load even when the last shard is larger.
+        slices = [[(cid, self.client_data[cid]) for cid in self.client_ids[w::self.workers]]
+                  for w in range(self.workers)]
+        # TensorFlow is not fork-safe once initialised, so workers are spawned fresh.
+        ctx = multiprocessing.get_context('spawn')
+        stop = ctx.Event()
+        with tf_thread_env(self.intra_op_threads, self.inter_op_threads), \
+                ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, initializer=init_worker,
+                                    initargs=(self.intra_op_threads, self.inter_op_threads, stop)) as pool:
+            futures = [pool.submit(train_client_slice, self.group_name, self.server_url, clients,
+                                   self.val_data, self.input_dim, self.output_dim,
+                                   {'scheme': self.compressor.scheme, 'ratio': self.compressor.ratio}, self.dp,
+                                   self.eval_every, instrumentation.enabled(), self.seed,
+                                   self.client_global_eval)
+                       for clients in slices]
+            for future in futures:
+                while self.cancel_event is not None and not future.done():
+                    if self.cancel_event.wait(0.5):
+                        # Running slices stop after their current client; wait for them, so none
+                        # submits after the round's deltas are discarded.
+                        stop.set()
+                        pool.shutdown(wait=True, cancel_futures=True)
+                        self._check_cancelled()
+                exported = future.result()
+                if exported is not None:
+                    instrumentation.merge(exported)
+
+    def _simulate_batched(self):
+        with span('client.get_weights'):
+            global_weights = self.transport.get_weights()
+        for start in range(0, len(self.client_ids), self.client_batch):
+            self._check_cancelled()
+            client_ids = self.client_ids[start:start + self.client_batch]
+            print(f"\n--- Clients {client_ids[0]}-{client_ids[-1]} (batched) ---")
+            # learning_rate matches the Keras path, which compiles with the default Adam.
+            seeds = None
+            if self.seed is not None:
+                seeds = [client_seed(self.seed, cid, self.transport.version) for cid in client_ids]
+            trainer = BatchedClientTrainer(global_weights, [self.client_data[cid] for cid in client_ids],
+                                           self.val_data, learning_rate=0.001, epochs=5, batch_size=32,
+                                           seed=seeds)
+            def evaluate():
+                # Every client starts from the same weights, so one evaluation covers them all.
+                first = trainer.evaluate()[0]
+                return first['loss'], first['accuracy']
+            global_loss, global_accuracy = global_metrics(self.transport, self.global_evals,
+                                                          evaluate if self.client_global_eval else None)
+            with span('batched.fit'):
+                trainer.train()
+            with span('batched.deltas'):
+                deltas = trainer.get_weight_deltas(global_weights, mechanism=self.mechanism)
+            with span('batched.evaluate'):
+                client_evals = trainer.evaluate()
+            for cid, metrics, delta, size in zip(client_ids, client_evals, deltas, trainer.sizes):
+                with span('client.compress'):
+                    payload, scheme, report = encode_delta(self.compressor, cid, delta)
+                if self.mechanism is not None:
+                    report['dp_sigma'] = self.mechanism.sigma
+                with span('client.log_metrics'):
+                    self.transport.log_metrics({**client_metrics(cid, metrics, global_loss, global_accuracy),
+                                                **report})
+                with span('client.submit_update'):
+                    self.transport.submit_update(payload, scheme, size)
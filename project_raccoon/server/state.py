@@ -0,0 +1,250 @@
+import math
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Optional, Sequence, Tuple
+import numpy as np
+from utils.parameters import ParameterVector, as_parameter_vector
+
+try:
+    import fcntl
+except ImportError:  # Windows: MmapState is unavailable, the in-memory backend still works.
+    fcntl = None
+
+Shape = Tuple[int, ...]
+
+
+class InMemoryState:
+    """Default backend: weights and delta accumulators live in this process."""
+    def __init__(self, group_name: str, shapes: Optional[Sequence[Shape]] = None):
+        self.group_name = group_name
+        self.shapes = [tuple(s) for s in shapes] if shapes is not None else None
+        self.count = 0
+        self.weight_total = 0.0
+        # (version, weights) swapped as one reference so readers always see a matching pair.
+        self._published = (0, None)
+        self._sums = None
+        # Row i holds the i-th delta of the round when the strategy needs them all.
+        self._stack = None
+        self._stack_weights = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lock(self):
+        with self._lock:
+            yield
+
+    def initialize(self, weights, version: int = 1) -> bool:
+        """Seed the weights, as `version`, unless some other caller already has. Returns True if seeded."""
+        with self.lock():
+            if self.version:
+                return False
+            self.write_weights(weights)
+            self._published = (version, self._published[1])
+            return True
+
+    @property
+    def version(self) -> int:
+        return self._published[0]
+
+    def read_weights(self) -> Optional[ParameterVector]:
+        return self._published[1]
+
+    def read_versioned(self) -> Tuple[int, Optional[ParameterVector]]:
+        return self._published
+
+    def write_weights(self, weights):
+        """Publish new weights; callers must hold the lock and not modify them afterwards."""
+        weights = as_parameter_vector(weights)
+        self.shapes = weights.shapes
+        self._published = (self._published[0] + 1, weights)
+
+    def accumulator_vector(self) -> ParameterVector:
+        """Flat float64 delta sums, updated in place under the lock."""
+        if self._sums is None:
+            self._sums = ParameterVector.zeros(self.shapes, dtype=np.float64)
+        return self._sums
+
+    def append_update(self, delta: np.ndarray, weight: float):
+        """Store a flat delta as row `count` of the update stack; callers must hold the lock."""
+        n = self.count
+        if self._stack is None or n == len(self._stack):
+            capacity = max(8, 2 * n)
+            stack = np.empty((capacity, sum(math.prod(s) for s in self.shapes)), dtype=np.float32)
+            weights = np.empty(capacity, dtype=np.float64)
+            if n:
+                stack[:n] = self._stack[:n]
+                weights[:n] = self._stack_weights[:n]
+            self._stack, self._stack_weights = stack, weights
+        self._stack[n] = delta
+        self._stack_weights[n] = weight
+
+    def stacked_updates(self) -> Tuple[np.ndarray, np.ndarray]:
+        """([count, P] deltas, [count] weights) appended this round."""
+        if self._stack is None:
+            return np.empty((0, 0), dtype=np.float32), np.empty(0)
+        return self._stack[:self.count], self._stack_weights[:self.count]
+
+
+class MmapState:
+    """Backend shared by every worker process on the host through one mmapped file per group.
+
+    Layout: a 64-byte header (magic, version, active slot, delta count, parameter
+    count, total delta weight), two float32 weight slots and one float64
+    accumulator. Writers take an flock on the file; readers copy the active slot
+    lock-free and retry if the version moved underneath them. Strategies that
+    need every delta stack them in a second file, `<group>.updates`, one float32
+    row per delta with its weight in the last column, grown under the same lock.
+
+    Only the weights, version and pending deltas live in the file. The rest of a
+    TrainingGroup (compression, aggregation strategy, async config, metrics,
+    global metric, privacy accountant) stays in each worker process, so start
+    every worker with the same RACCOON_* settings and do not change them per
+    group at runtime.
+    """
+    MAGIC = b'RCSTATE1'
+    _HEADER_SIZE = 64
+    _VERSION, _ACTIVE, _COUNT, _NPARAMS = range(4)
+    _WEIGHT_OFFSET = 40
+
+    def __init__(self, group_name: str, shapes: Sequence[Shape], directory: str):
+        if fcntl is None:
+            raise ValueError("The mmap state backend needs fcntl (Linux or macOS); "
+                             "use RACCOON_STATE_BACKEND=memory on this platform")
+        self.group_name = group_name
+        self.shapes = [tuple(s) for s in shapes]
+        self._sizes = [math.prod(s) for s in self.shapes]
+        nparams = sum(self._sizes)
+        slot_bytes = nparams * 4 + (-nparams * 4) % 8
+        total = self._HEADER_SIZE + 2 * slot_bytes + nparams * 8
+
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{group_name}.state')
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._updates_fd = os.open(os.path.join(directory, f'{group_name}.updates'), os.O_RDWR | os.O_CREAT, 0o644)
+        self._updates_mm = None
+        self._nparams = nparams
+        self._thread_lock = threading.Lock()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            size = os.fstat(self._fd).st_size
+            if size == 0:
+                os.ftruncate(self._fd, total)
+            elif size != total:
+                raise ValueError(f"State file {self.path} does not match the model shapes")
+            self._mm = mmap.mmap(self._fd, total)
+            if size == 0:
+                self._mm[:8] = self.MAGIC
+                struct.pack_into('<Q', self._mm, 8 + 8 * self._NPARAMS, nparams)
+            elif self._mm[:8] != self.MAGIC:
+                raise ValueError(f"{self.path} is not a group state file")
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        self._header = np.ndarray((4,), dtype='<u8', buffer=self._mm, offset=8)
+        self._weight_total = np.ndarray((1,), dtype='<f8', buffer=self._mm, offset=self._WEIGHT_OFFSET)
+        offset = self._HEADER_SIZE
+        self._slots = []
+        for _ in range(2):
+            self._slots.append(np.ndarray((nparams,), dtype='<f4', buffer=self._mm, offset=offset))
+            offset += slot_bytes
+        self._sums = np.ndarray((nparams,), dtype='<f8', buffer=self._mm, offset=offset)
+
+    @contextmanager
+    def lock(self):
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @property
+    def version(self) -> int:
+        return int(self._header[self._VERSION])
+
+    @property
+    def count(self) -> int:
+        return int(self._header[self._COUNT])
+
+    @count.setter
+    def count(self, value: int):
+        self._header[self._COUNT] = value
+
+    @property
+    def weight_total(self) -> float:
+        return float(self._weight_total[0])
+
+    @weight_total.setter
+    def weight_total(self, value: float):
+        self._weight_total[0] = value
+
+    def initialize(self, weights, version: int = 1) -> bool:
+        with self.lock():
+            if self.version:
+                return False
+            self.write_weights(weights)
+            self._header[self._VERSION] = version
+            return True
+
+    def read_weights(self) -> Optional[ParameterVector]:
+        return self.read_versioned()[1]
+
+    def read_versioned(self) -> Tuple[int, Optional[ParameterVector]]:
+        while True:
+            version = self.version
+            if version == 0:
+                return 0, None
+            flat = self._slots[int(self._header[self._ACTIVE])].copy()
+            if self.version == version:
+                return version, ParameterVector(flat, self.shapes)
+
+    def write_weights(self, weights):
+        """Fill the inactive slot, then flip it live; callers must hold the lock."""
+        target = 1 - int(self._header[self._ACTIVE])
+        slot = ParameterVector(self._slots[target], self.shapes)
+        if isinstance(weights, ParameterVector):
+            slot.data[:] = weights.data
+        else:
+            for dst, w in zip(slot, weights):
+                dst[...] = w
+        self._header[self._ACTIVE] = target
+        self._header[self._VERSION] += 1
+
+    def accumulator_vector(self) -> ParameterVector:
+        return ParameterVector(self._sums, self.shapes)
+
+    def _update_rows(self, rows: int) -> np.ndarray:
+        """The first `rows` rows of the update file as a [rows, P + 1] array, growing the file if needed."""
+        row_bytes = (self._nparams + 1) * 4
+        size = os.fstat(self._updates_fd).st_size
+        if size < rows * row_bytes:
+            size = max(rows, 2 * (size // row_bytes), 8) * row_bytes
+            os.ftruncate(self._updates_fd, size)
+        if self._updates_mm is None or len(self._updates_mm) != size:
+            # Another process may have grown the file; views of the old map keep it alive.
+            self._updates_mm = mmap.mmap(self._updates_fd, size)
+        return np.ndarray((size // row_bytes, self._nparams + 1), dtype='<f4', buffer=self._updates_mm)[:rows]
+
+    def append_update(self, delta: np.ndarray, weight: float):
+        row = self._update_rows(self.count + 1)[-1]
+        row[:-1] = delta
+        row[-1] = weight
+
+    def stacked_updates(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.count == 0:
+            return np.empty((0, self._nparams), dtype=np.float32), np.empty(0)
+        rows = self._update_rows(self.count)
+        return rows[:, :-1], rows[:, -1].astype(np.float64)
+
+
+def make_state(group_name: str, shapes: Sequence[Shape]):
+    """Build the backend selected by RACCOON_STATE_BACKEND ('memory' or 'mmap')."""
+    backend = os.environ.get('RACCOON_STATE_BACKEND', 'memory')
+    if backend == 'memory':
+        return InMemoryState(group_name, shapes)
+    if backend == 'mmap':
+        return MmapState(group_name, shapes, os.environ.get('RACCOON_STATE_DIR', 'state'))
+    raise ValueError(f"Unknown state backend: {backend}")
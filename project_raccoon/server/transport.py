@@ -0,0 +1,170 @@
+import requests
+from utils.compression import decompress
+from utils.instrumentation import count, span
+from utils.parameters import ParameterVector, as_parameter_vector
+from utils.serialization import CONTENT_TYPE, encode_weights, decode_weights
+
+
+class HttpTransport:
+    """Talks to a Project Raccoon server over HTTP, for clients outside the server process.
+
+    The last weights fetched are kept with their ETag, so repeat fetches of an
+    unchanged version cost a 304. With `diff` set to a lossy compression
+    scheme, fetches after an aggregation ask for the change from the held
+    version only. Weights rebuilt that way approximate their version and the
+    error adds up with each diff, so after `resync_every` diffs the next fetch
+    downloads the exact weights again.
+    """
+    def __init__(self, group_name, server_url='http://127.0.0.1:5000', diff=None, resync_every=4):
+        self.group_name = group_name
+        self.server_url = server_url
+        self.diff = diff
+        self.resync_every = resync_every
+        self.session = requests.Session()
+        self.version = None
+        # Diffs applied since the last full download; 0 means the held weights are exact.
+        self.diff_hops = 0
+        self._etag = None
+        self._weights = None
+
+    def get_weights(self):
+        body = {'group_name': self.group_name}
+        headers = {'Accept': CONTENT_TYPE}
+        if self._weights is not None and self.diff_hops < self.resync_every:
+            headers['If-None-Match'] = self._etag
+            if self.diff is not None:
+                body.update(since_version=self.version, diff=self.diff)
+        res = self.session.post(f'{self.server_url}/get_weights', json=body, headers=headers)
+        if res.status_code == 304:
+            return self._weights
+        if res.status_code != 200:
+            raise Exception("Failed to get weights from server")
+
+        count('transport.bytes_in', len(res.content), self.group_name)
+        with span('transport.decode', self.group_name):
+            payload = decode_weights(res.content)
+            if 'X-Weights-Diff-From' in res.headers:
+                diff = decompress(res.headers['X-Weights-Compression'], payload, self._weights.shapes)
+                weights = ParameterVector(self._weights.data + diff.data, diff.shapes)
+                self.diff_hops += 1
+            else:
+                weights = as_parameter_vector(payload)
+                self.diff_hops = 0
+        self.version = int(res.headers['X-Weights-Version'])
+        self._etag = res.headers['ETag']
+        self._weights = weights
+        return weights
+
+    def log_metrics(self, metrics):
+        self.session.post(f'{self.server_url}/log_metrics', json={
+            'group_name': self.group_name,
+            'metrics': metrics
+        })
+
+    def get_global_metric(self, version=None):
+        """The server's evaluation of the global model, waiting briefly for `version`'s; None if there is none."""
+        params = {'group_name': self.group_name}
+        if version is not None:
+            params['version'] = version
+        res = self.session.get(f'{self.server_url}/global_metric', params=params)
+        if res.status_code != 200:
+            raise Exception("Failed to get the global metric from server")
+        return res.json()['global_metric']
+
+    def get_compression(self):
+        res = self.session.get(f'{self.server_url}/compression', params={'group_name': self.group_name})
+        if res.status_code != 200:
+            raise Exception("Failed to get compression settings from server")
+        return res.json()['compression']
+
+    def submit_update(self, delta, compression=None, num_samples=None, base_version=None):
+        """Send a dense delta, or a payload encoded with `compression` (see utils/compression.py).
+
+        `num_samples` is the client's training set size, used to weight its delta.
+        `base_version` is the weights version it was trained from, by default the
+        version last fetched.
+        """
+        params = {'group_name': self.group_name}
+        if num_samples is not None:
+            params['num_samples'] = int(num_samples)
+        if base_version is None:
+            base_version = self.version
+        if base_version is not None:
+            params['base_version'] = base_version
+        with span('transport.encode', self.group_name):
+            if compression and compression != 'none':
+                params['compression'] = compression
+                body = encode_weights(delta, dtype=None)
+            else:
+                body = encode_weights(delta)
+        count('transport.bytes_out', len(body), self.group_name)
+        res = self.session.post(f'{self.server_url}/submit_update', params=params, data=body,
+                                headers={'Content-Type': CONTENT_TYPE})
+        return res.json()
+
+    def aggregate(self):
+        res = self.session.post(f'{self.server_url}/aggregate', json={'group_name': self.group_name})
+        return res.json()
+
+    def clear_deltas(self):
+        res = self.session.post(f'{self.server_url}/exit', json={'group_name': self.group_name})
+        return res.json()
+
+
+class InProcessTransport:
+    """Calls the TrainingGroup directly, for simulations running inside the server process.
+
+    Weights and deltas are passed by reference; nothing is serialized.
+    """
+    def __init__(self, group_name, group=None):
+        if group is None:
+            from server.groups import training_groups
+            if group_name not in training_groups:
+                raise ValueError(f"Invalid group: {group_name}")
+            group = training_groups[group_name]
+        self.group_name = group_name
+        self.group = group
+        self.version = None
+
+    def get_weights(self):
+        version, weights = self.group.get_versioned_weights()
+        if weights is None:
+            raise Exception("Model not yet initialized")
+        self.version = version
+        return weights
+
+    def log_metrics(self, metrics):
+        self.group.add_metric(metrics)
+
+    def get_global_metric(self, version=None):
+        if version is None:
+            return self.group.get_global_metric()
+        return self.group.wait_global_metric(version)
+
+    def get_compression(self):
+        return self.group.get_compression()
+
+    def submit_update(self, delta, compression=None, num_samples=None, base_version=None):
+        try:
+            self.group.add_delta(delta, compression, num_samples,
+                                 base_version if base_version is not None else self.version)
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+        return {"status": "success", "message": "Delta received"}
+
+    def aggregate(self):
+        if not self.group.aggregate():
+            return {"status": "error", "message": "No updates to aggregate"}
+        return {"status": "success", "message": "Global model updated"}
+
+    def clear_deltas(self):
+        self.group.clear_deltas()
+        return {"status": "success", "message": f"Client exited group {self.group_name}"}
+
+
+def make_transport(kind, group_name, server_url='http://127.0.0.1:5000'):
+    if kind == 'http':
+        return HttpTransport(group_name, server_url)
+    if kind == 'inprocess':
+        return InProcessTransport(group_name)
+    raise ValueError(f"Unknown transport: {kind}")
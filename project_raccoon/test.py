@@ -1,6 +1,6 @@
 import requests
 import numpy as np
-from models.base_model import BaseClassifier
+from clients.model_pool import model_pool
 from clients.trainer import ClientTrainer
 from utils.partitioning import load_and_partition_dataset
 from server.app import serialize_weights, deserialize_weights
@@ -33,9 +33,7 @@ for client_id in range(num_clients):
     
     global_weights = deserialize_weights(data['weights'])
 
-    model = BaseClassifier(input_dim=input_dim, output_dim=output_dim)
-    model.build(input_shape=(None, input_dim))
-    model.set_weights(global_weights)
+    model = model_pool.acquire(input_dim, output_dim, global_weights)
 
     trainer = ClientTrainer(
         client_id=client_id,
@@ -60,7 +58,8 @@ for client_id in range(num_clients):
     }
 })
     delta = trainer.get_weight_deltas(global_weights)
-    encoded_delta = serialize_weights(delta)
+    encoded_delta = serialize_weights(list(delta))
+    model_pool.release(input_dim, output_dim, model)
     res = requests.post(f'{server_url}/submit_update', json={
         'group_name': group_name,
         'delta': encoded_delta
@@ -0,0 +1,179 @@
+import math
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+from utils.parameters import ParameterVector, as_parameter_vector, layer_views
+
+# Lossy encodings for client deltas. A compressed delta is a flat list of
+# arrays, a fixed number per layer, so it travels in the ordinary binary
+# weight format (utils/serialization.py, with dtype=None). Schemes:
+#   none   [float32 values]
+#   fp16   [float16 values]
+#   q8/q4  [float32 (min, step), uint8 codes]  stochastic rounding to 256/16
+#          levels per layer, unbiased; q4 packs two codes per byte
+#   topk   [int32 flat indices, float32 values]  the `ratio` largest-magnitude
+#          entries, with error feedback: what a client leaves out is added back
+#          into its next delta
+# The server never materialises a dense float32 delta: decompress_into adds
+# the payload straight into the float64 accumulators. Dense deltas given as a
+# ParameterVector are cast and residual-corrected as one flat buffer.
+
+ARRAYS_PER_LAYER = {'none': 1, 'fp16': 1, 'q8': 2, 'q4': 2, 'topk': 2}
+SCHEMES = tuple(ARRAYS_PER_LAYER)
+_BITS = {'q8': 8, 'q4': 4}
+
+
+def validate_config(scheme: str, ratio: Optional[float] = None) -> Dict:
+    """Normalised compression config for a group, or ValueError."""
+    if scheme not in ARRAYS_PER_LAYER:
+        raise ValueError(f"Unknown compression scheme: {scheme}")
+    config = {'scheme': scheme}
+    if scheme == 'topk':
+        ratio = 0.01 if ratio is None else float(ratio)
+        if not 0 < ratio <= 1:
+            raise ValueError("topk ratio must be in (0, 1]")
+        config['ratio'] = ratio
+    return config
+
+
+class Compressor:
+    """Client-side encoder for one scheme.
+
+    Keeps a per-client residual for top-k error feedback, so reuse one
+    Compressor for the same clients across rounds.
+    """
+    def __init__(self, scheme: str = 'none', ratio: Optional[float] = None, seed=None):
+        config = validate_config(scheme, ratio)
+        self.scheme = scheme
+        self.ratio = config.get('ratio')
+        self.rng = np.random.default_rng(seed)
+        self.residuals: Dict[object, np.ndarray] = {}
+
+    def compress(self, delta: Sequence[np.ndarray], client_id=None) -> List[np.ndarray]:
+        if self.scheme == 'topk':
+            return self._topk(delta, client_id)
+        if self.scheme == 'fp16' and isinstance(delta, ParameterVector):
+            return layer_views(delta.data.astype(np.float16), delta.shapes)
+        payload = []
+        for d in delta:
+            d = np.asarray(d, dtype=np.float32)
+            if self.scheme == 'none':
+                payload.append(d)
+            elif self.scheme == 'fp16':
+                payload.append(d.astype(np.float16))
+            else:
+                payload.extend(self._quantize(d.reshape(-1), _BITS[self.scheme]))
+        return payload
+
+    def _quantize(self, x: np.ndarray, bits: int) -> List[np.ndarray]:
+        levels = (1 << bits) - 1
+        lo = float(x.min()) if x.size else 0.0
+        hi = float(x.max()) if x.size else 0.0
+        step = (hi - lo) / levels or 1.0
+        scaled = (x - lo) / step
+        # floor(v + u) with u ~ U[0, 1) rounds up with probability frac(v): unbiased.
+        scaled += self.rng.random(x.size, dtype=np.float32)
+        codes = np.clip(np.floor(scaled), 0, levels).astype(np.uint8)
+        if bits == 4:
+            if codes.size % 2:
+                codes = np.append(codes, np.uint8(0))
+            codes = codes[0::2] | (codes[1::2] << 4)
+        return [np.array([lo, step], dtype=np.float32), codes]
+
+    def _topk(self, delta: Sequence[np.ndarray], client_id) -> List[np.ndarray]:
+        x = ParameterVector.from_layers(delta)
+        residual = self.residuals.get(client_id)
+        if residual is not None:
+            x.data += residual
+        payload = []
+        for layer in x:
+            flat = layer.reshape(-1)
+            k = max(1, math.ceil(self.ratio * flat.size))
+            idx = np.argpartition(np.abs(flat), flat.size - k)[flat.size - k:].astype(np.int32)
+            payload.extend([idx, flat[idx]])
+            flat[idx] = 0.0
+        self.residuals[client_id] = x.data
+        return payload
+
+
+def split_layers(scheme: str, payload: Sequence[np.ndarray], num_layers: int) -> List[Sequence[np.ndarray]]:
+    per_layer = ARRAYS_PER_LAYER[scheme]
+    if len(payload) != per_layer * num_layers:
+        raise ValueError(f"Expected {per_layer * num_layers} arrays for {num_layers} layers, got {len(payload)}")
+    return [payload[i * per_layer:(i + 1) * per_layer] for i in range(num_layers)]
+
+
+def _check_layer(scheme: str, arrays: Sequence[np.ndarray], shape: Tuple[int, ...]):
+    size = math.prod(shape)
+    if scheme in ('none', 'fp16'):
+        if np.shape(arrays[0]) != tuple(shape):
+            raise ValueError(f"Expected layer shape {tuple(shape)}, got {np.shape(arrays[0])}")
+    elif scheme in _BITS:
+        params, codes = arrays
+        expected = size if scheme == 'q8' else (size + 1) // 2
+        if np.size(params) != 2 or codes.dtype != np.uint8 or codes.shape != (expected,):
+            raise ValueError(f"Malformed {scheme} layer for shape {tuple(shape)}")
+    else:
+        idx, values = arrays
+        if idx.ndim != 1 or idx.shape != values.shape or len(idx) > size or not np.issubdtype(idx.dtype, np.integer):
+            raise ValueError(f"Malformed topk layer for shape {tuple(shape)}")
+        if len(idx) and (idx.min() < 0 or idx.max() >= size):
+            raise ValueError("topk index out of range")
+
+
+def _dequantize(params: np.ndarray, codes: np.ndarray, scale: float = 1.0) -> np.ndarray:
+    # float32 arithmetic on a fresh buffer is several times faster than a float64 lookup table.
+    lo, step = params.astype(np.float32) * np.float32(scale)
+    values = codes.astype(np.float32)
+    values *= step
+    values += lo
+    return values
+
+
+def _add_layer(scheme: str, arrays: Sequence[np.ndarray], acc: np.ndarray, scale: float = 1.0):
+    flat = acc.reshape(-1)
+    if scheme in ('none', 'fp16'):
+        np.add(acc, arrays[0] if scale == 1.0 else scale * arrays[0], out=acc)
+    elif scheme == 'q8':
+        flat += _dequantize(arrays[0], arrays[1], scale)
+    elif scheme == 'q4':
+        packed = arrays[1]
+        flat[0::2] += _dequantize(arrays[0], packed & 0x0F, scale)
+        flat[1::2] += _dequantize(arrays[0], packed[:flat.size // 2] >> 4, scale)
+    else:
+        idx, values = arrays
+        # Unbuffered, so a payload that repeats an index adds every value rather than just the last.
+        np.add.at(flat, idx, values if scale == 1.0 else scale * values)
+
+
+def decompress_into(scheme: str, payload: Sequence[np.ndarray], accumulators: Sequence[np.ndarray],
+                    scale: float = 1.0):
+    """Validate a compressed delta against the accumulator shapes, then add `scale` times it in place."""
+    layers = split_layers(scheme, payload, len(accumulators))
+    for arrays, acc in zip(layers, accumulators):
+        _check_layer(scheme, arrays, acc.shape)
+    for arrays, acc in zip(layers, accumulators):
+        _add_layer(scheme, arrays, acc, scale)
+
+
+def decompress(scheme: str, payload: Sequence[np.ndarray], shapes: Sequence[Tuple[int, ...]]) -> ParameterVector:
+    """Dense float32 delta from a compressed payload."""
+    dense = ParameterVector.zeros(shapes, dtype=np.float64)
+    decompress_into(scheme, payload, dense)
+    return dense.astype(np.float32)
+
+
+def payload_nbytes(payload: Sequence[np.ndarray]) -> int:
+    return sum(np.asarray(a).nbytes for a in payload)
+
+
+def compression_report(delta: Sequence[np.ndarray], payload: Sequence[np.ndarray], scheme: str) -> Dict[str, float]:
+    """Compression ratio (dense float32 bytes / payload bytes) and relative L2 error of the decoded delta."""
+    delta = as_parameter_vector(delta)
+    decoded = decompress(scheme, payload, delta.shapes)
+    exact = delta.data.astype(np.float64)
+    err = float(np.linalg.norm(exact - decoded.data))
+    norm = float(np.linalg.norm(exact))
+    return {
+        'compression_ratio': delta.size * 4 / max(payload_nbytes(payload), 1),
+        'compression_error': err / norm if norm else 0.0,
+    }
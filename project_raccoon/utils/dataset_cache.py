@@ -0,0 +1,108 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+import numpy as np
+
+# Preprocessed float32 features, labels and split indices, keyed by the CSV's
+# content hash, the preprocessing version (with a hash of the preprocessing
+# code) and the split parameters. Entries are kept in an in-memory LRU and on
+# disk as .npy files that load memory-mapped.
+CACHE_DIR = os.environ.get('RACCOON_CACHE_DIR', 'cache')
+MEMORY_ENTRIES = int(os.environ.get('RACCOON_CACHE_ENTRIES', 8))
+_ARRAYS = ('X', 'y', 'train_idx', 'val_idx', 'test_idx')
+
+_memory: "OrderedDict[str, Dict[str, np.ndarray]]" = OrderedDict()
+_digests: Dict[Tuple[str, int, int], str] = {}
+_lock = threading.Lock()
+
+
+def file_digest(file_path: str) -> str:
+    """SHA-256 of the file, memoised on (path, size, mtime) so unchanged files are hashed once."""
+    st = os.stat(file_path)
+    stamp = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+    digest = _digests.get(stamp)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _digests[stamp] = digest
+    return digest
+
+
+def cache_key(file_path: str, dataset_name: str, version: str, *params) -> str:
+    h = hashlib.sha256(file_digest(file_path).encode())
+    h.update(repr((dataset_name, version) + params).encode())
+    return h.hexdigest()[:16]
+
+
+def _remember(key: str, entry: Dict[str, np.ndarray]):
+    with _lock:
+        _memory[key] = entry
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+
+def _load_from_disk(path: str) -> Dict[str, np.ndarray]:
+    return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in _ARRAYS}
+
+
+def cached_dir(name: str, key: str, build: Callable[[str], None]) -> str:
+    """Path of the cache directory `{name}-{key}`, filled by `build(tmp_dir)` on a miss.
+
+    The directory is built next to its final location and renamed into place,
+    and stale directories for other keys of the same `name` are removed.
+    """
+    path = os.path.join(CACHE_DIR, f'{name}-{key}')
+    if os.path.isdir(path):
+        return path
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f'.{name}-', dir=CACHE_DIR)
+    try:
+        build(tmp)
+        os.rename(tmp, path)
+    except OSError:
+        # Another process won the race; its copy is identical.
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+        return path
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    for other in os.listdir(CACHE_DIR):
+        if other.startswith(f'{name}-') and os.path.join(CACHE_DIR, other) != path:
+            shutil.rmtree(os.path.join(CACHE_DIR, other), ignore_errors=True)
+    return path
+
+
+def get_or_build(key: str, dataset_name: str, build: Callable[[], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Return the cached arrays for `key`, building and storing them on a miss."""
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None:
+            _memory.move_to_end(key)
+            return entry
+
+    built = {}
+
+    def write(tmp):
+        built.update(build())
+        for name in _ARRAYS:
+            np.save(os.path.join(tmp, f'{name}.npy'), built[name])
+
+    path = cached_dir(dataset_name, key, write)
+    entry = built or _load_from_disk(path)
+    _remember(key, entry)
+    return entry
+
+
+def clear_memory():
+    with _lock:
+        _memory.clear()
@@ -0,0 +1,216 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Optional
+
+# Process-wide timing spans and counters, grouped by training group.
+#   with span('client.fit'):           time a stage; nested spans inherit the
+#       ...                            enclosing span's group unless given one
+#   count('http.bytes_out', n, group)  add to a counter
+# Each span name keeps a count, total, min, max and a histogram of durations
+# in power-of-two microsecond buckets, from which stats() estimates
+# percentiles. Finished spans are also kept as Chrome trace events ("X"
+# phase, one row per thread) in a bounded buffer; trace() returns them in the
+# JSON format that Perfetto and chrome://tracing open. When disabled, span()
+# returns a shared no-op context manager and count() returns at once, so
+# instrumented code pays one function call and a flag check.
+# Worker processes hand their spans back with export() for the parent to
+# merge(). RACCOON_PROFILE=1 enables it at startup; RACCOON_TRACE_FILE names a
+# file the trace is written to when the process exits.
+
+BUCKETS = 32
+DEFAULT_GROUP = '-'
+
+_enabled = os.environ.get('RACCOON_PROFILE', '0') != '0'
+_lock = threading.Lock()
+_local = threading.local()
+_spans: Dict[str, Dict[str, dict]] = defaultdict(dict)
+_counters: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+_events = deque(maxlen=int(os.environ.get('RACCOON_TRACE_EVENTS', 100_000)))
+_origin_ns = time.perf_counter_ns()
+_pid = os.getpid()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = on
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _events.clear()
+
+
+def current_group() -> Optional[str]:
+    stack = getattr(_local, 'groups', None)
+    return stack[-1] if stack else None
+
+
+def record(name: str, group: Optional[str], start_ns: int, end_ns: int):
+    """Add one finished span; for stages timed without span(), e.g. across Flask request hooks."""
+    group = group or DEFAULT_GROUP
+    duration = end_ns - start_ns
+    bucket = min(BUCKETS - 1, (duration // 1000).bit_length())
+    with _lock:
+        entry = _spans[group].get(name)
+        if entry is None:
+            entry = _spans[group][name] = {'count': 0, 'total_ns': 0, 'min_ns': duration, 'max_ns': duration,
+                                           'buckets': [0] * BUCKETS}
+        entry['count'] += 1
+        entry['total_ns'] += duration
+        entry['min_ns'] = min(entry['min_ns'], duration)
+        entry['max_ns'] = max(entry['max_ns'], duration)
+        entry['buckets'][bucket] += 1
+        _events.append((name, group, start_ns, duration, _pid, threading.get_ident()))
+
+
+class _Span:
+    __slots__ = ('name', 'group', 'start')
+
+    def __init__(self, name: str, group: Optional[str]):
+        self.name = name
+        self.group = group
+
+    def __enter__(self):
+        stack = getattr(_local, 'groups', None)
+        if stack is None:
+            stack = _local.groups = []
+        if self.group is None and stack:
+            self.group = stack[-1]
+        stack.append(self.group)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        _local.groups.pop()
+        record(self.name, self.group, self.start, end)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, group: Optional[str] = None):
+    """Context manager timing the enclosed block as `name` under `group` (default: the enclosing span's)."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, group)
+
+
+def count(name: str, value: float = 1, group: Optional[str] = None):
+    if not _enabled:
+        return
+    group = group or current_group() or DEFAULT_GROUP
+    with _lock:
+        _counters[group][name] += value
+
+
+def _percentile(buckets, total: int, q: float) -> float:
+    """Upper edge, in ms, of the bucket holding the q-quantile."""
+    target = q * total
+    seen = 0
+    for i, n in enumerate(buckets):
+        seen += n
+        if seen >= target and n:
+            return (1 << i) / 1000
+    return (1 << (len(buckets) - 1)) / 1000
+
+
+def stats(group: Optional[str] = None) -> Dict:
+    """{'spans': {group: {name: summary}}, 'counters': {group: {name: value}}}, optionally for one group."""
+    with _lock:
+        spans = {g: {n: dict(e, buckets=list(e['buckets'])) for n, e in names.items()} for g, names in _spans.items()}
+        counters = {g: dict(values) for g, values in _counters.items()}
+    if group is not None:
+        spans = {group: spans.get(group, {})}
+        counters = {group: counters.get(group, {})}
+    summary = {}
+    for g, names in spans.items():
+        summary[g] = {}
+        for name, e in sorted(names.items(), key=lambda item: -item[1]['total_ns']):
+            summary[g][name] = {
+                'count': e['count'],
+                'total_ms': e['total_ns'] / 1e6,
+                'mean_ms': e['total_ns'] / e['count'] / 1e6,
+                'min_ms': e['min_ns'] / 1e6,
+                'max_ms': e['max_ns'] / 1e6,
+                'p50_ms': _percentile(e['buckets'], e['count'], 0.5),
+                'p90_ms': _percentile(e['buckets'], e['count'], 0.9),
+                'p99_ms': _percentile(e['buckets'], e['count'], 0.99),
+                # Bucket i holds spans shorter than 2^i microseconds.
+                'histogram_us': {str(1 << i): n for i, n in enumerate(e['buckets']) if n},
+            }
+    return {'enabled': _enabled, 'spans': summary, 'counters': counters}
+
+
+def trace() -> Dict:
+    """Buffered spans in Chrome trace-event JSON, timestamps in microseconds since the module loaded."""
+    with _lock:
+        events = list(_events)
+    return {'traceEvents': [
+        {'name': name, 'cat': group, 'ph': 'X', 'ts': (start - _origin_ns) / 1000, 'dur': duration / 1000,
+         'pid': pid, 'tid': tid, 'args': {'group': group}}
+        for name, group, start, duration, pid, tid in events
+    ], 'displayTimeUnit': 'ms'}
+
+
+def export() -> Dict:
+    """Raw spans, counters and trace events, for merge() in another process."""
+    with _lock:
+        return {'spans': {g: {n: dict(e, buckets=list(e['buckets'])) for n, e in names.items()}
+                          for g, names in _spans.items()},
+                'counters': {g: dict(values) for g, values in _counters.items()},
+                'events': list(_events)}
+
+
+def merge(exported: Dict):
+    """Add another process's export() to this one's."""
+    with _lock:
+        for g, names in exported['spans'].items():
+            for name, e in names.items():
+                mine = _spans[g].get(name)
+                if mine is None:
+                    _spans[g][name] = dict(e, buckets=list(e['buckets']))
+                    continue
+                mine['count'] += e['count']
+                mine['total_ns'] += e['total_ns']
+                mine['min_ns'] = min(mine['min_ns'], e['min_ns'])
+                mine['max_ns'] = max(mine['max_ns'], e['max_ns'])
+                mine['buckets'] = [a + b for a, b in zip(mine['buckets'], e['buckets'])]
+        for g, values in exported['counters'].items():
+            for name, value in values.items():
+                _counters[g][name] += value
+        # perf_counter is the system-wide monotonic clock, so timestamps line up across processes.
+        _events.extend(tuple(event) for event in exported['events'])
+
+
+def write_trace(path: str):
+    tmp = f'{path}.tmp-{os.getpid()}'
+    with open(tmp, 'w') as f:
+        json.dump(trace(), f)
+    os.replace(tmp, path)
+
+
+TRACE_FILE = os.environ.get('RACCOON_TRACE_FILE')
+if TRACE_FILE:
+    atexit.register(lambda: _events and write_trace(TRACE_FILE))
@@ -0,0 +1,95 @@
+import math
+from collections.abc import Sequence
+from typing import List, Sequence as SequenceType, Tuple
+import numpy as np
+
+# The common in-memory form of a model's weights and of client deltas: one
+# contiguous buffer plus the per-layer shapes. Aggregation, clipping and noise,
+# the flat wire format and the state backends all work on the buffer as a
+# whole; per-layer views exist for Keras and the per-layer codecs.
+
+Shape = Tuple[int, ...]
+
+
+def layer_views(buf: np.ndarray, shapes: SequenceType[Shape]) -> List[np.ndarray]:
+    """Per-layer views into the flat buffer `buf`; no data is copied."""
+    layers = []
+    offset = 0
+    for shape in shapes:
+        size = math.prod(shape)
+        layers.append(buf[offset:offset + size].reshape(shape))
+        offset += size
+    return layers
+
+
+class ParameterVector(Sequence):
+    """A whole model's parameters as one contiguous buffer plus the layer shapes.
+
+    It is also a read-only sequence of per-layer views, so it can be passed
+    anywhere a list of layer arrays is expected (Keras `set_weights`, the wire
+    format, per-layer loops), while whole-model arithmetic runs as a single
+    numpy call on `data`.
+    """
+    __slots__ = ('data', 'shapes', '_layers')
+
+    def __init__(self, data: np.ndarray, shapes: SequenceType[Shape]):
+        shapes = [tuple(int(d) for d in s) for s in shapes]
+        if data.ndim != 1 or data.size != sum(math.prod(s) for s in shapes):
+            raise ValueError("Buffer size does not match the layer shapes")
+        self.data = data
+        self.shapes = shapes
+        self._layers = None
+
+    @classmethod
+    def from_layers(cls, layers, dtype=np.float32) -> 'ParameterVector':
+        """Copy a list of layer arrays into one new contiguous buffer."""
+        if isinstance(layers, ParameterVector) and layers.data.dtype == dtype:
+            return layers.copy()
+        layers = [np.asarray(w) for w in layers]
+        data = np.concatenate([w.ravel() for w in layers], dtype=dtype) if layers else np.empty(0, dtype)
+        return cls(data, [w.shape for w in layers])
+
+    @classmethod
+    def zeros(cls, shapes: SequenceType[Shape], dtype=np.float32) -> 'ParameterVector':
+        return cls(np.zeros(sum(math.prod(s) for s in shapes), dtype=dtype), shapes)
+
+    def layers(self) -> List[np.ndarray]:
+        if self._layers is None:
+            self._layers = layer_views(self.data, self.shapes)
+        return self._layers
+
+    def __getitem__(self, i):
+        return self.layers()[i]
+
+    def __len__(self) -> int:
+        return len(self.shapes)
+
+    def __iter__(self):
+        return iter(self.layers())
+
+    @property
+    def size(self) -> int:
+        return self.data.size
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def copy(self) -> 'ParameterVector':
+        return ParameterVector(self.data.copy(), self.shapes)
+
+    def astype(self, dtype) -> 'ParameterVector':
+        return ParameterVector(self.data.astype(dtype), self.shapes)
+
+    def same_layout(self, other) -> bool:
+        return isinstance(other, ParameterVector) and other.shapes == self.shapes
+
+    def __repr__(self) -> str:
+        return f"ParameterVector({self.data.size} x {self.data.dtype}, {len(self.shapes)} layers)"
+
+
+def as_parameter_vector(weights, dtype=np.float32) -> ParameterVector:
+    """`weights` itself if it already is a ParameterVector of `dtype`, else a flattened copy."""
+    if isinstance(weights, ParameterVector) and weights.data.dtype == dtype:
+        return weights
+    return ParameterVector.from_layers(weights, dtype)
@@ -0,0 +1,140 @@
+import numpy as np
+from collections.abc import Mapping
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Strategies for splitting a training set among simulated clients. Each one
+# returns one index array per client into a single shared training matrix,
+# so no sample is copied until a client actually trains on it.
+
+
+def _split_by_owner(owner: np.ndarray, num_clients: int) -> List[np.ndarray]:
+    """Index arrays of the samples owned by each client, given every sample's owner."""
+    order = np.argsort(owner, kind='stable')
+    counts = np.bincount(owner, minlength=num_clients)
+    return np.split(order, np.cumsum(counts)[:-1])
+
+
+def _run_bounds(n: int, proportions: np.ndarray) -> np.ndarray:
+    """[start, end) bounds that cut `n` positions into consecutive runs sized by `proportions`."""
+    bounds = np.round(np.cumsum(proportions) * n).astype(np.int64)
+    bounds[-1] = n
+    return np.concatenate([[0], bounds])
+
+
+def iid(y: np.ndarray, num_clients: int, rng: np.random.Generator) -> List[np.ndarray]:
+    """Equal contiguous runs of the (already shuffled) training set; the last client takes the remainder."""
+    per_client = len(y) // num_clients
+    bounds = np.append(np.arange(num_clients) * per_client, len(y))
+    return [np.arange(bounds[k], bounds[k + 1]) for k in range(num_clients)]
+
+
+def dirichlet(y: np.ndarray, num_clients: int, rng: np.random.Generator, alpha: float = 0.5) -> List[np.ndarray]:
+    """Label skew: each class is spread over the clients in Dirichlet(alpha) proportions.
+
+    Small `alpha` gives each client only a few classes; large `alpha` tends to IID.
+    """
+    owner = np.empty(len(y), dtype=np.int64)
+    clients = np.arange(num_clients)
+    for label in np.unique(y):
+        idx = np.flatnonzero(y == label)
+        bounds = _run_bounds(len(idx), rng.dirichlet(np.full(num_clients, alpha)))
+        owner[idx] = np.repeat(clients, np.diff(bounds))
+    return _split_by_owner(owner, num_clients)
+
+
+def quantity_skew(y: np.ndarray, num_clients: int, rng: np.random.Generator, alpha: float = 1.0) -> List[np.ndarray]:
+    """Quantity skew: IID samples, but shard sizes follow Dirichlet(alpha) proportions."""
+    bounds = _run_bounds(len(y), rng.dirichlet(np.full(num_clients, alpha)))
+    return [np.arange(bounds[k], bounds[k + 1]) for k in range(num_clients)]
+
+
+def by_feature(y: np.ndarray, num_clients: int, rng: np.random.Generator,
+               groups: Optional[np.ndarray] = None) -> List[np.ndarray]:
+    """Feature skew: every client holds samples from a single value of `groups` (e.g. a region).
+
+    With fewer clients than groups, clients take whole groups, largest first,
+    round robin. Otherwise every group gets at least one client and the rest
+    are shared out in proportion to group size.
+    """
+    if groups is None or len(groups) != len(y):
+        raise ValueError("by_feature needs one group value per training sample")
+    _, inverse, sizes = np.unique(groups, return_inverse=True, return_counts=True)
+    num_groups = len(sizes)
+
+    if num_clients <= num_groups:
+        group_owner = np.empty(num_groups, dtype=np.int64)
+        group_owner[np.argsort(-sizes, kind='stable')] = np.arange(num_groups) % num_clients
+        return _split_by_owner(group_owner[inverse], num_clients)
+
+    # Largest-remainder allocation of the clients beyond one per group.
+    quota = sizes / sizes.sum() * (num_clients - num_groups)
+    alloc = 1 + np.floor(quota).astype(np.int64)
+    leftover = num_clients - alloc.sum()
+    alloc[np.argsort(np.floor(quota) - quota, kind='stable')[:leftover]] += 1
+    first_client = np.cumsum(alloc) - alloc
+
+    # Position of every sample within its group, then an even split of that group's clients.
+    order = np.argsort(inverse, kind='stable')
+    rank = np.empty(len(y), dtype=np.int64)
+    rank[order] = np.arange(len(y)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    owner = first_client[inverse] + rank * alloc[inverse] // sizes[inverse]
+    return _split_by_owner(owner, num_clients)
+
+
+PARTITIONERS: Dict[str, Callable[..., List[np.ndarray]]] = {
+    'iid': iid,
+    'dirichlet': dirichlet,
+    'quantity': quantity_skew,
+    'feature': by_feature,
+}
+
+
+def partition(strategy: str, y: np.ndarray, num_clients: int, random_state: int = 42, **kwargs) -> List[np.ndarray]:
+    """Index arrays for `num_clients` clients using a strategy from PARTITIONERS."""
+    if strategy not in PARTITIONERS:
+        raise ValueError(f"Unknown partitioner: {strategy}")
+    if num_clients < 1:
+        raise ValueError("num_clients must be at least 1")
+    return PARTITIONERS[strategy](y, num_clients, np.random.default_rng(random_state), **kwargs)
+
+
+def _as_run(idx: np.ndarray) -> Optional[slice]:
+    """The slice equal to `idx` if it is a run of consecutive indices, else None."""
+    if len(idx) == 0:
+        return slice(0, 0)
+    start = int(idx[0])
+    if int(idx[-1]) - start != len(idx) - 1 or not np.all(np.diff(idx) == 1):
+        return None
+    return slice(start, start + len(idx))
+
+
+class ClientShards(Mapping):
+    """Read-only `{client_id: (X, y)}` view over one shared training matrix.
+
+    Only the index arrays are stored; a client's rows are gathered when it is
+    looked up, so shards cost nothing until a client trains. Shards that are a
+    contiguous run of rows (iid, quantity) are returned as slices, which are
+    views, and stay memory-mapped over a streaming store; only scattered
+    shards (dirichlet, feature) are copied.
+    """
+    def __init__(self, X: np.ndarray, y: np.ndarray, shards: List[np.ndarray]):
+        self.X = X
+        self.y = y
+        self.shards = shards
+        self._runs = [_as_run(idx) for idx in shards]
+
+    def __getitem__(self, client_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        run = self._runs[client_id]
+        if run is not None:
+            return self.X[run], self.y[run]
+        idx = self.shards[client_id]
+        return self.X[idx], self.y[idx]
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    def __iter__(self):
+        return iter(range(len(self.shards)))
+
+    def sizes(self) -> np.ndarray:
+        return np.array([len(idx) for idx in self.shards])
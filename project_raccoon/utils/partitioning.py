@@ -1,8 +1,11 @@
 import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from typing import Tuple, Dict
-from utils.preprocessing import preprocess_dataset
+from typing import Tuple, Dict, List, Optional
+from utils.preprocessing import preprocess_dataset, get_spec, PREPROCESSING_VERSION
+from utils import dataset_cache, preprocessing, streaming
+from utils.partitioners import ClientShards, partition
+from utils.streaming import build_shard_store, load_shard_store
 
 def split_dataset(
     X: np.ndarray,
@@ -50,32 +53,130 @@ def partition_among_clients(
 
     return client_data
 
-def load_and_partition_dataset(
-    file_path: str,
-    dataset_name: str,
-    num_clients: int,
+def split_indices(
+    y: np.ndarray,
     train_size: float = 0.6,
     val_size: float = 0.2,
     test_size: float = 0.2,
     random_state: int = 42
-) -> Tuple[Dict[int, Tuple[np.ndarray, np.ndarray]], Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]]:
-    df = pd.read_csv(file_path)
-    X, y = preprocess_dataset(df, dataset_name)
-
-    X = X.values
-    y = y.values
-
-    (X_train, y_train), val_data, test_data = split_dataset(
-        X, y,
-        train_size=train_size,
-        val_size=val_size,
-        test_size=test_size,
-        random_state=random_state
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Row indices of the same stratified split `split_dataset` would produce."""
+    (train_idx, _), (val_idx, _), (test_idx, _) = split_dataset(
+        np.arange(len(y)), y,
+        train_size=train_size, val_size=val_size, test_size=test_size, random_state=random_state
     )
+    return train_idx, val_idx, test_idx
 
-    client_data = partition_among_clients(X_train, y_train, num_clients=num_clients, random_state=random_state)
+def preprocessing_version() -> str:
+    """PREPROCESSING_VERSION plus hashes of the code that builds cached datasets, so editing it rebuilds them."""
+    sources = (preprocessing.__file__, streaming.__file__, __file__)
+    return '-'.join([str(PREPROCESSING_VERSION)] + [dataset_cache.file_digest(p)[:12] for p in sources])
+
+def load_preprocessed(
+    file_path: str,
+    dataset_name: str,
+    train_size: float = 0.6,
+    val_size: float = 0.2,
+    test_size: float = 0.2,
+    random_state: int = 42,
+    use_cache: bool = True
+) -> Dict[str, np.ndarray]:
+    """Preprocessed float32 `X`, labels `y` and the train/val/test row indices, cached by CSV content."""
+    def build():
+        df = pd.read_csv(file_path)
+        X, y = preprocess_dataset(df, dataset_name)
+        X = X.values.astype(np.float32)
+        y = y.values
+        train_idx, val_idx, test_idx = split_indices(y, train_size, val_size, test_size, random_state)
+        return {'X': X, 'y': y, 'train_idx': train_idx, 'val_idx': val_idx, 'test_idx': test_idx}
+
+    if not use_cache:
+        return build()
+    key = dataset_cache.cache_key(file_path, dataset_name, preprocessing_version(),
+                                  train_size, val_size, test_size, random_state)
+    return dataset_cache.get_or_build(key, dataset_name, build)
+
+def feature_names(file_path: str, dataset_name: str) -> List[str]:
+    """Column names of the preprocessed feature matrix, read from the CSV header only."""
+    dropped, target, _ = get_spec(dataset_name)
+    columns = pd.read_csv(file_path, nrows=0).columns
+    return [col for col in columns if col not in dropped and col != target]
+
+# Keyword arguments each partitioner accepts through `partition_args`.
+PARTITION_ARGS = {'iid': (), 'dirichlet': ('alpha',), 'quantity': ('alpha',), 'feature': ('column',)}
+
+def check_partition_args(file_path: str, dataset_name: str, partitioner: str, partition_args) -> None:
+    """Raise ValueError unless `partition_args` suits `partitioner` on this dataset."""
+    if partitioner not in PARTITION_ARGS:
+        raise ValueError(f"Unknown partitioner: {partitioner}")
+    if partition_args is None:
+        partition_args = {}
+    if not isinstance(partition_args, dict):
+        raise ValueError("partition_args must be an object")
+    unknown = set(partition_args) - set(PARTITION_ARGS[partitioner])
+    if unknown:
+        raise ValueError(f"Unknown arguments for the {partitioner} partitioner: {', '.join(sorted(unknown))}")
+    alpha = partition_args.get('alpha', 1.0)
+    if not isinstance(alpha, (int, float)) or isinstance(alpha, bool) or not alpha > 0:
+        raise ValueError("alpha must be a positive number")
+    if partitioner == 'feature':
+        column = partition_args.get('column')
+        if column not in feature_names(file_path, dataset_name):
+            raise ValueError(f"Unknown feature column for {dataset_name}: {column}")
 
-    return client_data, val_data, test_data
+def load_and_partition_dataset(
+    file_path: str,
+    dataset_name: str,
+    num_clients: int,
+    train_size: float = 0.6,
+    val_size: float = 0.2,
+    test_size: float = 0.2,
+    random_state: int = 42,
+    use_cache: bool = True,
+    streaming: bool = False,
+    chunksize: int = 100_000,
+    partitioner: str = 'iid',
+    partition_args: Optional[dict] = None
+) -> Tuple[ClientShards, Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]]:
+    """Client shards, validation and test sets for a dataset.
+
+    The training set is shuffled once into a shared matrix and `partitioner`
+    (see utils/partitioners.py) assigns each client an index array into it;
+    the default 'iid' split is the one partition_among_clients makes. For the
+    'feature' partitioner, `partition_args={'column': 'region'}` names the
+    feature to group clients by.
+
+    With `streaming=True` the CSV is never loaded whole: it is converted in
+    chunks to an on-disk store (see utils/streaming.py) and the shared arrays
+    are read-only memory maps. The shards are the same either way.
+    """
+    if streaming:
+        key = dataset_cache.cache_key(file_path, dataset_name, preprocessing_version(),
+                                      train_size, val_size, test_size, random_state)
+        store = dataset_cache.cached_dir(f'{dataset_name}.stream', key, lambda out_dir: build_shard_store(
+            file_path, dataset_name, out_dir, split_indices,
+            train_size, val_size, test_size, random_state, chunksize))
+        (X_train, y_train), val_data, test_data = load_shard_store(store)
+    else:
+        data = load_preprocessed(file_path, dataset_name, train_size, val_size, test_size, random_state, use_cache)
+        X, y = data['X'], data['y']
+        # Same shuffle partition_among_clients applies to the training rows.
+        order = data['train_idx'].copy()
+        np.random.default_rng(seed=random_state).shuffle(order)
+        X_train, y_train = X[order], y[order]
+        val_data = (X[data['val_idx']], y[data['val_idx']])
+        test_data = (X[data['test_idx']], y[data['test_idx']])
+
+    kwargs = dict(partition_args or {})
+    if 'column' in kwargs:
+        column = kwargs.pop('column')
+        names = feature_names(file_path, dataset_name)
+        if column not in names:
+            raise ValueError(f"Unknown feature column for {dataset_name}: {column}")
+        kwargs['groups'] = X_train[:, names.index(column)]
+    shards = partition(partitioner, y_train, num_clients, random_state, **kwargs)
+
+    return ClientShards(X_train, y_train, shards), val_data, test_data
 
 if __name__ == "__main__":
     client_data, val_data, test_data = load_and_partition_dataset(
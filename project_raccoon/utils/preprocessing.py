@@ -1,125 +1,131 @@
 import pandas as pd
-from sklearn.preprocessing import LabelEncoder
-from typing import Tuple, Dict
-import re
+from typing import Tuple
 import numpy as np
 
-def preprocess_dataset(df: pd.DataFrame, dataset_name: str) -> Tuple[pd.DataFrame, Dict[str, LabelEncoder]]:
-    if dataset_name == 'income':
-        return preprocess_income(df)
-    elif dataset_name == 'credit':
-        return preprocess_score(df)
-    elif dataset_name == 'lsd':
-        return preprocess_lumpy(df)
-    elif dataset_name == 'smoking':
-        return preprocess_smoking(df)
-    else:
+# Cached datasets are keyed by this and a hash of this module's source (see
+# utils/partitioning.py), so editing a transform or DATASETS rebuilds them.
+# Bump it when their output changes for any other reason, e.g. a pandas upgrade.
+PREPROCESSING_VERSION = 1
+
+def _codes(col: pd.Series, fill=None) -> np.ndarray:
+    """Integer codes in sorted category order, i.e. LabelEncoder.fit_transform.
+
+    Missing values take the column's mode, or `fill` when given.
+    """
+    if fill is not None:
+        return pd.factorize(col.fillna(fill), sort=True)[0]
+    codes, _ = pd.factorize(col, sort=True)
+    missing = codes < 0
+    if missing.any():
+        # Categories are sorted, so argmax's first-max tie-break matches Series.mode()[0].
+        codes[missing] = np.bincount(codes[~missing]).argmax()
+    return codes
+
+def _fill_mode(col: pd.Series) -> pd.Series:
+    return col.fillna(col.mode()[0]) if col.hasnans else col
+
+def _fill_stat(col: pd.Series, stat) -> pd.Series:
+    if not col.hasnans:
+        return col
+    values = col.to_numpy(dtype=np.float64, copy=True)
+    missing = np.isnan(values)
+    values[missing] = stat(values)
+    return pd.Series(values, index=col.index, name=col.name)
+
+def _by_unique(col: pd.Series, convert) -> pd.Series:
+    """Apply an element-wise `convert` to each distinct value once and broadcast back."""
+    codes, uniques = pd.factorize(col)
+    if 2 * len(uniques) > len(col):
+        return pd.Series(np.asarray(convert(col), dtype=np.float64), index=col.index, name=col.name)
+    if len(uniques) == 0:
+        return pd.Series(np.nan, index=col.index, name=col.name)
+    values = np.asarray(convert(pd.Series(uniques, dtype=object)), dtype=np.float64)
+    return pd.Series(np.where(codes >= 0, values[codes], np.nan), index=col.index, name=col.name)
+
+def _income_column(col: str, s: pd.Series):
+    return _codes(s) if s.dtype == object else s
+
+_HISTORY_AGE = r'^(\d+)\s+Years?\s+and\s+(\d+)\s+Months?'
+_NON_NEGATIVE = {'Age', 'Num_of_Loan', 'Num_of_Delayed_Payment'}
+_MONEY = {'Annual_Income', 'Outstanding_Debt', 'Changed_Credit_Limit',
+          'Amount_invested_monthly', 'Monthly_Balance'}
+
+def _history_months(s: pd.Series) -> np.ndarray:
+    parts = s.str.extract(_HISTORY_AGE).astype(np.float64)
+    return (parts[0] * 12 + parts[1]).to_numpy()
+
+def _score_column(col: str, s: pd.Series):
+    if col in _NON_NEGATIVE or col in _MONEY:
+        s = _by_unique(s, lambda u: pd.to_numeric(u, errors='coerce'))
+        if col in _NON_NEGATIVE:
+            s = s.mask(s < 0, np.nan)
+    elif col == 'Credit_History_Age':
+        s = _by_unique(s, _history_months)
+
+    if np.issubdtype(s.dtype, np.number):
+        return _fill_stat(s, np.nanmean)
+    if s.dtype == object:
+        return _codes(s, fill='Unknown')
+    return s
+
+def _lumpy_column(col: str, s: pd.Series):
+    if col in ('region', 'country'):
+        return _codes(s)
+    if col == 'dominant_land_cover':
+        s = _fill_mode(s)
+    if s.dtype in (np.float64, np.int64):
+        return _fill_stat(s, np.nanmedian)
+    return s
+
+_YES_NO = {'Y': 1, 'N': 0}
+
+def _smoking_column(col: str, s: pd.Series):
+    if col == 'gender':
+        return _fill_mode(s).map({'F': 0, 'M': 1})
+    if col in ('oral', 'tartar'):
+        return _fill_mode(s).map(_YES_NO)
+    if col == 'smoking' and s.dtype == object:
+        return _codes(s)
+    if s.dtype in (np.float64, np.int64):
+        return _fill_stat(s, np.nanmedian)
+    return s
+
+# Every output column depends only on its own input column and that column's
+# statistics, so datasets can be processed one column at a time (see utils/streaming.py).
+# name -> (dropped columns, target column, per-column transform)
+DATASETS = {
+    'income': ([], 'income_>50K', _income_column),
+    'credit': (['ID', 'Customer_ID', 'SSN', 'Name'], 'Credit_Score', _score_column),
+    'lsd': (['reportingDate', 'x', 'y'], 'lumpy', _lumpy_column),
+    'smoking': (['ID'], 'smoking', _smoking_column),
+}
+
+def get_spec(dataset_name: str):
+    if dataset_name not in DATASETS:
         raise ValueError(f"Unknown dataset name: {dataset_name}")
+    return DATASETS[dataset_name]
 
-def preprocess_income(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, LabelEncoder]]:
-    df = df.copy()
-    categorical_cols = df.select_dtypes(include='object').columns
-    for col in categorical_cols:
-        df[col].fillna(df[col].mode()[0], inplace=True)
+def preprocess_dataset(df: pd.DataFrame, dataset_name: str) -> Tuple[pd.DataFrame, pd.Series]:
+    dropped, target, transform = get_spec(dataset_name)
+    df = df.drop(columns=dropped)
+    df = pd.DataFrame({col: transform(col, df[col]) for col in df.columns}, index=df.index)
 
-    for col in categorical_cols:
-        le = LabelEncoder()
-        df[col] = le.fit_transform(df[col])
-    
-    x=df.drop(columns=['income_>50K'])
-    y=df['income_>50K']
+    X = df.drop(columns=[target])
+    y = df[target]
 
-    return x,y
-
-def preprocess_score(df):
-    df = df.copy()
-    df.drop(['ID', 'Customer_ID', 'SSN', 'Name'], axis=1, inplace=True)
-
-    for col in ['Age', 'Num_of_Loan', 'Num_of_Delayed_Payment']:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-        df[col] = df[col].mask(df[col] < 0, np.nan)
-
-    money_cols = ['Annual_Income', 'Outstanding_Debt', 'Changed_Credit_Limit', 
-                  'Amount_invested_monthly', 'Monthly_Balance']
-    for col in money_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-
-    def convert_history_age(s):
-        if pd.isna(s):
-            return np.nan
-        match = re.match(r'(\d+)\s+Years?\s+and\s+(\d+)\s+Months?', s)
-        if match:
-            return int(match.group(1)) * 12 + int(match.group(2))
-        return np.nan
-    df['Credit_History_Age'] = df['Credit_History_Age'].apply(convert_history_age)
-
-
-    for col in df.select_dtypes(include=[np.number]).columns:
-        df[col].fillna(df[col].mean(), inplace=True)
-
-    for col in df.select_dtypes(include='object').columns:
-        le = LabelEncoder()
-        df[col] = df[col].fillna('Unknown')
-        df[col] = le.fit_transform(df[col])
-    
-    x=df.drop(columns=['Credit_Score'])
-    y=df['Credit_Score']
+    return X, y
 
-    return x,y
+def preprocess_income(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
+    return preprocess_dataset(df, 'income')
 
+def preprocess_score(df):
+    return preprocess_dataset(df, 'credit')
 
 def preprocess_lumpy(df):
-    df = df.drop(columns=['reportingDate'])
-    df = df.drop(columns=['x', 'y'])
-
-    for col in ['region', 'country', 'dominant_land_cover']:
-        if df[col].isnull().any():
-            df[col].fillna(df[col].mode()[0], inplace=True)
-    
-    numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns.tolist()
-    for col in numeric_cols:
-        if df[col].isnull().any():
-            df[col].fillna(df[col].median(), inplace=True)
-    
-    le_region = LabelEncoder()
-    df['region'] = le_region.fit_transform(df['region'])
-    
-    le_country = LabelEncoder()
-    df['country'] = le_country.fit_transform(df['country'])
-    
-    X = df.drop(columns=['lumpy'])
-    y = df['lumpy']
-    
-    return X, y
-
+    return preprocess_dataset(df, 'lsd')
 
 def preprocess_smoking(df):
-    df = df.drop(columns=['ID'])
-
-    for col in ['gender', 'oral', 'tartar']:
-        if df[col].isnull().any():
-            df[col].fillna(df[col].mode()[0], inplace=True)
-    
-    numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns.tolist()
-    for col in numeric_cols:
-        if df[col].isnull().any():
-            df[col].fillna(df[col].median(), inplace=True)
-    
-    gender_map = {'F': 0, 'M': 1}
-    df['gender'] = df['gender'].map(gender_map)
-    
-    yes_no_map = {'Y': 1, 'N': 0}
-    df['oral'] = df['oral'].map(yes_no_map)
-    df['tartar'] = df['tartar'].map(yes_no_map)
-    
-    if df['smoking'].dtype == 'object':
-        le = LabelEncoder()
-        df['smoking'] = le.fit_transform(df['smoking'])
-
-    X = df.drop(columns=['smoking'])
-    y = df['smoking']
-    
-    return X, y
+    return preprocess_dataset(df, 'smoking')
 
 if __name__ == "__main__":
     datasets = {
@@ -0,0 +1,147 @@
+import math
+import threading
+from collections import defaultdict
+from typing import Dict, Optional
+import numpy as np
+
+# Differential privacy for client updates, on the flat float32 buffer of a
+# ParameterVector (utils/parameters.py). Everything here works in place:
+# clipping and noise never allocate beyond a reusable scratch buffer.
+# Privacy loss is accounted with zero-concentrated DP (Bun & Steinke 2016):
+# a Gaussian mechanism with L2 sensitivity C and noise sigma costs
+# rho = C^2 / (2 sigma^2), rho adds up over rounds, and converts to
+# (epsilon, delta) as epsilon = rho + 2 sqrt(rho ln(1/delta)).
+
+
+def clip_(vec: np.ndarray, clip_norm: float) -> float:
+    """Scale `vec` in place so its L2 norm is at most `clip_norm`; returns the norm before clipping."""
+    norm = math.sqrt(float(np.dot(vec, vec)))
+    if norm > clip_norm:
+        np.multiply(vec, clip_norm / norm, out=vec)
+    return norm
+
+
+def add_gaussian_noise_(vec: np.ndarray, std: float, rng: np.random.Generator,
+                        scratch: Optional[np.ndarray] = None) -> np.ndarray:
+    """Add N(0, std^2) noise to float32 `vec` in place, drawing into `scratch` (reused if given)."""
+    if scratch is None or scratch.shape != vec.shape:
+        scratch = np.empty_like(vec)
+    rng.standard_normal(out=scratch, dtype=np.float32)
+    np.multiply(scratch, std, out=scratch)
+    np.add(vec, scratch, out=vec)
+    return scratch
+
+
+def _phi(x: float) -> float:
+    return 0.5 * math.erfc(-x / math.sqrt(2.0))
+
+
+def gaussian_sigma(epsilon: float, delta: float, sensitivity: float = 1.0) -> float:
+    """Smallest noise std for which the Gaussian mechanism is (epsilon, delta)-DP.
+
+    Uses the analytic calibration of Balle & Wang (2018), which holds for any
+    epsilon > 0 and is tighter than the classic sqrt(2 ln(1.25/delta)) / epsilon.
+    """
+    if epsilon <= 0 or not 0 < delta < 1:
+        raise ValueError("Need epsilon > 0 and 0 < delta < 1")
+
+    def achieved_delta(sigma):
+        a = sensitivity / (2 * sigma)
+        b = epsilon * sigma / sensitivity
+        return _phi(a - b) - math.exp(epsilon) * _phi(-a - b)
+
+    lo, hi = 1e-6 * sensitivity, sensitivity
+    while achieved_delta(hi) > delta:
+        lo, hi = hi, hi * 2
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        if achieved_delta(mid) > delta:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+
+class GaussianMechanism:
+    """Clip a flat update to `clip_norm`, then add Gaussian noise, in place.
+
+    Give either `noise_multiplier` (sigma = noise_multiplier * clip_norm) or a
+    per-round target `epsilon` (with `delta`) to calibrate sigma from.
+    """
+    def __init__(self, clip_norm: float = 1.0, noise_multiplier: Optional[float] = None,
+                 epsilon: Optional[float] = None, delta: float = 1e-5):
+        if (noise_multiplier is None) == (epsilon is None):
+            raise ValueError("Give exactly one of noise_multiplier or epsilon")
+        self.clip_norm = float(clip_norm)
+        self.delta = delta
+        if noise_multiplier is not None:
+            self.sigma = float(noise_multiplier) * self.clip_norm
+        else:
+            self.sigma = gaussian_sigma(epsilon, delta, self.clip_norm)
+
+    @property
+    def rho(self) -> float:
+        """zCDP cost of one application."""
+        return self.clip_norm ** 2 / (2 * self.sigma ** 2)
+
+    def apply_(self, vec: np.ndarray, rng: np.random.Generator,
+               scratch: Optional[np.ndarray] = None) -> np.ndarray:
+        """Privatize `vec` in place; returns the scratch buffer for reuse."""
+        clip_(vec, self.clip_norm)
+        return add_gaussian_noise_(vec, self.sigma, rng, scratch)
+
+    def to_dict(self) -> dict:
+        return {'clip_norm': self.clip_norm, 'sigma': self.sigma, 'delta': self.delta}
+
+
+def epsilon_from_rho(rho: float, delta: float) -> float:
+    return rho + 2 * math.sqrt(rho * math.log(1 / delta)) if rho > 0 else 0.0
+
+
+class PrivacyAccountant:
+    """Cumulative privacy loss per client across rounds.
+
+    Simulations spend budget while the server reads it (/privacy, checkpoints),
+    so every access goes through the accountant's own lock.
+    """
+    def __init__(self, delta: float = 1e-5):
+        self.delta = delta
+        self.rho: Dict[object, float] = defaultdict(float)
+        self.rounds: Dict[object, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def spend(self, client_id, rho: float):
+        with self._lock:
+            self.rho[client_id] += rho
+            self.rounds[client_id] += 1
+
+    def epsilon(self, client_id) -> float:
+        with self._lock:
+            rho = self.rho.get(client_id, 0.0)
+        return epsilon_from_rho(rho, self.delta)
+
+    def summary(self) -> dict:
+        with self._lock:
+            worst = max(self.rho.values(), default=0.0)
+            clients = len(self.rho)
+            max_rounds = max(self.rounds.values(), default=0)
+        return {
+            'delta': self.delta,
+            'clients': clients,
+            'max_rounds': max_rounds,
+            'max_epsilon': epsilon_from_rho(worst, self.delta),
+        }
+
+    def to_dict(self) -> dict:
+        """JSON-ready copy of the budget spent so far, for checkpoints."""
+        with self._lock:
+            return {'delta': self.delta,
+                    'clients': [[cid, rho, self.rounds[cid]] for cid, rho in self.rho.items()]}
+
+    @classmethod
+    def from_dict(cls, saved: dict) -> 'PrivacyAccountant':
+        accountant = cls(saved['delta'])
+        for cid, rho, rounds in saved['clients']:
+            accountant.rho[cid] = rho
+            accountant.rounds[cid] = rounds
+        return accountant
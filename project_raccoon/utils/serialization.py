@@ -0,0 +1,134 @@
+import math
+import struct
+import numpy as np
+from typing import List, Sequence, Union
+from utils.parameters import ParameterVector
+
+# Binary weight format:
+#   header  = magic(4s) version(B) pad(3x) num_layers(I)
+#   layer_i = dtype_code(B) ndim(B) shape(ndim * I)
+#   pad header to 8 bytes, then each layer's raw little-endian buffer, 8-byte aligned.
+# Flat format (version 2), used for a ParameterVector:
+#   header, then dtype_code(B) once, then per layer ndim(B) shape(ndim * I),
+#   pad to 8 bytes, then the whole parameter buffer as one block, which
+#   decodes back into a ParameterVector over `buf` without copying.
+CONTENT_TYPE = 'application/octet-stream'
+MAGIC = b'RCWT'
+VERSION = 1
+FLAT_VERSION = 2
+_ALIGN = 8
+_HEADER = struct.Struct('<4sBxxxI')
+_LAYER = struct.Struct('<BB')
+
+_DTYPES = {
+    0: np.dtype('<f4'),
+    1: np.dtype('<f2'),
+    2: np.dtype('<f8'),
+    3: np.dtype('<i1'),
+    4: np.dtype('<u1'),
+    5: np.dtype('<i4'),
+    6: np.dtype('<i8'),
+}
+_DTYPE_CODES = {dt: code for code, dt in _DTYPES.items()}
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def _padding(n: int) -> int:
+    return -n % _ALIGN
+
+
+def _dtype_code(dt: np.dtype) -> int:
+    if dt not in _DTYPE_CODES:
+        raise ValueError(f"Unsupported dtype for wire format: {dt}")
+    return _DTYPE_CODES[dt]
+
+
+def _encode_flat(vec: ParameterVector, dtype) -> bytes:
+    target = np.dtype(dtype if dtype is not None else vec.data.dtype).newbyteorder('<')
+    data = np.ascontiguousarray(vec.data, dtype=target)
+    header = [_HEADER.pack(MAGIC, FLAT_VERSION, len(vec.shapes)), struct.pack('<B', _dtype_code(data.dtype))]
+    for shape in vec.shapes:
+        header.append(struct.pack(f'<B{len(shape)}I', len(shape), *shape))
+    size = sum(len(h) for h in header)
+    header.append(b'\0' * _padding(size))
+    return b''.join(header + [memoryview(data).cast('B')])
+
+
+def encode_weights(weights: Sequence[np.ndarray], dtype=np.float32) -> bytes:
+    """Pack a list of arrays, or a ParameterVector, into the binary wire format.
+
+    Every layer is cast to little-endian `dtype` (float32 by default); pass
+    `dtype=None` to keep each array's own dtype.
+    """
+    if isinstance(weights, ParameterVector):
+        return _encode_flat(weights, dtype)
+    arrays = []
+    for w in weights:
+        target = np.dtype(dtype if dtype is not None else np.asarray(w).dtype).newbyteorder('<')
+        arrays.append(np.ascontiguousarray(w, dtype=target))
+
+    header = [_HEADER.pack(MAGIC, VERSION, len(arrays))]
+    for a in arrays:
+        header.append(_LAYER.pack(_dtype_code(a.dtype), a.ndim))
+        header.append(struct.pack(f'<{a.ndim}I', *a.shape))
+    size = sum(len(h) for h in header)
+    header.append(b'\0' * _padding(size))
+
+    chunks = header
+    for a in arrays:
+        chunks.append(memoryview(a).cast('B'))
+        chunks.append(b'\0' * _padding(a.nbytes))
+    return b''.join(chunks)
+
+
+def _decode_flat(buf: memoryview, num_layers: int) -> ParameterVector:
+    offset = _HEADER.size
+    code = buf[offset]
+    offset += 1
+    if code not in _DTYPES:
+        raise ValueError(f"Unknown dtype code in weight payload: {code}")
+    shapes = []
+    for _ in range(num_layers):
+        ndim = buf[offset]
+        shapes.append(struct.unpack_from(f'<{ndim}I', buf, offset + 1))
+        offset += 1 + 4 * ndim
+    offset += _padding(offset)
+    count = sum(math.prod(shape) for shape in shapes)
+    return ParameterVector(np.frombuffer(buf, dtype=_DTYPES[code], count=count, offset=offset), shapes)
+
+
+def decode_weights(buf: Buffer) -> Union[List[np.ndarray], ParameterVector]:
+    """Unpack the binary wire format into read-only array views over `buf`.
+
+    Flat payloads come back as a ParameterVector, layered ones as a list.
+    """
+    buf = memoryview(buf)
+    magic, version, num_layers = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a weight payload")
+    if version == FLAT_VERSION:
+        return _decode_flat(buf, num_layers)
+    if version != VERSION:
+        raise ValueError(f"Unsupported weight payload version: {version}")
+
+    offset = _HEADER.size
+    specs = []
+    for _ in range(num_layers):
+        code, ndim = _LAYER.unpack_from(buf, offset)
+        offset += _LAYER.size
+        shape = struct.unpack_from(f'<{ndim}I', buf, offset)
+        offset += 4 * ndim
+        if code not in _DTYPES:
+            raise ValueError(f"Unknown dtype code in weight payload: {code}")
+        specs.append((_DTYPES[code], shape))
+    offset += _padding(offset)
+
+    weights = []
+    for dt, shape in specs:
+        count = math.prod(shape)
+        arr = np.frombuffer(buf, dtype=dt, count=count, offset=offset).reshape(shape)
+        weights.append(arr)
+        offset += arr.nbytes + _padding(arr.nbytes)
+    return weights
+
@@ -0,0 +1,124 @@
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from utils.preprocessing import get_spec
+
+# Out-of-core pipeline for CSVs larger than RAM. Peak memory is a few
+# single-column arrays, never the whole table:
+#   1. stream the CSV in chunks into a column store (float64 for numeric
+#      columns, int32 dictionary codes for text columns);
+#   2. split and shard on index arrays only;
+#   3. preprocess one column at a time and scatter it into a float32 matrix
+#      whose rows are ordered [shuffled train | val | test], so the training
+#      set that client shards index into is one memory-mapped block.
+
+
+def _column_kinds(csv_path: str, chunksize: int) -> Dict[str, str]:
+    """'text' for columns pandas infers as object in any chunk, else 'numeric'."""
+    kinds = {}
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        for col in chunk.columns:
+            if not np.issubdtype(chunk[col].dtype, np.number):
+                kinds[col] = 'text'
+            else:
+                kinds.setdefault(col, 'numeric')
+    return kinds
+
+
+def build_column_store(csv_path: str, store_dir: str, chunksize: int = 100_000) -> dict:
+    """Convert a CSV into one raw binary file per column, reading `chunksize` rows at a time."""
+    kinds = _column_kinds(csv_path, chunksize)
+    columns = list(kinds)
+    dtypes = {col: object if kinds[col] == 'text' else np.float64 for col in columns}
+    lookups: List[Dict[str, int]] = [{} for _ in columns]
+    files = [open(os.path.join(store_dir, f'{i}.bin'), 'wb') for i in range(len(columns))]
+    rows = 0
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype=dtypes):
+            for i, col in enumerate(columns):
+                s = chunk[col]
+                if kinds[col] == 'numeric':
+                    files[i].write(s.to_numpy(dtype='<f8').tobytes())
+                    continue
+                local, uniques = pd.factorize(s)
+                lookup = lookups[i]
+                remap = np.array([lookup.setdefault(u, len(lookup)) for u in uniques] + [-1], dtype='<i4')
+                files[i].write(remap[local].tobytes())
+            rows += len(chunk)
+    finally:
+        for f in files:
+            f.close()
+
+    for i, col in enumerate(columns):
+        if kinds[col] == 'text':
+            with open(os.path.join(store_dir, f'{i}.json'), 'w') as f:
+                json.dump(list(lookups[i]), f)
+    meta = {'rows': rows, 'columns': [{'name': col, 'kind': kinds[col]} for col in columns]}
+    with open(os.path.join(store_dir, 'columns.json'), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def read_column(store_dir: str, meta: dict, i: int) -> pd.Series:
+    """Rebuild column `i` as the Series a full pd.read_csv would have produced."""
+    column = meta['columns'][i]
+    path = os.path.join(store_dir, f'{i}.bin')
+    if column['kind'] == 'numeric':
+        return pd.Series(np.fromfile(path, dtype='<f8'), name=column['name'])
+    codes = np.fromfile(path, dtype='<i4')
+    with open(os.path.join(store_dir, f'{i}.json')) as f:
+        uniques = np.array(json.load(f) + [np.nan], dtype=object)
+    return pd.Series(uniques[codes], name=column['name'])
+
+
+def _row_order(y: np.ndarray, split_indices, train_size, val_size, test_size, random_state):
+    """Row indices in shard order and the [start, end) bounds of train, val and test."""
+    train_idx, val_idx, test_idx = split_indices(y, train_size, val_size, test_size, random_state)
+    # Same shuffle partition_among_clients applies, done on indices instead of rows.
+    perm = np.arange(len(train_idx))
+    np.random.default_rng(seed=random_state).shuffle(perm)
+    order = np.concatenate([train_idx[perm], val_idx, test_idx])
+    bounds = np.cumsum([0, len(train_idx), len(val_idx), len(test_idx)])
+    return order, bounds
+
+
+def build_shard_store(csv_path: str, dataset_name: str, out_dir: str, split_indices,
+                      train_size: float, val_size: float, test_size: float, random_state: int,
+                      chunksize: int = 100_000):
+    """Write X.npy, y.npy and bounds.npy for `dataset_name` into `out_dir`, one column in memory at a time."""
+    dropped, target, transform = get_spec(dataset_name)
+    raw_dir = tempfile.mkdtemp(prefix='.columns-', dir=out_dir)
+    try:
+        meta = build_column_store(csv_path, raw_dir, chunksize)
+        names = [c['name'] for c in meta['columns']]
+        features = [i for i, name in enumerate(names) if name not in dropped and name != target]
+
+        y = np.asarray(transform(target, read_column(raw_dir, meta, names.index(target))))
+        if y.dtype.kind == 'f':
+            y = y.astype(np.int64)
+        order, bounds = _row_order(y, split_indices, train_size, val_size, test_size, random_state)
+        np.save(os.path.join(out_dir, 'y.npy'), y[order])
+        np.save(os.path.join(out_dir, 'bounds.npy'), bounds)
+
+        X = np.lib.format.open_memmap(os.path.join(out_dir, 'X.npy'), mode='w+', dtype=np.float32,
+                                      shape=(meta['rows'], len(features)))
+        for j, i in enumerate(features):
+            values = np.asarray(transform(names[i], read_column(raw_dir, meta, i)), dtype=np.float32)
+            X[:, j] = values[order]
+        X.flush()
+        del X
+    finally:
+        shutil.rmtree(raw_dir, ignore_errors=True)
+
+
+def load_shard_store(store_dir: str) -> Tuple[Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]]:
+    """Memory-mapped (shuffled train, val, test) sets from a store written by build_shard_store."""
+    X = np.load(os.path.join(store_dir, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(store_dir, 'y.npy'), mmap_mode='r')
+    train_end, val_end, test_end = np.load(os.path.join(store_dir, 'bounds.npy'))[1:]
+    return ((X[:train_end], y[:train_end]), (X[train_end:val_end], y[train_end:val_end]),
+            (X[val_end:test_end], y[val_end:test_end]))